@@ -1,19 +1,47 @@
+from __future__ import annotations  # annotations may name classes from modules imported on first use
+import time
+STARTED_AT = time.monotonic()  # for the start-to-first-update time
 import os
+import sys
+import json
+import argparse
+import atexit
+import subprocess
+import asyncio
+import bisect
+import contextvars
 from dotenv import load_dotenv
-from telegram import Update, ParseMode, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Updater, CommandHandler, MessageHandler, Filters, CallbackContext, CallbackQueryHandler
-from sqlalchemy import create_engine, Column, Integer, String, Float, ForeignKey, DateTime
+from telegram import Bot, Update, ParseMode, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest, ChatMigrated, RetryAfter, Unauthorized
+from telegram.ext import Updater, Dispatcher, CommandHandler, MessageHandler, Filters, CallbackContext, CallbackQueryHandler
+from sqlalchemy import create_engine, inspect, Column, Integer, BigInteger, String, ForeignKey, DateTime
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
-from web3 import Web3
+from sqlalchemy import select, text, case, event, func, and_, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import sessionmaker, relationship, selectinload, scoped_session
 from decimal import Decimal, InvalidOperation
+import functools
+import heapq
 import logging
+import queue
+import random
 import re
 import requests
-from cryptography.fernet import Fernet
-from eth_account import Account
-import openai
+import redis
+import threading
 from datetime import datetime, timedelta
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from typing import TYPE_CHECKING
+
+# Only needed by the async and webhook modes, and imported there when they start
+if TYPE_CHECKING:
+    import aiohttp
+    from aiohttp import web
+    from sqlalchemy.ext.asyncio import AsyncSession
 
 # Load environment variables
 load_dotenv()
@@ -27,12 +55,117 @@ DATABASE_URL = os.getenv('DATABASE_URL')
 REDIS_HOST = os.getenv('REDIS_HOST')
 REDIS_PORT = int(os.getenv('REDIS_PORT'))
 BLOCKCHAIN_RPC_URL = os.getenv('BLOCKCHAIN_RPC_URL')
+# Comma-separated endpoints to route between; BLOCKCHAIN_RPC_URL alone when unset
+BLOCKCHAIN_RPC_URLS = [url.strip() for url in (os.getenv('BLOCKCHAIN_RPC_URLS') or BLOCKCHAIN_RPC_URL or '').split(',') if url.strip()]
 TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
 CHART_BASE_URL = os.getenv('CHART_BASE_URL', 'https://uwu.pro')
+PRICE_API_URL = os.getenv('PRICE_API_URL', 'https://api.example.com/moji_price')
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL', 'https://api.telegram.org')
 ENCRYPTION_KEY = os.getenv('ENCRYPTION_KEY')
 TOGETHER_AI_API_KEY = os.getenv('TOGETHER_AI_API_KEY')
 MOJI_CONTRACT_ADDRESS = os.getenv('MOJI_CONTRACT_ADDRESS')
 MOJI_CONTRACT_ABI = json.loads(os.getenv('MOJI_CONTRACT_ABI'))
+TOKEN_DECIMALS = 6  # MOJI amounts are stored and sent as integer base units
+DRIP_BROADCAST_WINDOW = int(os.getenv('DRIP_BROADCAST_WINDOW', '16'))
+DRIP_CLAIM_TIMEOUT = float(os.getenv('DRIP_CLAIM_TIMEOUT', '600'))  # seconds before a running drip counts as abandoned
+NONCE_CACHE_TTL = int(os.getenv('NONCE_CACHE_TTL', '3600'))
+PRICE_REFRESH_INTERVAL = float(os.getenv('PRICE_REFRESH_INTERVAL', '15'))
+PRICE_CACHE_TTL = float(os.getenv('PRICE_CACHE_TTL', '60'))
+BALANCE_CACHE_TTL = float(os.getenv('BALANCE_CACHE_TTL', '300'))
+BALANCE_EVENT_POLL_INTERVAL = float(os.getenv('BALANCE_EVENT_POLL_INTERVAL', '5'))
+BALANCE_BATCH_SIZE = int(os.getenv('BALANCE_BATCH_SIZE', '100'))
+BALANCE_EVENT_BATCH_BLOCKS = int(os.getenv('BALANCE_EVENT_BATCH_BLOCKS', '500'))  # blocks per eth_getLogs call
+MOJI_PAIR_ADDRESS = os.getenv('MOJI_PAIR_ADDRESS')  # DEX pair whose swaps are reported as buys
+MOJI_QUOTE_DECIMALS = int(os.getenv('MOJI_QUOTE_DECIMALS', '18'))
+BUY_WATCH_POLL_INTERVAL = float(os.getenv('BUY_WATCH_POLL_INTERVAL', '3'))
+BUY_WATCH_BATCH_BLOCKS = int(os.getenv('BUY_WATCH_BATCH_BLOCKS', '500'))
+BUY_WATCH_CONFIRMATIONS = int(os.getenv('BUY_WATCH_CONFIRMATIONS', '1'))
+BOT_EXECUTION_MODE = os.getenv('BOT_EXECUTION_MODE', 'threaded')  # threaded, async or webhook
+ASYNC_MAX_CONCURRENT_UPDATES = int(os.getenv('ASYNC_MAX_CONCURRENT_UPDATES', '1000'))
+ASYNC_EXECUTOR_WORKERS = int(os.getenv('ASYNC_EXECUTOR_WORKERS', '8'))
+ASYNC_DRIP_WORKERS = int(os.getenv('ASYNC_DRIP_WORKERS', '2'))  # drips running at once in async mode; more wait their turn
+ASYNC_DATABASE_URL = os.getenv('ASYNC_DATABASE_URL')  # derived from DATABASE_URL when unset
+BOT_WORKERS = int(os.getenv('BOT_WORKERS', '8'))
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '10'))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '20'))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '30'))
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '1800'))
+ACTIVITY_FLUSH_INTERVAL = float(os.getenv('ACTIVITY_FLUSH_INTERVAL', '30'))
+ACTIVE_USER_DAYS = int(os.getenv('ACTIVE_USER_DAYS', '7'))
+GROUP_CACHE_TTL = float(os.getenv('GROUP_CACHE_TTL', '300'))
+GROUP_STATS_CACHE_TTL = float(os.getenv('GROUP_STATS_CACHE_TTL', '60'))  # seconds a rendered /top or /stats is reused
+GROUP_STATS_TOP = int(os.getenv('GROUP_STATS_TOP', '10'))  # users per leaderboard
+GROUP_STATS_DAYS = int(os.getenv('GROUP_STATS_DAYS', '7'))  # default /top window and /stats daily breakdown
+TX_POLL_INTERVAL = float(os.getenv('TX_POLL_INTERVAL', '5'))
+TX_CONFIRMATIONS = int(os.getenv('TX_CONFIRMATIONS', '1'))
+TX_STUCK_AFTER = float(os.getenv('TX_STUCK_AFTER', '300'))  # seconds unmined before a re-broadcast
+TX_MAX_REBROADCASTS = int(os.getenv('TX_MAX_REBROADCASTS', '3'))
+TX_STUCK_POLL_INTERVAL = float(os.getenv('TX_STUCK_POLL_INTERVAL', '60'))  # seconds between receipt checks of stuck transfers
+RECEIPT_BATCH_SIZE = int(os.getenv('RECEIPT_BATCH_SIZE', '500'))
+SIGNER_CACHE_TTL = float(os.getenv('SIGNER_CACHE_TTL', '300'))
+SIGNER_CACHE_SIZE = int(os.getenv('SIGNER_CACHE_SIZE', '256'))  # 0 disables the cache
+AI_API_BASE = os.getenv('AI_API_BASE')  # OpenAI-compatible endpoint; the openai default when unset
+AI_REPLY_MODEL = os.getenv('AI_REPLY_MODEL', 'gpt-3.5-turbo')
+AI_REPLY_TIMEOUT = float(os.getenv('AI_REPLY_TIMEOUT', '15'))
+AI_REPLY_WORKERS = int(os.getenv('AI_REPLY_WORKERS', '2'))
+AI_REPLY_QUEUE_SIZE = int(os.getenv('AI_REPLY_QUEUE_SIZE', '50'))
+AI_REPLY_CACHE_TTL = float(os.getenv('AI_REPLY_CACHE_TTL', '3600'))
+AI_USER_RATE_PER_MINUTE = float(os.getenv('AI_USER_RATE_PER_MINUTE', '2'))
+AI_USER_BURST = int(os.getenv('AI_USER_BURST', '3'))
+AI_CHAT_RATE_PER_MINUTE = float(os.getenv('AI_CHAT_RATE_PER_MINUTE', '10'))
+AI_CHAT_BURST = int(os.getenv('AI_CHAT_BURST', '10'))
+AI_COST_PER_1K_TOKENS = float(os.getenv('AI_COST_PER_1K_TOKENS', '0.002'))
+TELEGRAM_GLOBAL_RATE = float(os.getenv('TELEGRAM_GLOBAL_RATE', '25'))  # messages per second across all chats
+TELEGRAM_CHAT_INTERVAL = float(os.getenv('TELEGRAM_CHAT_INTERVAL', '1'))  # seconds between messages to one private chat
+TELEGRAM_GROUP_INTERVAL = float(os.getenv('TELEGRAM_GROUP_INTERVAL', '3'))  # seconds between messages to one group
+TELEGRAM_SEND_WORKERS = int(os.getenv('TELEGRAM_SEND_WORKERS', '8'))
+TELEGRAM_SEND_ATTEMPTS = int(os.getenv('TELEGRAM_SEND_ATTEMPTS', '5'))
+KEY_POOL_TARGET = int(os.getenv('KEY_POOL_TARGET', '1000'))  # 0: no refill worker, /enchant generates keys inline
+KEY_POOL_BATCH_SIZE = int(os.getenv('KEY_POOL_BATCH_SIZE', '100'))
+KEY_POOL_REFILL_INTERVAL = float(os.getenv('KEY_POOL_REFILL_INTERVAL', '10'))
+RPC_TIMEOUT = float(os.getenv('RPC_TIMEOUT', '10'))
+RPC_POOL_SIZE = int(os.getenv('RPC_POOL_SIZE', '16'))  # keep-alive connections per endpoint
+RPC_BATCH_SIZE = int(os.getenv('RPC_BATCH_SIZE', '100'))
+RPC_BATCH_WORKERS = int(os.getenv('RPC_BATCH_WORKERS', '8'))  # batches in flight at once
+RPC_HEALTH_INTERVAL = float(os.getenv('RPC_HEALTH_INTERVAL', '15'))
+RPC_FAILURE_THRESHOLD = int(os.getenv('RPC_FAILURE_THRESHOLD', '3'))
+RPC_CIRCUIT_RESET = float(os.getenv('RPC_CIRCUIT_RESET', '30'))
+RPC_MAX_BLOCK_LAG = int(os.getenv('RPC_MAX_BLOCK_LAG', '5'))
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')  # public URL Telegram posts updates to; not registered when unset
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8443'))
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')  # checked against X-Telegram-Bot-Api-Secret-Token
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv('WEBHOOK_MAX_CONNECTIONS', '40'))
+SHARD_WORKERS = int(os.getenv('SHARD_WORKERS', '4'))  # worker processes in webhook mode
+SHARD_LANES = int(os.getenv('SHARD_LANES', '8'))  # threads per worker; each chat always uses the same one
+SHARD_LANE_BACKLOG = int(os.getenv('SHARD_LANE_BACKLOG', '1000'))
+SHARD_RESTART_DELAY = float(os.getenv('SHARD_RESTART_DELAY', '5'))  # seconds before a dead shard worker is started again
+METRICS_LISTEN = os.getenv('METRICS_LISTEN', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))  # 0: no /metrics endpoint; shard n uses METRICS_PORT + 1 + n
+TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', '0'))  # fraction of updates traced
+TRACE_BUFFER_SIZE = int(os.getenv('TRACE_BUFFER_SIZE', '100'))
+
+TOKEN_UNIT = Decimal(10**TOKEN_DECIMALS)
+
+def to_units(amount: Decimal) -> int:
+    return int(amount * TOKEN_UNIT)
+
+def from_units(units: int) -> Decimal:
+    return Decimal(units) / TOKEN_UNIT
+
+# Uniswap V2 style pair: only the parts the buy watcher needs
+PAIR_ABI = [
+    {"constant": True, "inputs": [], "name": "token0", "outputs": [{"name": "", "type": "address"}], "type": "function"},
+    {"anonymous": False, "name": "Swap", "type": "event", "inputs": [
+        {"indexed": True, "name": "sender", "type": "address"},
+        {"indexed": False, "name": "amount0In", "type": "uint256"},
+        {"indexed": False, "name": "amount1In", "type": "uint256"},
+        {"indexed": False, "name": "amount0Out", "type": "uint256"},
+        {"indexed": False, "name": "amount1Out", "type": "uint256"},
+        {"indexed": True, "name": "to", "type": "address"},
+    ]},
+]
 
 # Database setup
 Base = declarative_base()
@@ -41,29 +174,72 @@ class User(Base):
     __tablename__ = 'users'
     id = Column(Integer, primary_key=True)
     telegram_id = Column(String, unique=True)
-    username = Column(String)
+    username = Column(String, index=True)
     wallet = relationship("Wallet", uselist=False, back_populates="user")
     transactions = relationship("Transaction", back_populates="user")
-    last_active = Column(DateTime, default=datetime.utcnow)
+    last_active = Column(DateTime, default=datetime.utcnow, index=True)
 
 class Wallet(Base):
     __tablename__ = 'wallets'
     id = Column(Integer, primary_key=True)
-    user_id = Column(Integer, ForeignKey('users.id'))
+    user_id = Column(Integer, ForeignKey('users.id'), index=True)
     address = Column(String, unique=True)
     encrypted_private_key = Column(String)
-    balance = Column(Float, default=0.0)
+    balance_units = Column(BigInteger, default=0)
     user = relationship("User", back_populates="wallet")
 
 class Transaction(Base):
     __tablename__ = 'transactions'
     id = Column(Integer, primary_key=True)
-    user_id = Column(Integer, ForeignKey('users.id'))
-    amount = Column(Float)
+    user_id = Column(Integer, ForeignKey('users.id'), index=True)
+    amount_units = Column(BigInteger)  # signed: negative for outgoing transfers
     transaction_type = Column(String)
+    tx_hash = Column(String, index=True)
+    status = Column(String, default='pending')  # pending, confirmed, failed, dropped, stuck
+    chat_id = Column(String)  # group the tip or drip was made in; NULL for private chats
     timestamp = Column(DateTime, default=datetime.utcnow)
     user = relationship("User", back_populates="transactions")
 
+# Running per-user totals, updated in the same DB transaction as each ledger insert
+class UserLedgerSummary(Base):
+    __tablename__ = 'user_ledger_summaries'
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    sent_units = Column(BigInteger, default=0, nullable=False)
+    received_units = Column(BigInteger, default=0, nullable=False)
+    withdrawn_units = Column(BigInteger, default=0, nullable=False)
+    dripped_units = Column(BigInteger, default=0, nullable=False)
+    transaction_count = Column(Integer, default=0, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+# Per-group tip and drip volume in hourly and daily buckets, counting the sending side
+# of each transfer; updated in the same DB transaction as the ledger insert
+class GroupTipVolume(Base):
+    __tablename__ = 'group_tip_volume'
+    chat_id = Column(String, primary_key=True)
+    period = Column(String, primary_key=True)  # hour, day
+    bucket_start = Column(DateTime, primary_key=True)
+    tip_units = Column(BigInteger, default=0, nullable=False)
+    tip_count = Column(Integer, default=0, nullable=False)
+    drip_units = Column(BigInteger, default=0, nullable=False)
+    drip_count = Column(Integer, default=0, nullable=False)
+
+# Per-group daily totals of each user, tips and drips together, for the leaderboards
+class GroupTipperStats(Base):
+    __tablename__ = 'group_tipper_stats'
+    chat_id = Column(String, primary_key=True)
+    day = Column(DateTime, primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    sent_units = Column(BigInteger, default=0, nullable=False)
+    received_units = Column(BigInteger, default=0, nullable=False)
+
+# Pre-generated, pre-encrypted keypairs; /enchant claims one instead of generating a key
+class PooledKey(Base):
+    __tablename__ = 'wallet_key_pool'
+    id = Column(Integer, primary_key=True)
+    address = Column(String, unique=True)
+    encrypted_private_key = Column(String)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
 class Group(Base):
     __tablename__ = 'groups'
     id = Column(Integer, primary_key=True)
@@ -72,22 +248,1094 @@ class Group(Base):
     bot_name = Column(String, default='Moji Buy Bot')
     bot_profile_pic = Column(String)
 
-engine = create_engine(DATABASE_URL)
-Base.metadata.create_all(engine)
-Session = sessionmaker(bind=engine)
-db_session = Session()
+class Drip(Base):
+    __tablename__ = 'drips'
+    id = Column(Integer, primary_key=True)
+    sender_id = Column(Integer, ForeignKey('users.id'))
+    amount_per_user_units = Column(BigInteger)
+    chat_id = Column(String)  # group the drip was started in; NULL for private chats
+    status = Column(String, default='pending')  # pending, running, partial, completed
+    claimed_at = Column(DateTime)  # when the current or last run started
+    created_at = Column(DateTime, default=datetime.utcnow)
+    sender = relationship("User")
+    recipients = relationship("DripRecipient", back_populates="drip", order_by="DripRecipient.id")
+
+class DripRecipient(Base):
+    __tablename__ = 'drip_recipients'
+    id = Column(Integer, primary_key=True)
+    drip_id = Column(Integer, ForeignKey('drips.id'), index=True)
+    user_id = Column(Integer, ForeignKey('users.id'))
+    address = Column(String)
+    nonce = Column(Integer)
+    tx_hash = Column(String)
+    raw_transaction = Column(String)
+    status = Column(String, default='pending')  # pending, signed, sent, failed
+    error = Column(String)
+    drip = relationship("Drip", back_populates="recipients")
+
+class BuyAlertSubscription(Base):
+    __tablename__ = 'buy_alert_subscriptions'
+    id = Column(Integer, primary_key=True)
+    chat_id = Column(String, unique=True)
+
+class WatcherCheckpoint(Base):
+    __tablename__ = 'watcher_checkpoints'
+    name = Column(String, primary_key=True)
+    block_number = Column(Integer)  # next block to scan
+    log_index = Column(Integer, default=-1)  # last log already handled in that block
+
+class SchemaMigration(Base):
+    __tablename__ = 'schema_migrations'
+    version = Column(Integer, primary_key=True)
+    applied_at = Column(DateTime, default=datetime.utcnow)
+
+LEDGER_COLUMNS = {
+    'tip_sent': 'sent_units',
+    'tip_received': 'received_units',
+    'drip_received': 'received_units',
+    'withdraw': 'withdrawn_units',
+    'drip_sent': 'dripped_units',
+}
+
+# Ledger types that count towards group stats: (user side, volume kind)
+GROUP_STAT_TYPES = {
+    'tip_sent': ('sent', 'tip'),
+    'tip_received': ('received', None),
+    'drip_sent': ('sent', 'drip'),
+    'drip_received': ('received', None),
+}
+
+def add_missing_columns(connection, table: str, columns: dict) -> set:
+    # Returns the columns the table had before, so steps can tell what to backfill
+    existing = {column['name'] for column in inspect(connection).get_columns(table)}
+    for name, column_type in columns.items():
+        if name not in existing:
+            connection.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {column_type}"))
+    return existing
+
+def migrate_integer_amounts(connection) -> None:
+    # Float amounts become signed integer base units; the old columns are left in place
+    for table, old, new in (
+        ('transactions', 'amount', 'amount_units'),
+        ('wallets', 'balance', 'balance_units'),
+        ('drips', 'amount_per_user', 'amount_per_user_units'),
+    ):
+        columns = add_missing_columns(connection, table, {new: 'BIGINT'})
+        if old in columns:
+            connection.execute(text(
+                f"UPDATE {table} SET {new} = CAST(ROUND({old} * {10**TOKEN_DECIMALS}) AS BIGINT) "
+                f"WHERE {new} IS NULL AND {old} IS NOT NULL"
+            ))
+
+    totals = ", ".join(
+        f"COALESCE(SUM(CASE WHEN transaction_type IN ({', '.join(repr(t) for t, c in LEDGER_COLUMNS.items() if c == column)}) "
+        f"THEN ABS(amount_units) ELSE 0 END), 0)"
+        for column in dict.fromkeys(LEDGER_COLUMNS.values())
+    )
+    connection.execute(text("DELETE FROM user_ledger_summaries"))
+    connection.execute(text(
+        f"INSERT INTO user_ledger_summaries (user_id, {', '.join(dict.fromkeys(LEDGER_COLUMNS.values()))}, transaction_count, updated_at) "
+        f"SELECT user_id, {totals}, COUNT(*), CURRENT_TIMESTAMP FROM transactions "
+        f"WHERE user_id IS NOT NULL GROUP BY user_id"
+    ))
+
+def migrate_transaction_status(connection) -> None:
+    # Rows written before confirmation tracking keep a NULL status and are never polled
+    add_missing_columns(connection, 'transactions', {'tx_hash': 'VARCHAR', 'status': 'VARCHAR'})
+    connection.execute(text("CREATE INDEX IF NOT EXISTS ix_transactions_tx_hash ON transactions (tx_hash)"))
+
+def migrate_group_columns(connection) -> None:
+    # Earlier tips and drips did not record their group, so they stay out of the group stats
+    add_missing_columns(connection, 'transactions', {'chat_id': 'VARCHAR'})
+    add_missing_columns(connection, 'drips', {'chat_id': 'VARCHAR'})
+
+def migrate_drip_claims(connection) -> None:
+    add_missing_columns(connection, 'drips', {'claimed_at': 'TIMESTAMP'})
+
+# create_all only creates missing tables, so changes to existing tables are applied
+# here in order. A step is either SQL statements or a callable taking the connection.
+# Each step must be idempotent: on a fresh database create_all has already built the
+# current schema.
+MIGRATIONS = [
+    (1, [
+        "CREATE INDEX IF NOT EXISTS ix_users_username ON users (username)",
+        "CREATE INDEX IF NOT EXISTS ix_users_last_active ON users (last_active)",
+        "CREATE INDEX IF NOT EXISTS ix_wallets_user_id ON wallets (user_id)",
+        "CREATE INDEX IF NOT EXISTS ix_transactions_user_id ON transactions (user_id)",
+    ]),
+    (2, [migrate_integer_amounts]),
+    (3, [migrate_transaction_status]),
+    (4, [migrate_group_columns]),
+    (5, [migrate_drip_claims]),
+]
+
+def run_migrations(engine) -> None:
+    with engine.begin() as connection:
+        applied = {row[0] for row in connection.execute(text("SELECT version FROM schema_migrations"))}
+        for version, statements in MIGRATIONS:
+            if version in applied:
+                continue
+            logger.info(f"Applying schema migration {version}")
+            for statement in statements:
+                if callable(statement):
+                    statement(connection)
+                else:
+                    connection.execute(text(statement))
+            connection.execute(SchemaMigration.__table__.insert().values(version=version, applied_at=datetime.utcnow()))
+
+def engine_options(url: str) -> dict:
+    # SQLite uses its own pooling strategy and rejects the QueuePool settings
+    if url.startswith('sqlite'):
+        return {}
+    return {
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_timeout': DB_POOL_TIMEOUT,
+        'pool_recycle': DB_POOL_RECYCLE,
+        'pool_pre_ping': True,
+    }
+
+# One session per thread, bound to the container's engine when first used; every update
+# handler releases its session when it finishes
+db_session = scoped_session(lambda: container.session_factory())
+
+def releases_db_session(handler):
+    @functools.wraps(handler)
+    def wrapper(*args, **kwargs):
+        try:
+            return handler(*args, **kwargs)
+        finally:
+            db_session.remove()
+    return wrapper
+
+# INSERT that supports ON CONFLICT clauses, or None on dialects without one
+def dialect_insert(session, table):
+    from sqlalchemy.dialects import postgresql, sqlite
+
+    dialect = session.get_bind().dialect.name
+    if dialect == 'sqlite':
+        return sqlite.insert(table)
+    if dialect == 'postgresql':
+        return postgresql.insert(table)
+    return None
+
+# Concurrent first requests from one user must not race each other into duplicate rows
+def upsert_user(session, telegram_id: str) -> User:
+    insert = dialect_insert(session, User.__table__)
+    if insert is not None:
+        session.execute(insert.values(telegram_id=telegram_id).on_conflict_do_nothing(index_elements=['telegram_id']))
+    elif not session.query(User).filter_by(telegram_id=telegram_id).first():
+        try:
+            with session.begin_nested():
+                session.add(User(telegram_id=telegram_id))
+        except IntegrityError:
+            pass
+    return session.query(User).filter_by(telegram_id=telegram_id).one()
+
+# Adds each row's counters onto the stored row with the same keys, inserting it when
+# there is none; the row's other columns overwrite the stored ones
+def increment_counters(session, table, keys: tuple, counters: tuple, rows: list) -> None:
+    insert = dialect_insert(session, table)
+    if insert is not None:
+        values = {column: insert.excluded[column] for column in rows[0] if column not in keys}
+        values.update({column: table.c[column] + insert.excluded[column] for column in counters})
+        session.execute(insert.on_conflict_do_update(index_elements=list(keys), set_=values), rows)
+        return
+
+    for row in rows:
+        values = {column: row[column] for column in row if column not in keys}
+        values.update({column: table.c[column] + row[column] for column in counters})
+        updated = session.execute(table.update().where(*(table.c[key] == row[key] for key in keys)).values(values))
+        if not updated.rowcount:
+            session.execute(table.insert().values(**row))
+
+# Append-only transaction ledger; keeps user_ledger_summaries and, for transfers made
+# in a group, the group stats in step with it
+class Ledger:
+    COUNTERS = tuple(dict.fromkeys(LEDGER_COLUMNS.values())) + ('transaction_count',)
+
+    @staticmethod
+    def record(session, entries: list, chat_id: str = None) -> None:
+        # entries are (user_id, signed amount in base units, transaction_type, tx_hash) tuples;
+        # the caller commits, so the rows and the totals land in one DB transaction
+        if not entries:
+            return
+        now = datetime.utcnow()
+        session.bulk_insert_mappings(Transaction, [
+            {'user_id': user_id, 'amount_units': units, 'transaction_type': transaction_type,
+             'tx_hash': tx_hash, 'status': 'pending', 'chat_id': chat_id, 'timestamp': now}
+            for user_id, units, transaction_type, tx_hash in entries
+        ])
+        Ledger._update_totals(session, entries, 1)
+        if chat_id:
+            GroupStats.update(session, [(chat_id, user_id, units, transaction_type, now)
+                                        for user_id, units, transaction_type, _ in entries], 1)
+
+    # Takes transfers that never happened (reverted or dropped) back out of the totals
+    @staticmethod
+    def reverse(session, transactions: list) -> None:
+        entries = [(t.user_id, t.amount_units, t.transaction_type, t.tx_hash) for t in transactions]
+        if entries:
+            Ledger._update_totals(session, entries, -1)
+        GroupStats.update(session, [(t.chat_id, t.user_id, t.amount_units, t.transaction_type, t.timestamp)
+                                    for t in transactions if t.chat_id and t.timestamp], -1)
 
-# Web3 and encryption setup
-w3 = Web3(Web3.HTTPProvider(BLOCKCHAIN_RPC_URL))
-fernet = Fernet(ENCRYPTION_KEY.encode())
+    @staticmethod
+    def _update_totals(session, entries: list, sign: int) -> None:
+        deltas = {}
+        for user_id, units, transaction_type, _ in entries:
+            delta = deltas.setdefault(user_id, dict.fromkeys(Ledger.COUNTERS, 0))
+            delta[LEDGER_COLUMNS[transaction_type]] += sign * abs(units)
+            delta['transaction_count'] += sign
+        now = datetime.utcnow()
+        # Sorted, so concurrent transactions lock the rows in the same order
+        rows = [{'user_id': user_id, 'updated_at': now, **delta} for user_id, delta in sorted(deltas.items())]
+        increment_counters(session, UserLedgerSummary.__table__, ('user_id',), Ledger.COUNTERS, rows)
+
+# Incremental per-group aggregates: hourly and daily volume, and each user's daily
+# totals. /top and /stats read these few rows instead of the group's whole history.
+class GroupStats:
+    VOLUME_COUNTERS = ('tip_units', 'tip_count', 'drip_units', 'drip_count')
+    TIPPER_COUNTERS = ('sent_units', 'received_units')
 
-# Set up Together.ai API
-openai.api_key = TOGETHER_AI_API_KEY
+    @staticmethod
+    def bucket_start(at: datetime, period: str) -> datetime:
+        if period == 'hour':
+            return at.replace(minute=0, second=0, microsecond=0)
+        return at.replace(hour=0, minute=0, second=0, microsecond=0)
+
+    @staticmethod
+    def update(session, entries: list, sign: int) -> None:
+        # entries are (chat_id, user_id, signed amount in base units, transaction_type, timestamp) tuples
+        volume, tippers = {}, {}
+        for chat_id, user_id, units, transaction_type, at in entries:
+            if transaction_type not in GROUP_STAT_TYPES:
+                continue
+            side, kind = GROUP_STAT_TYPES[transaction_type]
+            day = GroupStats.bucket_start(at, 'day')
+            tipper = tippers.setdefault((chat_id, day, user_id), dict.fromkeys(GroupStats.TIPPER_COUNTERS, 0))
+            tipper[f"{side}_units"] += sign * abs(units)
+            if kind:
+                for period in ('hour', 'day'):
+                    bucket = volume.setdefault((chat_id, period, GroupStats.bucket_start(at, period)),
+                                               dict.fromkeys(GroupStats.VOLUME_COUNTERS, 0))
+                    bucket[f"{kind}_units"] += sign * abs(units)
+                    bucket[f"{kind}_count"] += sign
+
+        # Sorted for the same lock order as in Ledger._update_totals
+        if volume:
+            increment_counters(session, GroupTipVolume.__table__, ('chat_id', 'period', 'bucket_start'),
+                               GroupStats.VOLUME_COUNTERS,
+                               [{'chat_id': chat_id, 'period': period, 'bucket_start': bucket_start, **delta}
+                                for (chat_id, period, bucket_start), delta in sorted(volume.items())])
+        if tippers:
+            increment_counters(session, GroupTipperStats.__table__, ('chat_id', 'day', 'user_id'),
+                               GroupStats.TIPPER_COUNTERS,
+                               [{'chat_id': chat_id, 'day': day, 'user_id': user_id, **delta}
+                                for (chat_id, day, user_id), delta in sorted(tippers.items())])
+
+# Prometheus-style counters and latency histograms, kept in memory and rendered on
+# /metrics. An observation is a bisect and a dict update under a lock, cheap enough to
+# leave on for every handler, service and upstream call.
+class Metrics:
+    BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+    def __init__(self, prefix: str = 'mojibot'):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._counters = {}  # (name, labels) -> value
+        self._histograms = {}  # (name, labels) -> [count per bucket, count above the last, sum]
+        self._collectors = {}  # name -> callable returning a stats dict, exported as gauges
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        self._add((name, tuple(sorted(labels.items()))), value)
+
+    def observe(self, name: str, seconds: float, **labels) -> None:
+        self._record((name, tuple(sorted(labels.items()))), seconds)
+
+    # Exports the numeric values of an existing stats() method, e.g. queue depths and
+    # cache hit rates, as {prefix}_{name}{stat="..."} gauges read at scrape time
+    def collect(self, name: str, read) -> None:
+        self._collectors[name] = read
+
+    # Records {name}_seconds, and {name}_errors_total when the block raises
+    def timer(self, name: str, **labels) -> 'MetricsTimer':
+        return MetricsTimer(self, name, tuple(sorted(labels.items())))
+
+    def timed(self, name: str, **labels):
+        def decorator(func):
+            timer = self.timer(name, **labels)
+            if asyncio.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    started = time.perf_counter()
+                    try:
+                        return await func(*args, **kwargs)
+                    except Exception:
+                        self._add(timer.errors_key, 1)
+                        raise
+                    finally:
+                        self._record(timer.key, time.perf_counter() - started)
+                return async_wrapper
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                except Exception:
+                    self._add(timer.errors_key, 1)
+                    raise
+                finally:
+                    self._record(timer.key, time.perf_counter() - started)
+            return wrapper
+        return decorator
+
+    def _add(self, key: tuple, value: float) -> None:
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def _record(self, key: tuple, seconds: float) -> None:
+        index = bisect.bisect_left(self.BUCKETS, seconds)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [0] * (len(self.BUCKETS) + 2)
+            histogram[index] += 1
+            histogram[-1] += seconds
+        if _current_trace.get() is not None:
+            tracer.span(key, seconds)
+
+    def render(self) -> str:
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, list(histogram)) for key, histogram in self._histograms.items())
+        lines = []
+        typed = set()
+
+        def declare(name: str, kind: str) -> str:
+            name = f"{self.prefix}_{name}"
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} {kind}")
+            return name
+
+        for (name, labels), value in counters:
+            lines.append(f"{declare(name, 'counter')}{self._labels(labels)} {value}")
+        for (name, labels), histogram in histograms:
+            name = declare(name, 'histogram')
+            cumulative = 0
+            for bound, count in zip(self.BUCKETS + (None,), histogram[:-1]):
+                cumulative += count
+                le = f"{bound:g}" if bound is not None else '+Inf'
+                lines.append(f"{name}_bucket{self._labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{name}_sum{self._labels(labels)} {histogram[-1]}")
+            lines.append(f"{name}_count{self._labels(labels)} {cumulative}")
+        for name, read in sorted(self._collectors.items()):
+            try:
+                stats = read()
+            except Exception as e:
+                logger.error(f"Metrics collector {name} failed: {str(e)}")
+                continue
+            for stat, value in sorted(stats.items()):
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    lines.append(f"{declare(name, 'gauge')}{self._labels((('stat', stat),))} {value}")
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _labels(labels: tuple) -> str:
+        if not labels:
+            return ''
+        return '{' + ','.join(f"{key}={json.dumps(str(value), ensure_ascii=False)}" for key, value in labels) + '}'
+
+class MetricsTimer:
+    __slots__ = ('metrics', 'key', 'errors_key', 'started')
+
+    def __init__(self, metrics: Metrics, name: str, labels: tuple):
+        self.metrics = metrics
+        self.key = (f"{name}_seconds", labels)
+        self.errors_key = (f"{name}_errors_total", labels)
+
+    def __enter__(self) -> 'MetricsTimer':
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        if exc_type is not None and issubclass(exc_type, Exception):
+            self.metrics._add(self.errors_key, 1)
+        self.metrics._record(self.key, time.perf_counter() - self.started)
+
+_current_trace = contextvars.ContextVar('mojibot_trace', default=None)
+
+# Sampled per-update traces: while a sampled update is handled, every metrics
+# observation on the same thread or task is recorded as a span of its trace. Finished
+# traces are logged to the Mojibot.trace logger and the latest are kept for /traces.
+class Tracer:
+    def __init__(self, sample_rate: float = TRACE_SAMPLE_RATE, keep: int = TRACE_BUFFER_SIZE):
+        self.sample_rate = sample_rate
+        self.recent = deque(maxlen=keep)
+        self.logger = logging.getLogger(f"{__name__}.trace")
+
+    @contextmanager
+    def trace(self, name: str, **attributes):
+        if _current_trace.get() is not None or not self.sample_rate or random.random() >= self.sample_rate:
+            yield
+            return
+        trace = {'name': name, **attributes, 'started_at': datetime.utcnow().isoformat(), 'spans': []}
+        started = time.perf_counter()
+        token = _current_trace.set((trace, started))
+        try:
+            yield
+        finally:
+            _current_trace.reset(token)
+            trace['duration_ms'] = round((time.perf_counter() - started) * 1000, 3)
+            self.recent.append(trace)
+            self.logger.info(json.dumps(trace, default=str))
+
+    # key is a metrics series: (name, sorted label pairs)
+    @staticmethod
+    def span(key: tuple, seconds: float) -> None:
+        current = _current_trace.get()
+        if current is None:
+            return
+        trace, started = current
+        ended = time.perf_counter() - started
+        trace['spans'].append({'name': key[0].removesuffix('_seconds'), **dict(key[1]),
+                               'start_ms': round((ended - seconds) * 1000, 3), 'duration_ms': round(seconds * 1000, 3)})
+
+metrics = Metrics()
+tracer = Tracer()
+
+# Times every statement on an engine, labelled by its verb (SELECT, UPDATE, ...)
+def instrument_engine(sync_engine) -> None:
+    def started(conn, cursor, statement, parameters, context, executemany):
+        context.mojibot_started = time.perf_counter()
+
+    def finished(conn, cursor, statement, parameters, context, executemany):
+        verb = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else 'OTHER'
+        metrics.observe('db_seconds', time.perf_counter() - context.mojibot_started, statement=verb)
+
+    event.listen(sync_engine, 'before_cursor_execute', started)
+    event.listen(sync_engine, 'after_cursor_execute', finished)
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        if self.path == '/metrics':
+            body, content_type = metrics.render().encode(), 'text/plain; version=0.0.4'
+        elif self.path == '/traces':
+            body, content_type = json.dumps(list(tracer.recent), default=str).encode(), 'application/json'
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+def start_metrics_server(port: int = METRICS_PORT) -> None:
+    if not port:
+        return
+    server = ThreadingHTTPServer((METRICS_LISTEN, port), MetricsRequestHandler)
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    logger.info(f"Serving /metrics and /traces on {METRICS_LISTEN}:{port}")
+
+_first_update = threading.Lock()  # taken by the first update handled and never released
+
+# How long after start the worker began taking updates and handled its first one, the
+# numbers that decide how long a restart keeps users waiting
+def record_ready() -> None:
+    seconds = time.monotonic() - STARTED_AT
+    metrics.observe('startup_seconds', seconds, stage='ready')
+    logger.info(f"Taking updates {seconds:.2f}s after start")
+
+def record_first_update() -> None:
+    if _first_update.locked() or not _first_update.acquire(blocking=False):
+        return
+    seconds = time.monotonic() - STARTED_AT
+    metrics.observe('startup_seconds', seconds, stage='first_update')
+    logger.info(f"First update handled {seconds:.2f}s after start")
+
+# Handler wrapper for the threaded and shard modes: times the handler and, for sampled
+# updates, traces everything it calls
+def instrumented(name: str, handler):
+    @functools.wraps(handler)
+    def wrapper(update: Update, context: CallbackContext):
+        try:
+            with tracer.trace(name, update_id=update.update_id), metrics.timer('handler', handler=name):
+                return handler(update, context)
+        finally:
+            record_first_update()
+    return wrapper
+
+# One JSON-RPC endpoint: a keep-alive connection pool, a smoothed latency used for
+# routing and a circuit breaker that takes it out of rotation after repeated failures
+class RPCNode:
+    def __init__(self, url: str, pool_size: int = RPC_POOL_SIZE, index: int = 0):
+        from urllib.parse import urlsplit
+
+        self.url = url
+        # Provider URLs usually carry the API key, so metrics and logs name the node by
+        # position and host only
+        self.label = f"{index}:{urlsplit(url).hostname}"
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.latency = 0.0  # exponentially weighted; 0 until measured, so new nodes get tried
+        self.in_flight = 0
+        self.failures = 0
+        self.open_until = 0.0
+        self.block_number = None
+        self.lagging = False
+
+    def available(self, now: float) -> bool:
+        return not self.lagging and self.open_until <= now
+
+    # Expected wait if a batch were sent now, so slower nodes take work once the
+    # fastest one has enough batches queued on it
+    def load(self) -> float:
+        return (self.latency or 0.001) * (self.in_flight + 1)
+
+    def post(self, body: str, timeout: float):
+        response = self.session.post(self.url, data=body, headers={'Content-Type': 'application/json'}, timeout=timeout)
+        response.raise_for_status()
+        return json.loads(response.text)
+
+    # requests puts the URL, or its path, in its error messages
+    def redact(self, error: Exception) -> str:
+        from urllib.parse import urlsplit
+
+        message = str(error).replace(self.url, self.label)
+        path = urlsplit(self.url).path
+        return message.replace(path, '/...') if path.strip('/') else message
+
+# A write that reached a node which then timed out: it may still be accepted and mined
+class WriteOutcomeUnknown(ConnectionError):
+    pass
+
+# Every chain call goes through here. Calls from all threads are queued and sent as
+# JSON-RPC batches by a few sender threads, so concurrent reads share round trips
+# without an artificial delay: whatever queued while the previous batch was in flight
+# goes out together. Each batch goes to the fastest available node and fails over to
+# the next one on transport errors; JSON-RPC errors are returned to the caller.
+# Writes are not failed over once a node may have received them.
+class RPCClient:
+    WRITE_METHODS = ('eth_sendRawTransaction', 'eth_sendTransaction')
+
+    def __init__(self, urls: list = BLOCKCHAIN_RPC_URLS, batch_size: int = RPC_BATCH_SIZE, workers: int = RPC_BATCH_WORKERS,
+                 timeout: float = RPC_TIMEOUT, health_interval: float = RPC_HEALTH_INTERVAL):
+        self.nodes = [RPCNode(url, index=i) for i, url in enumerate(urls)]
+        self.batch_size = batch_size
+        self.workers = workers
+        self.timeout = timeout
+        self.health_interval = health_interval
+        self.counters = dict.fromkeys(('calls', 'batches', 'failovers', 'failed_batches'), 0)
+        self._cond = threading.Condition()
+        self._pending = []  # (method, params, Future)
+        self._threads = []
+
+    def call(self, method: str, params=None) -> dict:
+        # Returns the raw JSON-RPC response, with either 'result' or 'error'
+        with metrics.timer('rpc', method=method):
+            return self._results([self.submit(method, params)])[0]
+
+    def batch(self, calls: list) -> list:
+        if not calls:
+            return []
+        with metrics.timer('rpc', method=calls[0][0]):
+            return self._results([self.submit(method, params) for method, params in calls])
+
+    # Calls still queued when the caller gives up are cancelled, so a timed-out write
+    # is never sent behind the caller's back
+    def _results(self, futures: list) -> list:
+        deadline = time.monotonic() + self.timeout * (len(self.nodes) + 1)
+        try:
+            return [future.result(timeout=max(0.0, deadline - time.monotonic())) for future in futures]
+        except FutureTimeoutError:
+            for future in futures:
+                future.cancel()
+            raise
+
+    def submit(self, method: str, params=None) -> Future:
+        future = Future()
+        with self._cond:
+            if not self._threads:
+                self._start()
+            self._pending.append((method, params or [], future))
+            self.counters['calls'] += 1
+            self._cond.notify()
+        return future
+
+    def stats(self) -> dict:
+        with self._cond:
+            stats = dict(self.counters, queued=len(self._pending))
+        stats['nodes'] = {node.label: {'latency_ms': round(node.latency * 1000, 1), 'in_flight': node.in_flight, 'failures': node.failures,
+                                     'open': node.open_until > time.monotonic(), 'lagging': node.lagging}
+                          for node in self.nodes}
+        return stats
+
+    # Caller holds the lock
+    def _start(self) -> None:
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f'rpc-sender-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        if len(self.nodes) > 1:
+            thread = threading.Thread(target=self._check_health, name='rpc-health', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                items, self._pending = self._pending[:self.batch_size], self._pending[self.batch_size:]
+            # Skips calls whose caller has already given up
+            items = [item for item in items if item[2].set_running_or_notify_cancel()]
+            if items:
+                self._dispatch(items)
+
+    def _dispatch(self, items: list) -> None:
+        tried = []
+        last_error = None
+        while items and len(tried) < len(self.nodes):
+            body = json.dumps([
+                {'jsonrpc': '2.0', 'id': i, 'method': method, 'params': params} for i, (method, params, _) in enumerate(items)
+            ])
+            with self._cond:
+                node = self._pick(tried)
+                node.in_flight += 1
+            tried.append(node)
+            started = time.perf_counter()
+            try:
+                results = node.post(body, self.timeout)
+                if not isinstance(results, list):
+                    raise ValueError(f"Batch rejected: {results}")
+            except Exception as e:
+                with self._cond:
+                    node.in_flight -= 1
+                    self._record_failure(node)
+                    self.counters['failovers'] += 1
+                metrics.inc('rpc_endpoint_failures_total', endpoint=node.label)
+                last_error = node.redact(e)
+                logger.warning(f"RPC node {node.label} failed: {last_error}")
+                # After a read timeout the node may have accepted the writes; replaying them
+                # elsewhere would only get "already known" back, so their callers get the error
+                if isinstance(e, requests.exceptions.ReadTimeout):
+                    for method, _, future in items:
+                        if method in self.WRITE_METHODS:
+                            future.set_exception(WriteOutcomeUnknown(f"RPC node {node.label} timed out after the request was sent: {last_error}"))
+                    items = [item for item in items if item[0] not in self.WRITE_METHODS]
+                continue
+
+            latency = time.perf_counter() - started
+            with self._cond:
+                node.in_flight -= 1
+                self._record_latency(node, latency)
+                self.counters['batches'] += 1
+            metrics.observe('rpc_batch_seconds', latency, endpoint=node.label)
+            by_id = {item.get('id'): item for item in results}
+            for i, (_, _, future) in enumerate(items):
+                future.set_result(by_id.get(i) or {'jsonrpc': '2.0', 'id': i, 'error': {
+                    'code': -32603, 'message': 'missing from batch response'}})
+            return
+
+        with self._cond:
+            self.counters['failed_batches'] += 1
+        for _, _, future in items:
+            future.set_exception(ConnectionError(f"All RPC nodes failed: {last_error}"))
+
+    # The least loaded node in rotation; when every circuit is open, the one that will
+    # close first, so calls still have somewhere to go. Caller holds the lock
+    def _pick(self, exclude: list) -> RPCNode:
+        now = time.monotonic()
+        candidates = [node for node in self.nodes if node not in exclude]
+        available = [node for node in candidates if node.available(now)]
+        if available:
+            return min(available, key=RPCNode.load)
+        return min(candidates, key=lambda node: (node.lagging, node.open_until))
+
+    def _record_latency(self, node: RPCNode, latency: float) -> None:
+        node.latency = latency if not node.latency else 0.8 * node.latency + 0.2 * latency
+        node.failures = 0
+        node.open_until = 0.0
+
+    def _record_failure(self, node: RPCNode) -> None:
+        node.failures += 1
+        if node.failures >= RPC_FAILURE_THRESHOLD:
+            node.open_until = time.monotonic() + RPC_CIRCUIT_RESET
+
+    # Probes every node with eth_blockNumber: refreshes latencies, closes the circuit of
+    # nodes that answer again, and takes nodes lagging behind the best head out of rotation
+    def _check_health(self) -> None:
+        body = json.dumps({'jsonrpc': '2.0', 'id': 0, 'method': 'eth_blockNumber', 'params': []})
+        while True:
+            for node in self.nodes:
+                started = time.perf_counter()
+                try:
+                    node.block_number = int(node.post(body, self.timeout)['result'], 16)
+                    with self._cond:
+                        self._record_latency(node, time.perf_counter() - started)
+                except Exception as e:
+                    node.block_number = None
+                    with self._cond:
+                        self._record_failure(node)
+                    logger.warning(f"RPC health check of {node.label} failed: {node.redact(e)}")
+            heads = [node.block_number for node in self.nodes if node.block_number is not None]
+            for node in self.nodes:
+                node.lagging = bool(heads) and node.block_number is not None and node.block_number < max(heads) - RPC_MAX_BLOCK_LAG
+            time.sleep(self.health_interval)
+
+# web3 providers backed by the shared RPCClient, defined on first use so that web3 is
+# only imported by the processes and code paths that talk to the chain
+def routed_provider(client: RPCClient):
+    from web3.providers.base import JSONBaseProvider
+
+    class RoutedProvider(JSONBaseProvider):
+        def make_request(self, method, params):
+            return client.call(method, params)
+
+        def is_connected(self) -> bool:
+            return any(node.available(time.monotonic()) for node in client.nodes)
+
+    return RoutedProvider()
+
+def async_routed_provider(client: RPCClient):
+    from web3.providers.async_base import AsyncJSONBaseProvider
+
+    class AsyncRoutedProvider(AsyncJSONBaseProvider):
+        async def make_request(self, method, params):
+            with metrics.timer('rpc', method=method):
+                return await asyncio.wrap_future(client.submit(method, params))
+
+        async def is_connected(self) -> bool:
+            return any(node.available(time.monotonic()) for node in client.nodes)
+
+    return AsyncRoutedProvider()
+
+# functools.cached_property, but two threads racing on first use build one instance
+class locked_cached_property:
+    def __init__(self, build):
+        self.build = build
+        self.name = build.__name__
+        self.lock = threading.Lock()
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        with self.lock:
+            if self.name not in instance.__dict__:
+                instance.__dict__[self.name] = self.build(instance)
+        return instance.__dict__[self.name]
+
+# Shared clients, each built on first use rather than at import, so a worker starts
+# polling without waiting on the database, the RPC endpoints or the imports behind them
+# (web3 and eth_account alone take most of a second). Schema setup is a separate step:
+# `python Mojibot.py migrate`.
+class Container:
+    @locked_cached_property
+    def engine(self):
+        engine = create_engine(DATABASE_URL, **engine_options(DATABASE_URL))
+        instrument_engine(engine)
+        return engine
+
+    @locked_cached_property
+    def session_factory(self):
+        return sessionmaker(bind=self.engine)
+
+    @locked_cached_property
+    def rpc_client(self) -> RPCClient:
+        return RPCClient()
+
+    @locked_cached_property
+    def w3(self):
+        from web3 import Web3
+        return Web3(routed_provider(self.rpc_client))
+
+    # Building a contract object is expensive (ENS setup), so the MOJI contract is built once
+    @locked_cached_property
+    def moji_contract(self):
+        return self.w3.eth.contract(address=MOJI_CONTRACT_ADDRESS, abi=MOJI_CONTRACT_ABI)
+
+    @locked_cached_property
+    def fernet(self):
+        from cryptography.fernet import Fernet
+        return Fernet(ENCRYPTION_KEY.encode())
+
+    # Shared state for multi-process deployments; in-process caches are used without it
+    @locked_cached_property
+    def redis(self):
+        return redis.Redis(host=REDIS_HOST, port=REDIS_PORT) if REDIS_HOST else None
+
+    # Completions go to Together.ai through the openai client
+    @locked_cached_property
+    def openai(self):
+        import openai
+        openai.api_key = TOGETHER_AI_API_KEY
+        return openai
+
+    def setup_schema(self) -> None:
+        Base.metadata.create_all(self.engine)
+        run_migrations(self.engine)
+
+    # Builds everything in the background once the bot is taking updates, so the first
+    # updates that need a client mostly find it ready
+    def warm_up(self) -> None:
+        def build():
+            try:
+                with self.engine.connect():
+                    pass
+                self.moji_contract, self.fernet, self.openai
+                import eth_account  # noqa: F401 (imported ahead of the first signing)
+            except Exception as e:
+                logger.error(f"Warm-up error: {str(e)}")
+        threading.Thread(target=build, name='warm-up', daemon=True).start()
+
+container = Container()
+# keccak of the event signatures and function selectors, so computing them does not need web3 at import
+TRANSFER_EVENT_TOPIC = '0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef'  # Transfer(address,address,uint256)
+SWAP_EVENT_TOPIC = '0xd78ad95fa46c994b6551d0da85fc275fe613ce37657fb8d5e3d130840159d822'  # Swap(address,uint256,uint256,uint256,uint256,address)
+TOTAL_SUPPLY_SELECTOR = '0x18160ddd'  # totalSupply()
+BALANCE_OF_SELECTOR = '0x70a08231'  # balanceOf(address)
+
+# Token reads go straight through the RPC client with hand-encoded calldata: /price and
+# /balance are often the first updates after a restart and should not wait for web3
+def balance_of_call(address: str) -> tuple:
+    return ('eth_call', [{'to': MOJI_CONTRACT_ADDRESS, 'data': BALANCE_OF_SELECTOR + address[2:].lower().rjust(64, '0')}, 'latest'])
+
+def read_uint(response: dict, what: str) -> int:
+    if 'error' in response:
+        raise Exception(f"Unable to fetch {what}: {response['error']}")
+    return int(response['result'], 16)
+
+# Caching
+class TTLCache:
+    # Lookups of a named cache are counted as mojibot_cache_lookups_total{cache, result}
+    def __init__(self, ttl: float, name: str = None):
+        self.ttl = ttl
+        self.name = name
+        self._lock = threading.Lock()
+        self._entries = {}  # key -> (value, fetched at)
+        self._inflight = {}  # key -> Future shared by concurrent misses
+
+    def get(self, key, loader):
+        entry, future, leader = self._claim(key)
+        if future is None:
+            return entry[0]
+
+        # Only the first caller of a miss hits upstream; the rest wait for its result
+        if not leader:
+            return future.result()
+
+        try:
+            value = loader()
+        except Exception as e:
+            return self._failed(key, future, entry, e)
+        return self._store(key, future, value)
+
+    # get() for coroutines: the loader is awaited, and a miss is shared with callers of
+    # either method, on the event loop or on other threads
+    async def aget(self, key, loader):
+        entry, future, leader = self._claim(key)
+        if future is None:
+            return entry[0]
+        if not leader:
+            return await asyncio.wrap_future(future)
+
+        try:
+            value = await loader()
+        except BaseException as e:  # a cancelled load must not leave the others waiting
+            return self._failed(key, future, entry, e)
+        return self._store(key, future, value)
+
+    # (entry, None, _) for a fresh entry; otherwise the miss's shared future and whether
+    # this caller loads it
+    def _claim(self, key) -> tuple:
+        with self._lock:
+            entry = self._entries.get(key)
+            fresh = entry and time.monotonic() - entry[1] < self.ttl
+            future = leader = None
+            if not fresh:
+                future = self._inflight.get(key)
+                leader = future is None
+                if leader:
+                    future = self._inflight[key] = Future()
+        self._count('hit' if fresh else 'miss')
+        return entry, future, leader
+
+    def _failed(self, key, future: Future, entry, error: BaseException):
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+        if entry and isinstance(error, Exception):
+            logger.warning(f"Serving stale {key} after refresh error: {str(error)}")
+            future.set_result(entry[0])
+            return entry[0]
+        future.set_exception(error)
+        raise error
+
+    def _store(self, key, future: Future, value):
+        with self._lock:
+            # Skip the store if the key was invalidated while the loader was running
+            if self._inflight.get(key) is future:
+                self._entries[key] = (value, time.monotonic())
+                del self._inflight[key]
+        future.set_result(value)
+        return value
+
+    def peek(self, key):
+        entry = self._entries.get(key)
+        if entry and time.monotonic() - entry[1] < self.ttl:
+            self._count('hit')
+            return entry[0]
+        self._count('miss')
+        return None
+
+    def set(self, key, value) -> None:
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+
+    def invalidate(self, key) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+            self._inflight.pop(key, None)
+
+    def age(self, key):
+        entry = self._entries.get(key)
+        return time.monotonic() - entry[1] if entry else None
+
+    def _count(self, result: str) -> None:
+        if self.name:
+            metrics.inc('cache_lookups_total', cache=self.name, result=result)
+
+# String cache in Redis with the peek/set interface of TTLCache, for values every
+# worker process should share
+class RedisCache:
+    def __init__(self, redis_client, prefix: str, ttl: float):
+        self.redis = redis_client
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def peek(self, key):
+        value = self.redis.get(f"{self.prefix}:{key}")
+        metrics.inc('cache_lookups_total', cache=self.prefix, result='hit' if value is not None else 'miss')
+        return value.decode() if value is not None else None
+
+    def set(self, key, value) -> None:
+        self.redis.set(f"{self.prefix}:{key}", value, ex=max(1, int(self.ttl)))
+
+    def invalidate(self, key) -> None:
+        self.redis.delete(f"{self.prefix}:{key}")
 
 # Services
+class NonceManager:
+    NONCE_ERRORS = ('nonce too low', 'replacement transaction underpriced')
+
+    # Initialises the counter from the chain on first use, then allocates atomically
+    _ALLOCATE_SCRIPT = """
+    if redis.call('EXISTS', KEYS[1]) == 0 then
+        if ARGV[2] == '' then
+            return nil
+        end
+        redis.call('SET', KEYS[1], ARGV[2])
+    end
+    local next_nonce = redis.call('INCRBY', KEYS[1], ARGV[1])
+    redis.call('EXPIRE', KEYS[1], ARGV[3])
+    return next_nonce
+    """
+
+    # Sets the counter unless another caller has moved it since; see reset
+    _RESET_SCRIPT = """
+    local current = redis.call('GET', KEYS[1])
+    if current then
+        if ARGV[2] ~= '' and current ~= ARGV[2] then
+            return 0
+        end
+        if ARGV[2] == '' and tonumber(current) >= tonumber(ARGV[1]) then
+            return 0
+        end
+    end
+    redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[3])
+    return 1
+    """
+
+    def __init__(self, redis_client=None, ttl: int = NONCE_CACHE_TTL):
+        self.redis = redis_client
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._address_locks = {}
+        self._nonces = {}  # address -> (next nonce, expires at)
+        if self.redis is not None:
+            self._allocate_script = self.redis.register_script(self._ALLOCATE_SCRIPT)
+            self._reset_script = self.redis.register_script(self._RESET_SCRIPT)
+
+    # Reserves `count` consecutive nonces for `address` and returns the first one
+    def allocate(self, address: str, count: int = 1) -> int:
+        if self.redis is not None:
+            key = f"nonce:{address}"
+            next_nonce = self._allocate_script(keys=[key], args=[count, '', self.ttl])
+            if next_nonce is None:
+                next_nonce = self._allocate_script(keys=[key], args=[count, self.fetch(address), self.ttl])
+            return int(next_nonce) - count
+
+        with self._address_lock(address):
+            entry = self._nonces.get(address)
+            if entry is None or entry[1] < time.monotonic():
+                next_nonce = self.fetch(address)
+            else:
+                next_nonce = entry[0]
+            self._nonces[address] = (next_nonce + count, time.monotonic() + self.ttl)
+            return next_nonce
+
+    def fetch(self, address: str) -> int:
+        return container.w3.eth.get_transaction_count(address, 'pending')
+
+    # Nonces other threads or processes have allocated but not yet broadcast must never be
+    # handed out again. With `expected` (the counter right after the caller's own
+    # allocation) the counter is only set if nobody has allocated since; without, it is
+    # only ever raised. Returns whether the counter was set.
+    def reset(self, address: str, next_nonce: int, expected: int = None) -> bool:
+        if self.redis is not None:
+            return bool(self._reset_script(keys=[f"nonce:{address}"],
+                                           args=[next_nonce, '' if expected is None else expected, self.ttl]))
+        with self._address_lock(address):
+            entry = self._nonces.get(address)
+            current = entry[0] if entry and entry[1] >= time.monotonic() else None
+            if current is not None and (current != expected if expected is not None else current >= next_nonce):
+                return False
+            self._nonces[address] = (next_nonce, time.monotonic() + self.ttl)
+            return True
+
+    def resync(self, address: str, expected: int = None) -> bool:
+        return self.reset(address, self.fetch(address), expected)
+
+    # The next nonce the counter would hand out, or None when it has to be read from the chain
+    def peek(self, address: str):
+        if self.redis is not None:
+            value = self.redis.get(f"nonce:{address}")
+            return int(value) if value is not None else None
+        entry = self._nonces.get(address)
+        return entry[0] if entry and entry[1] >= time.monotonic() else None
+
+    @classmethod
+    def is_nonce_error(cls, error: Exception) -> bool:
+        message = str(error).lower()
+        return any(text in message for text in cls.NONCE_ERRORS)
+
+    def _address_lock(self, address: str) -> threading.Lock:
+        with self._lock:
+            return self._address_locks.setdefault(address, threading.Lock())
+
 class PriceService:
+    @metrics.timed('service', call='PriceService.get_current_price')
     def get_current_price(self) -> Decimal:
-        response = requests.get('https://api.example.com/moji_price')
+        with metrics.timer('http', upstream='price_api'):
+            response = requests.get(PRICE_API_URL, timeout=10)
         if response.status_code == 200:
             data = response.json()
             return Decimal(data['price'])
@@ -99,77 +1347,711 @@ class PriceService:
         price = self.get_current_price()
         return total_supply * price
 
+    @metrics.timed('service', call='PriceService.get_total_supply')
     def get_total_supply(self) -> Decimal:
-        contract = w3.eth.contract(address=MOJI_CONTRACT_ADDRESS, abi=MOJI_CONTRACT_ABI)
-        total_supply = contract.functions.totalSupply().call()
-        return Decimal(total_supply) / Decimal(10**6)  # Assuming 6 decimal places
+        response = container.rpc_client.call('eth_call', [{'to': MOJI_CONTRACT_ADDRESS, 'data': TOTAL_SUPPLY_SELECTOR}, 'latest'])
+        return from_units(read_uint(response, 'total supply'))
+
+    def get_data_age(self) -> float:
+        return 0.0
+
+# Serves price and supply from memory while a background thread keeps them fresh
+class CachedPriceService(PriceService):
+    def __init__(self, refresh_interval: float = PRICE_REFRESH_INTERVAL, ttl: float = PRICE_CACHE_TTL):
+        self.refresh_interval = refresh_interval
+        self.cache = TTLCache(ttl, name='price')
+        self._stop = threading.Event()
+        self._thread = None
+
+    def get_current_price(self) -> Decimal:
+        return self.cache.get('price', super().get_current_price)
+
+    def get_total_supply(self) -> Decimal:
+        return self.cache.get('total_supply', super().get_total_supply)
+
+    def get_data_age(self) -> float:
+        ages = [self.cache.age(key) for key in ('price', 'total_supply')]
+        ages = [age for age in ages if age is not None]
+        return max(ages) if ages else 0.0
+
+    def refresh(self) -> None:
+        for key, loader in (('price', super().get_current_price), ('total_supply', super().get_total_supply)):
+            try:
+                self.cache.set(key, loader())
+            except Exception as e:
+                logger.error(f"Price refresh error for {key}: {str(e)}")
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='price-refresher', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        self.refresh()
+        while not self._stop.wait(self.refresh_interval):
+            self.refresh()
+
+# On-chain MOJI balances keyed by address. Entries are dropped when a Transfer event
+# touches the address or the bot sends from it; the TTL only covers missed events.
+class BalanceCache:
+    def __init__(self, ttl: float = BALANCE_CACHE_TTL, poll_interval: float = BALANCE_EVENT_POLL_INTERVAL,
+                 batch_blocks: int = BALANCE_EVENT_BATCH_BLOCKS):
+        self.cache = TTLCache(ttl, name='balance')
+        self.poll_interval = poll_interval
+        self.batch_blocks = batch_blocks
+        self._stop = threading.Event()
+        self._thread = None
+
+    def get(self, address: str) -> Decimal:
+        return self.cache.get(address, lambda: self._fetch_balance(address))
+
+    def get_many(self, addresses: list) -> dict:
+        balances = {}
+        missing = []
+        for address in addresses:
+            balance = self.cache.peek(address)
+            if balance is None:
+                missing.append(address)
+            else:
+                balances[address] = balance
+
+        for start in range(0, len(missing), BALANCE_BATCH_SIZE):
+            for address, balance in self._fetch_balances(missing[start:start + BALANCE_BATCH_SIZE]).items():
+                self.cache.set(address, balance)
+                balances[address] = balance
+        return balances
+
+    def invalidate(self, *addresses) -> None:
+        for address in addresses:
+            self.cache.invalidate(address)
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='balance-invalidator', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        last_block = None  # set from the head once the node first answers
+        while True:
+            try:
+                head = container.w3.eth.block_number
+                if last_block is None:
+                    last_block = head
+                # After an outage the blocks missed are walked in ranges the provider accepts
+                while last_block < head and not self._stop.is_set():
+                    to_block = min(last_block + self.batch_blocks, head)
+                    logs = container.w3.eth.get_logs({
+                        'address': MOJI_CONTRACT_ADDRESS,
+                        'fromBlock': last_block + 1,
+                        'toBlock': to_block,
+                        'topics': [TRANSFER_EVENT_TOPIC],
+                    })
+                    for log in logs:
+                        self.invalidate(*[container.w3.toChecksumAddress('0x' + topic.hex()[-40:]) for topic in log['topics'][1:3]])
+                    last_block = to_block
+            except Exception as e:
+                logger.error(f"Balance invalidation error: {str(e)}")
+            if self._stop.wait(self.poll_interval):
+                return
+
+    @staticmethod
+    def _fetch_balance(address: str) -> Decimal:
+        return from_units(read_uint(container.rpc_client.call(*balance_of_call(address)), f"balance for {address}"))
+
+    # Reads many balances with a single JSON-RPC batch request
+    @staticmethod
+    def _fetch_balances(addresses: list) -> dict:
+        results = container.rpc_client.batch([balance_of_call(address) for address in addresses])
+        return {address: from_units(read_uint(item, f"balance for {address}")) for address, item in zip(addresses, results)}
+
+# Follows broadcast transfers until they are mined. All pending hashes are checked once
+# per new block with batched eth_getTransactionReceipt requests, so the RPC cost depends
+# on the number of blocks, not the number of transfers in flight.
+class ConfirmationTracker:
+    NOTIFY = {
+        'confirmed': ('✅', 'confirmed', ('withdraw', 'tip_sent')),
+        'failed': ('❌', 'failed on chain', ('withdraw', 'tip_sent', 'drip_sent')),
+        'dropped': ('❌', 'was dropped by the network', ('withdraw', 'tip_sent', 'drip_sent')),
+        'stuck': ('⚠️', 'has not been mined and is no longer being re-broadcast', ('withdraw', 'tip_sent', 'drip_sent')),
+    }
+    LABELS = {'withdraw': 'Withdrawal', 'tip_sent': 'Tip', 'drip_sent': 'Drip transfer'}
+
+    def __init__(self, poll_interval: float = TX_POLL_INTERVAL, confirmations: int = TX_CONFIRMATIONS,
+                 stuck_after: float = TX_STUCK_AFTER, max_rebroadcasts: int = TX_MAX_REBROADCASTS,
+                 stuck_poll_interval: float = TX_STUCK_POLL_INTERVAL, nonce_manager: NonceManager = None):
+        self.poll_interval = poll_interval
+        self.confirmations = confirmations
+        self.stuck_after = stuck_after
+        self.max_rebroadcasts = max_rebroadcasts
+        self.stuck_poll_interval = stuck_poll_interval
+        self.nonce_manager = nonce_manager
+        self.bot = None
+        self.session = container.session_factory()  # the tracker thread must not share the handlers' session
+        self._lock = threading.Lock()
+        # tx_hash -> {'raw': signed tx or None, 'sent_at', 'rebroadcasts', 'stuck', 'next_check'}. Stuck
+        # transfers stay here, checked every stuck_poll_interval, until a receipt settles them.
+        self._pending = {}
+        self._last_block = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    # Call once the transfer's ledger rows are committed, so settling always finds them
+    def track(self, tx_hash: str, raw_transaction=None, stuck: bool = False) -> None:
+        if hasattr(raw_transaction, 'hex'):
+            raw_transaction = raw_transaction.hex()
+        with self._lock:
+            self._pending.setdefault(tx_hash, {'raw': raw_transaction, 'sent_at': time.time(), 'rebroadcasts': 0,
+                                               'stuck': stuck, 'next_check': 0.0})
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def start(self, bot=None, load: bool = True) -> None:
+        if self._thread is not None:
+            return
+        self.bot = bot
+        self._thread = threading.Thread(target=self._run, args=(load,), name='confirmation-tracker', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self, load: bool = False) -> None:
+        # Transfers sent meanwhile are tracked as usual while the database is unreachable
+        while load:
+            try:
+                self._load()
+                break
+            except Exception as e:
+                self.session.rollback()
+                logger.error(f"Could not load pending transfers, retrying: {str(e)}")
+                if self._stop.wait(self.poll_interval):
+                    return
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.poll_once()
+            except Exception as e:
+                self.session.rollback()
+                logger.error(f"Confirmation tracker error: {str(e)}")
+
+    def poll_once(self) -> None:
+        now = time.time()
+        with self._lock:
+            hashes = [h for h, entry in self._pending.items() if not entry['stuck'] or entry['next_check'] <= now]
+        if not hashes:
+            return
+        head = container.w3.eth.block_number
+        if head == self._last_block:
+            return
+
+        receipts = self._receipts(hashes)
+        settled = {'confirmed': [], 'failed': []}
+        unmined = []
+        for tx_hash in hashes:
+            receipt = receipts[tx_hash]
+            if receipt is None:
+                unmined.append(tx_hash)
+            elif int(receipt['blockNumber'], 16) + self.confirmations - 1 <= head:
+                settled['confirmed' if int(receipt['status'], 16) == 1 else 'failed'].append(tx_hash)
+        with self._lock:
+            for tx_hash in unmined:
+                if self._pending[tx_hash]['stuck']:
+                    self._pending[tx_hash]['next_check'] = now + self.stuck_poll_interval
+            stuck = [h for h in unmined if self._pending[h]['stuck']]
+            unmined = [h for h in unmined if not self._pending[h]['stuck']]
+        settled.update(self._handle_unmined(unmined))
+        self._last_block = head
+
+        for status, settled_hashes in settled.items():
+            if settled_hashes:
+                self._settle(settled_hashes, status)
+        if stuck or settled.get('stuck'):
+            self._close_gaps(stuck + settled.get('stuck', []))
+
+    def _receipts(self, hashes: list) -> dict:
+        receipts = {}
+        for start in range(0, len(hashes), RECEIPT_BATCH_SIZE):
+            chunk = hashes[start:start + RECEIPT_BATCH_SIZE]
+            for tx_hash, item in zip(chunk, self._rpc_batch('eth_getTransactionReceipt', [[h] for h in chunk])):
+                if 'error' in item:
+                    raise Exception(f"Unable to fetch receipt for {tx_hash}: {item['error']}")
+                receipts[tx_hash] = item['result']
+        return receipts
+
+    # Re-broadcasts transfers that have waited too long, in one batch, and gives up on
+    # the ones that were replaced or have used up their retries
+    def _handle_unmined(self, hashes: list) -> dict:
+        now = time.time()
+        with self._lock:
+            overdue = [(h, self._pending[h]) for h in hashes if now - self._pending[h]['sent_at'] >= self.stuck_after]
+        self._recover_raw([(h, entry) for h, entry in overdue if not entry['raw'] and entry['rebroadcasts'] < self.max_rebroadcasts])
+        retry = [(h, entry) for h, entry in overdue if entry['raw'] and entry['rebroadcasts'] < self.max_rebroadcasts]
+        retrying = {h for h, _ in retry}
+        settled = {'stuck': [h for h, _ in overdue if h not in retrying], 'dropped': []}
+
+        replaced = []
+        for start in range(0, len(retry), RECEIPT_BATCH_SIZE):
+            chunk = retry[start:start + RECEIPT_BATCH_SIZE]
+            for (tx_hash, entry), item in zip(chunk, self._rpc_batch('eth_sendRawTransaction', [[e['raw']] for _, e in chunk])):
+                error = str(item.get('error', ''))
+                if 'nonce too low' in error.lower():
+                    replaced.append(tx_hash)
+                    continue
+                if error:
+                    logger.warning(f"Re-broadcast of {tx_hash} failed: {error}")
+                entry['sent_at'] = now
+                entry['rebroadcasts'] += 1
+
+        # A transfer mined since its receipt was checked gets "nonce too low" back as well;
+        # only those still without a receipt lost their nonce to another transaction
+        if replaced:
+            receipts = self._receipts(replaced)
+            settled['dropped'] = [h for h in replaced if receipts[h] is None]
+        return settled
+
+    # A stuck transfer above the sender's mined nonce, with nothing pending below it, waits
+    # on a nonce that was handed out but never broadcast. Moving the sender's counter back
+    # to the chain lets the next transfer fill the gap.
+    def _close_gaps(self, hashes: list) -> None:
+        if self.nonce_manager is None:
+            return
+        lowest = {}
+        for start in range(0, len(hashes), RECEIPT_BATCH_SIZE):
+            chunk = hashes[start:start + RECEIPT_BATCH_SIZE]
+            for item in self._rpc_batch('eth_getTransactionByHash', [[h] for h in chunk]):
+                transaction = item.get('result')
+                if transaction:
+                    sender = container.w3.toChecksumAddress(transaction['from'])
+                    lowest[sender] = min(int(transaction['nonce'], 16), lowest.get(sender, float('inf')))
+        for sender, nonce in lowest.items():
+            latest = container.w3.eth.get_transaction_count(sender, 'latest')
+            if nonce > latest and self.nonce_manager.fetch(sender) == latest:
+                counter = self.nonce_manager.peek(sender)
+                if counter is not None and counter > latest and self.nonce_manager.reset(sender, latest, expected=counter):
+                    logger.warning(f"Nonce gap for {sender} at {latest}; resynced the nonce counter from {counter}")
+
+    # Transfers reloaded after a restart have no signed bytes. A node that still holds
+    # one in its mempool can hand it back, so it can be re-broadcast like the others.
+    def _recover_raw(self, missing: list) -> None:
+        for start in range(0, len(missing), RECEIPT_BATCH_SIZE):
+            chunk = missing[start:start + RECEIPT_BATCH_SIZE]
+            for (_, entry), item in zip(chunk, self._rpc_batch('eth_getRawTransactionByHash', [[h] for h, _ in chunk])):
+                if item.get('result'):
+                    entry['raw'] = item['result']
+
+    # A restarted shard worker follows transfers another worker may also be following; the
+    # row lock and status filter make sure each transfer is settled and announced once
+    def _settle(self, hashes: list, status: str) -> None:
+        transactions = []
+        for start in range(0, len(hashes), RECEIPT_BATCH_SIZE):
+            transactions.extend(self.session.query(Transaction).options(selectinload(Transaction.user)).filter(
+                Transaction.tx_hash.in_(hashes[start:start + RECEIPT_BATCH_SIZE]),
+                Transaction.status.in_(('pending',) if status == 'stuck' else ('pending', 'stuck')),
+            ).with_for_update().all())
+        for transaction in transactions:
+            transaction.status = status
+        if status in ('failed', 'dropped'):
+            Ledger.reverse(self.session, transactions)
+        self.session.commit()
+
+        with self._lock:
+            for tx_hash in hashes:
+                if status != 'stuck':
+                    self._pending.pop(tx_hash, None)
+                elif tx_hash in self._pending:
+                    self._pending[tx_hash].update(stuck=True, next_check=time.time() + self.stuck_poll_interval)
+        if status != 'confirmed':
+            logger.warning(f"{len(hashes)} transfers {status}")
+        self._notify(transactions, status)
+
+    def _notify(self, transactions: list, status: str) -> None:
+        icon, outcome, types = self.NOTIFY[status]
+        if self.bot is None:
+            return
+
+        # One message per user and transfer type, however many transfers settled
+        grouped = {}
+        for transaction in transactions:
+            if transaction.transaction_type in types and transaction.user:
+                grouped.setdefault((transaction.user.telegram_id, transaction.transaction_type), []).append(transaction)
+        for (telegram_id, transaction_type), group in grouped.items():
+            label = self.LABELS[transaction_type]
+            total = from_units(sum(abs(t.amount_units) for t in group))
+            if len(group) == 1:
+                text = f"{icon} {label} of {total} MOJI {outcome}. Transaction hash: {group[0].tx_hash}"
+            else:
+                text = f"{icon} {len(group)} {label.lower()}s totalling {total} MOJI {outcome}."
+            try:
+                self.bot.send_message(chat_id=int(telegram_id), text=text, priority=OutboundScheduler.NOTIFICATION)
+            except Exception as e:
+                logger.error(f"Confirmation notice to {telegram_id} failed: {str(e)}")
+
+    # Picks up transfers that were still pending or stuck when the bot last stopped. Drip
+    # transfers keep their signed bytes in the database; the others are recovered from a
+    # node's mempool if they need a re-broadcast.
+    def _load(self) -> None:
+        rows = dict(self.session.query(Transaction.tx_hash, Transaction.status).filter(
+            Transaction.status.in_(('pending', 'stuck')), Transaction.tx_hash.isnot(None)
+        ).distinct())
+        hashes = list(rows)
+        raw = {}
+        for start in range(0, len(hashes), RECEIPT_BATCH_SIZE):
+            raw.update(self.session.query(DripRecipient.tx_hash, DripRecipient.raw_transaction).filter(
+                DripRecipient.tx_hash.in_(hashes[start:start + RECEIPT_BATCH_SIZE])
+            ).all())
+        self.session.rollback()
+        for tx_hash in hashes:
+            self.track(tx_hash, raw.get(tx_hash), stuck=rows[tx_hash] == 'stuck')
+        if hashes:
+            logger.info(f"Tracking {len(hashes)} pending transfers")
+
+    @staticmethod
+    def _rpc_batch(method: str, params: list) -> list:
+        return container.rpc_client.batch([(method, p) for p in params])
+
+def generate_encrypted_key() -> tuple:
+    from eth_account import Account
+
+    account = Account.create()
+    private_key = account.privateKey.hex()
+    return account.address, private_key, container.fernet.encrypt(private_key.encode()).decode()
+
+# Keypairs for /enchant, generated ahead of time in batches by a separate worker process
+# (`python Mojibot.py keypool refill`), so a burst of new users costs one row claim each
+# instead of key generation and encryption inside the request.
+class KeyPool:
+    CLAIM_ATTEMPTS = 5
+
+    def __init__(self, target: int = KEY_POOL_TARGET, batch_size: int = KEY_POOL_BATCH_SIZE):
+        self.target = target
+        self.batch_size = batch_size
+        self._worker = None
+
+    # Removes one key from the pool inside the caller's transaction and returns
+    # (address, encrypted private key), or None when the pool is empty. SKIP LOCKED lets
+    # concurrent claims on Postgres pass each other; the rowcount check covers the rest.
+    def claim(self, session):
+        for _ in range(self.CLAIM_ATTEMPTS):
+            key = session.query(PooledKey).order_by(PooledKey.id).with_for_update(skip_locked=True).first()
+            if key is None:
+                return None
+            key_id, claimed = key.id, (key.address, key.encrypted_private_key)
+            session.expunge(key)
+            if session.query(PooledKey).filter_by(id=key_id).delete(synchronize_session=False):
+                return claimed
+        return None
+
+    def size(self, session) -> int:
+        return session.query(PooledKey).count()
+
+    # Inserts (address, encrypted private key) pairs; keys already pooled are skipped
+    def add(self, session, keys: list) -> None:
+        rows = [{'address': address, 'encrypted_private_key': encrypted, 'created_at': datetime.utcnow()}
+                for address, encrypted in keys]
+        if not rows:
+            return
+        insert = dialect_insert(session, PooledKey.__table__)
+        if insert is not None:
+            session.execute(insert.on_conflict_do_nothing(index_elements=['address']), rows)
+            return
+        known = {row[0] for row in session.query(PooledKey.address).filter(PooledKey.address.in_([r['address'] for r in rows]))}
+        session.bulk_insert_mappings(PooledKey, [row for row in rows if row['address'] not in known])
+
+    def refill(self, session) -> int:
+        missing = self.target - self.size(session)
+        added = 0
+        while added < missing:
+            count = min(self.batch_size, missing - added)
+            self.add(session, [(address, encrypted) for address, _, encrypted in
+                               (generate_encrypted_key() for _ in range(count))])
+            session.commit()
+            added += count
+        return max(added, 0)
+
+    def import_keys(self, session, lines) -> int:
+        from cryptography.fernet import InvalidToken
+        from eth_account import Account
+
+        # JSON lines with an address and either encrypted_private_key or a plain private_key.
+        # Every key is checked against its address, so the pool never hands out a wallet
+        # the bot cannot sign for.
+        keys = []
+        for line in lines:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            if 'private_key' in item:
+                account = Account.from_key(item['private_key'])
+                encrypted_private_key = container.fernet.encrypt(account.privateKey.hex().encode()).decode()
+            else:
+                encrypted_private_key = item['encrypted_private_key']
+                try:
+                    account = Account.from_key(container.fernet.decrypt(encrypted_private_key.encode()).decode())
+                except InvalidToken:
+                    raise ValueError(f"Key for {item['address']} is not encrypted with this ENCRYPTION_KEY")
+            if account.address != container.w3.toChecksumAddress(item['address']):
+                raise ValueError(f"Private key does not match {item['address']}")
+            keys.append((account.address, encrypted_private_key))
+        for start in range(0, len(keys), self.batch_size):
+            self.add(session, keys[start:start + self.batch_size])
+        session.commit()
+        return len(keys)
+
+    # Keys stay encrypted with ENCRYPTION_KEY; an export is only usable by a bot sharing it
+    def export_keys(self, session, out) -> int:
+        count = 0
+        for key in session.query(PooledKey).order_by(PooledKey.id).yield_per(self.batch_size):
+            out.write(json.dumps({'address': key.address, 'encrypted_private_key': key.encrypted_private_key}) + "\n")
+            count += 1
+        return count
+
+    # Runs the refill loop in its own process, so key generation never competes with
+    # the bot's handlers for the GIL
+    def start_worker(self) -> None:
+        if self._worker is not None or self.target <= 0:
+            return
+        self._worker = subprocess.Popen([sys.executable, os.path.abspath(__file__), 'keypool', 'refill'])
+        atexit.register(self._worker.terminate)
+
+# Decrypted signing accounts for recently used wallets, so heavy tippers and drips skip
+# the Fernet decryption and key derivation on every transfer. An account lives at most
+# `ttl` seconds after decryption and the least recently used are evicted past max_size.
+# Accounts are leased, so one evicted mid-drip is only wiped once the drip lets go of it.
+class SignerCache:
+    def __init__(self, ttl: float = SIGNER_CACHE_TTL, max_size: int = SIGNER_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # address -> entry dict, least recently used first
+        self._stop = threading.Event()
+        self._thread = None
+
+    @contextmanager
+    def lease(self, wallet: Wallet):
+        entry = self._acquire(wallet)
+        try:
+            yield entry['account']
+        finally:
+            with self._lock:
+                entry['leases'] -= 1
+                if entry['evicted'] and not entry['leases']:
+                    self._wipe(entry)
+
+    def invalidate(self, address: str) -> None:
+        with self._lock:
+            if address in self._entries:
+                self._evict(address)
+
+    def purge_expired(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            for address in [a for a, entry in self._entries.items() if now - entry['loaded_at'] >= self.ttl]:
+                self._evict(address)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='signer-cache-sweeper', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        with self._lock:
+            for address in list(self._entries):
+                self._evict(address)
+
+    # Expired keys are dropped even when their wallet goes quiet
+    def _run(self) -> None:
+        while not self._stop.wait(min(self.ttl, 10)):
+            self.purge_expired()
+
+    def _acquire(self, wallet: Wallet) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(wallet.address)
+            if entry and now - entry['loaded_at'] < self.ttl:
+                self._entries.move_to_end(wallet.address)
+                entry['leases'] += 1
+                self.hits += 1
+                return entry
+            if entry:
+                self._evict(wallet.address)
+            self.misses += 1
+
+        from eth_account import Account
+        account = Account.from_key(container.fernet.decrypt(wallet.encrypted_private_key.encode()).decode())
+        entry = {'account': account, 'loaded_at': now, 'leases': 1, 'evicted': False}
+        with self._lock:
+            if wallet.address in self._entries:
+                self._evict(wallet.address)
+            self._entries[wallet.address] = entry
+            while len(self._entries) > max(self.max_size, 0):
+                self._evict(next(iter(self._entries)))
+        return entry
+
+    # Caller holds the lock
+    def _evict(self, address: str) -> None:
+        entry = self._entries.pop(address)
+        entry['evicted'] = True
+        self.evictions += 1
+        if not entry['leases']:
+            self._wipe(entry)
+
+    # Python cannot overwrite the immutable key bytes held by eth_account, so the best
+    # we can do is clear the account's references to them: any straggling reference
+    # becomes unusable and the key can be collected.
+    @staticmethod
+    def _wipe(entry: dict) -> None:
+        account = entry['account']
+        account._private_key = None
+        account._key_obj = None
 
 class WalletService:
+    def __init__(self, nonce_manager: NonceManager = None, balance_cache: BalanceCache = None,
+                 confirmation_tracker: ConfirmationTracker = None, signer_cache: SignerCache = None,
+                 key_pool: KeyPool = None):
+        self.nonce_manager = nonce_manager or NonceManager(container.redis)
+        self.balance_cache = balance_cache or BalanceCache()
+        self.confirmation_tracker = confirmation_tracker or ConfirmationTracker(nonce_manager=self.nonce_manager)
+        self.signer_cache = signer_cache or SignerCache()
+        self.key_pool = key_pool or KeyPool()
+
+    @metrics.timed('service', call='WalletService.create_wallet')
     def create_wallet(self, user_id: int) -> dict:
-        account = Account.create()
-        private_key = account.privateKey.hex()
-        encrypted_private_key = fernet.encrypt(private_key.encode()).decode()
-        address = account.address
-        
-        user = db_session.query(User).filter_by(telegram_id=str(user_id)).first()
-        if not user:
-            user = User(telegram_id=str(user_id))
-            db_session.add(user)
-        
+        user = upsert_user(db_session, str(user_id))
+
+        claimed = self.key_pool.claim(db_session)
+        if claimed:
+            address, encrypted_private_key = claimed
+            private_key = container.fernet.decrypt(encrypted_private_key.encode()).decode()
+        else:
+            logger.warning("Wallet key pool is empty; generating a key inline")
+            address, private_key, encrypted_private_key = generate_encrypted_key()
+
+        # The claim and the new wallet commit together, so a failure returns the key to the pool
         wallet = Wallet(user=user, address=address, encrypted_private_key=encrypted_private_key)
         db_session.add(wallet)
         db_session.commit()
         
         return {"private_key": private_key, "address": address}
 
+    @metrics.timed('service', call='WalletService.get_balance')
     def get_balance(self, user_id: int) -> Decimal:
         user = db_session.query(User).filter_by(telegram_id=str(user_id)).first()
         if user and user.wallet:
-            contract = w3.eth.contract(address=MOJI_CONTRACT_ADDRESS, abi=MOJI_CONTRACT_ABI)
-            balance = contract.functions.balanceOf(user.wallet.address).call()
-            return Decimal(balance) / Decimal(10**6)  # Assuming 6 decimal places
+            return self.get_wallet_balance(user.wallet)
         return Decimal('0')
 
+    def get_wallet_balance(self, wallet: Wallet) -> Decimal:
+        if wallet is None:
+            return Decimal('0')
+        return self.balance_cache.get(wallet.address)
+
+    def get_balances(self, addresses: list) -> dict:
+        return self.balance_cache.get_many(addresses)
+
+    @metrics.timed('service', call='WalletService.withdraw')
     def withdraw(self, user_id: int, amount: Decimal, to_address: str) -> str:
         user = db_session.query(User).filter_by(telegram_id=str(user_id)).first()
         if not user or not user.wallet:
             return "Wallet not found. Please use /enchant to create a wallet."
 
-        if not w3.isAddress(to_address):
+        if not container.w3.isAddress(to_address):
             return "Invalid unicorn1 wallet address."
 
-        balance = self.get_balance(user_id)
+        balance = self.get_wallet_balance(user.wallet)
         if balance < amount:
             return f"Insufficient balance. Your current balance is {balance} MOJI."
 
         try:
-            contract = w3.eth.contract(address=MOJI_CONTRACT_ADDRESS, abi=MOJI_CONTRACT_ABI)
-            private_key = fernet.decrypt(user.wallet.encrypted_private_key.encode()).decode()
-            
-            nonce = w3.eth.get_transaction_count(user.wallet.address)
-            txn = contract.functions.transfer(
-                to_address,
-                int(amount * Decimal(10**6))
-            ).buildTransaction({
-                'chainId': 1,  # Mainnet. Change if using a different network
-                'gas': 100000,
-                'gasPrice': w3.eth.gas_price,
-                'nonce': nonce,
-            })
-            
-            signed_txn = w3.eth.account.sign_transaction(txn, private_key)
-            tx_hash = w3.eth.send_raw_transaction(signed_txn.rawTransaction)
-            
+            tx_hash, raw_transaction = self.transfer(user.wallet, to_address, amount)
+
             # Record the transaction
-            transaction = Transaction(user=user, amount=-float(amount), transaction_type='withdraw')
-            db_session.add(transaction)
+            Ledger.record(db_session, [(user.id, -to_units(amount), 'withdraw', tx_hash.hex())])
             db_session.commit()
+            self.confirmation_tracker.track(tx_hash.hex(), raw_transaction)
             
             return f"Withdrawal of {amount} MOJI to {to_address} initiated. Transaction hash: {tx_hash.hex()}"
         except Exception as e:
             logger.error(f"Withdrawal error: {str(e)}")
             return "An error occurred during withdrawal. Please try again later."
 
+    # Returns (tx hash, signed transaction); the caller tracks it once its ledger rows are committed
+    @metrics.timed('service', call='WalletService.transfer')
+    def transfer(self, wallet: Wallet, to_address: str, amount: Decimal) -> tuple:
+        # A cached nonce can go stale if the key is used outside the bot; resync and retry once.
+        # Other errors leave the counter alone: the node may have taken the transaction anyway.
+        for attempt in range(2):
+            nonce = self.nonce_manager.allocate(wallet.address)
+            raw_transaction = self.sign_transfer(wallet, to_address, amount, nonce, container.w3.eth.gas_price)
+            try:
+                tx_hash = container.w3.eth.send_raw_transaction(raw_transaction)
+            except Exception as e:
+                if self.is_already_known(e):
+                    tx_hash = container.w3.keccak(raw_transaction)
+                elif NonceManager.is_nonce_error(e):
+                    if attempt:
+                        raise
+                    self.nonce_manager.resync(wallet.address, expected=nonce + 1)
+                    continue
+                else:
+                    # The nonce was never used, so hand it back unless another send took a later one
+                    if self.was_rejected(e):
+                        self.nonce_manager.reset(wallet.address, nonce, expected=nonce + 1)
+                    raise
+            self.balance_cache.invalidate(wallet.address, to_address)
+            return tx_hash, raw_transaction
+
+    # The node already has this exact transaction, so it was broadcast after all
+    @staticmethod
+    def is_already_known(error) -> bool:
+        return 'already known' in str(error).lower()
+
+    # A node answered with an error, or none could be reached. A write that timed out after
+    # reaching a node, or that the caller stopped waiting for, may still be mined.
+    @staticmethod
+    def was_rejected(error) -> bool:
+        return not isinstance(error, (WriteOutcomeUnknown, FutureTimeoutError))
+
+    # Pure CPU work (decryption, encoding, signing); makes no RPC calls
+    @metrics.timed('service', call='WalletService.sign_transfer')
+    def sign_transfer(self, wallet: Wallet, to_address: str, amount: Decimal, nonce: int, gas_price: int) -> bytes:
+        contract = container.moji_contract
+        txn = contract.functions.transfer(
+            to_address,
+            to_units(amount)
+        ).buildTransaction({
+            'chainId': 1,  # Mainnet. Change if using a different network
+            'gas': 100000,
+            'gasPrice': gas_price,
+            'nonce': nonce,
+        })
+        with self.signer_cache.lease(wallet) as account:
+            return account.sign_transaction(txn).rawTransaction
+
 class ChartService:
     def __init__(self, base_url: str = CHART_BASE_URL):
         self.base_url = base_url
@@ -177,122 +2059,681 @@ class ChartService:
     def get_chart_url(self) -> str:
         return f"{self.base_url}/chart/moji"
 
+# Signs every transfer of a drip up front and broadcasts them in a bounded window.
+# Signed transactions are persisted before broadcast, so a partially failed drip
+# can be resumed without paying anyone twice.
+class DripEngine:
+    def __init__(self, nonce_manager: NonceManager, balance_cache: BalanceCache, window: int = DRIP_BROADCAST_WINDOW,
+                 confirmation_tracker: ConfirmationTracker = None):
+        self.nonce_manager = nonce_manager
+        self.balance_cache = balance_cache
+        self.window = window
+        self.confirmation_tracker = confirmation_tracker
+
+    @metrics.timed('service', call='DripEngine.run')
+    def run(self, drip: Drip, account) -> None:
+        sender_address = drip.sender.wallet.address
+        pending = [r for r in drip.recipients if r.status != 'sent']
+        # Transfers an interrupted attempt broadcast and that have been mined since only
+        # need recording; ones still in the mempool are re-broadcast as they are by _sign
+        mined = [r for r in pending if self._mined(r)]
+        sent = self._record_sent(drip, mined)
+        pending = [r for r in pending if r not in mined]
+        if pending:
+            self._sign(drip, pending, sender_address, account)
+            sent += self._broadcast(drip, pending)
+
+        drip.status = 'completed' if all(r.status == 'sent' for r in drip.recipients) else 'partial'
+        db_session.commit()
+        if self.confirmation_tracker:
+            for recipient in sent:
+                self.confirmation_tracker.track(recipient.tx_hash, recipient.raw_transaction)
+
+    @staticmethod
+    def _mined(recipient: DripRecipient) -> bool:
+        from web3.exceptions import TransactionNotFound
+
+        if not recipient.tx_hash:
+            return False
+        try:
+            return container.w3.eth.get_transaction(recipient.tx_hash)['blockNumber'] is not None
+        except TransactionNotFound:
+            return False
+
+    # Marks the recipients sent and adds their ledger rows; the caller commits
+    @staticmethod
+    def _record_sent(drip: Drip, recipients: list) -> list:
+        ledger_rows = []
+        for recipient in recipients:
+            recipient.status = 'sent'
+            recipient.error = None
+            ledger_rows.append((drip.sender_id, -drip.amount_per_user_units, 'drip_sent', recipient.tx_hash))
+            ledger_rows.append((recipient.user_id, drip.amount_per_user_units, 'drip_received', recipient.tx_hash))
+        Ledger.record(db_session, ledger_rows, chat_id=drip.chat_id)
+        return recipients
+
+    # Every transfer is signed with the one decrypted account
+    def _sign(self, drip: Drip, recipients: list, sender_address: str, account) -> None:
+        contract = container.moji_contract
+        gas_price = container.w3.eth.gas_price
+        value = drip.amount_per_user_units
+
+        # Transactions signed by an earlier attempt keep their nonce while it is still
+        # unmined; rebroadcasting them fills any gap left by the failure, and the ones
+        # already in a mempool come back "already known".
+        reusable = []
+        if any(r.raw_transaction for r in recipients):
+            chain_nonce = container.w3.eth.get_transaction_count(sender_address, 'latest')
+            reusable = [r for r in recipients if r.raw_transaction and r.nonce is not None and r.nonce >= chain_nonce]
+            self.nonce_manager.reset(sender_address, max([chain_nonce] + [r.nonce + 1 for r in reusable]))
+
+        next_nonce = self.nonce_manager.allocate(sender_address, len(recipients) - len(reusable))
+        for recipient in recipients:
+            if recipient in reusable:
+                continue
+            txn = contract.functions.transfer(recipient.address, value).buildTransaction({
+                'chainId': 1,  # Mainnet. Change if using a different network
+                'gas': 100000,
+                'gasPrice': gas_price,
+                'nonce': next_nonce,
+            })
+            signed_txn = account.sign_transaction(txn)
+            recipient.nonce = next_nonce
+            recipient.tx_hash = signed_txn.hash.hex()
+            recipient.raw_transaction = signed_txn.rawTransaction.hex()
+            recipient.status = 'signed'
+            next_nonce += 1
+
+        # Persist the signed transactions before anything reaches the network
+        db_session.commit()
+
+    # Returns the recipients whose transfer went out
+    def _broadcast(self, drip: Drip, recipients: list) -> list:
+        with ThreadPoolExecutor(max_workers=self.window) as executor:
+            errors = list(executor.map(self._send_raw, [r.raw_transaction for r in recipients]))
+
+        if any(error and NonceManager.is_nonce_error(error) for error in errors):
+            self.nonce_manager.resync(drip.sender.wallet.address, expected=max(r.nonce for r in recipients) + 1)
+        self.balance_cache.invalidate(drip.sender.wallet.address, *[r.address for r in recipients])
+
+        for recipient, error in zip(recipients, errors):
+            if error:
+                logger.error(f"Drip {drip.id} transfer to {recipient.address} failed: {error}")
+                recipient.status = 'failed'
+                recipient.error = error
+        return self._record_sent(drip, [r for r, error in zip(recipients, errors) if not error])
+
+    @staticmethod
+    def _send_raw(raw_transaction: str):
+        try:
+            container.w3.eth.send_raw_transaction(raw_transaction)
+            return None
+        except Exception as e:
+            if WalletService.is_already_known(e):
+                return None
+            return str(e)
+
+# Records who was seen chatting in memory and writes last_active / username back to
+# the users table in one bulk UPDATE per flush interval.
+class ActivityTracker:
+    FLUSH_CHUNK_SIZE = 500
+    REDIS_KEY = 'activity:last_seen'  # sorted set of telegram_id scored by last sighting
+
+    # With Redis, sightings are also flushed to a sorted set so that every worker
+    # process sees who is active, not only the chats routed to it
+    def __init__(self, redis_client=None, flush_interval: float = ACTIVITY_FLUSH_INTERVAL, window_days: int = ACTIVE_USER_DAYS):
+        self.redis = redis_client
+        self.flush_interval = flush_interval
+        self.window = timedelta(days=window_days)
+        self._lock = threading.Lock()
+        self._pending = {}  # telegram_id -> (seen at, username) not yet written
+        self._last_seen = None  # telegram_id -> seen at, loaded lazily from the database
+        self._seeded = False  # whether the shared sorted set has been checked for seeding
+        self._stop = threading.Event()
+        self._thread = None
+
+    def record(self, telegram_id, username: str = None, seen_at: datetime = None) -> None:
+        telegram_id = str(telegram_id)
+        seen_at = seen_at or datetime.utcnow()
+        with self._lock:
+            previous = self._pending.get(telegram_id)
+            self._pending[telegram_id] = (seen_at, username or (previous and previous[1]))
+            if self._last_seen is not None:
+                self._last_seen[telegram_id] = seen_at
+
+    def active_user_ids(self, days: int = ACTIVE_USER_DAYS) -> list:
+        cutoff = datetime.utcnow() - timedelta(days=days)
+        if self.redis is not None:
+            self._seed_shared()
+            shared = {member.decode() for member in self.redis.zrangebyscore(self.REDIS_KEY, self._score(cutoff), '+inf')}
+            with self._lock:
+                shared.update(telegram_id for telegram_id, (seen_at, _) in self._pending.items() if seen_at > cutoff)
+            return list(shared)
+        self._load()
+        with self._lock:
+            return [telegram_id for telegram_id, seen_at in self._last_seen.items() if seen_at > cutoff]
+
+    def flush(self) -> int:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            if self._last_seen is not None:
+                cutoff = datetime.utcnow() - self.window
+                self._last_seen = {key: seen_at for key, seen_at in self._last_seen.items() if seen_at > cutoff}
+        if not pending:
+            return 0
+
+        if self.redis is not None:
+            try:
+                pipeline = self.redis.pipeline(transaction=False)
+                pipeline.zadd(self.REDIS_KEY, {key: self._score(seen_at) for key, (seen_at, _) in pending.items()}, gt=True)
+                pipeline.zremrangebyscore(self.REDIS_KEY, '-inf', self._score(datetime.utcnow() - self.window))
+                pipeline.execute()
+            except Exception as e:
+                logger.error(f"Activity flush to Redis failed: {str(e)}")
+
+        session = container.session_factory()
+        try:
+            items = list(pending.items())
+            for start in range(0, len(items), self.FLUSH_CHUNK_SIZE):
+                chunk = dict(items[start:start + self.FLUSH_CHUNK_SIZE])
+                values = {'last_active': case({key: seen_at for key, (seen_at, _) in chunk.items()}, value=User.telegram_id)}
+                usernames = {key: username for key, (_, username) in chunk.items() if username}
+                if usernames:
+                    values['username'] = case(usernames, value=User.telegram_id, else_=User.username)
+                session.query(User).filter(User.telegram_id.in_(chunk.keys())).update(values, synchronize_session=False)
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Activity flush error: {str(e)}")
+            # Put the sightings back unless newer ones arrived in the meantime
+            with self._lock:
+                for key, value in pending.items():
+                    self._pending.setdefault(key, value)
+            return 0
+        finally:
+            session.close()
+        return len(pending)
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='activity-flusher', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self.flush()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def _load(self) -> None:
+        if self._last_seen is not None:
+            return
+        rows = self._recent_rows()
+        with self._lock:
+            if self._last_seen is None:
+                self._last_seen = {telegram_id: last_active for telegram_id, last_active in rows}
+                for telegram_id, (seen_at, _) in self._pending.items():
+                    self._last_seen[telegram_id] = max(seen_at, self._last_seen.get(telegram_id, seen_at))
+
+    # The first process to need the shared set fills it from the database
+    def _seed_shared(self) -> None:
+        if self._seeded:
+            return
+        if not self.redis.exists(self.REDIS_KEY):
+            rows = self._recent_rows()
+            if rows:
+                self.redis.zadd(self.REDIS_KEY, {telegram_id: self._score(last_active) for telegram_id, last_active in rows}, nx=True)
+        self._seeded = True
+
+    def _recent_rows(self) -> list:
+        session = container.session_factory()
+        try:
+            return session.query(User.telegram_id, User.last_active).filter(User.last_active > datetime.utcnow() - self.window).all()
+        finally:
+            session.close()
+
+    # Sorted set score for a naive UTC datetime, independent of the host's timezone
+    @staticmethod
+    def _score(seen_at: datetime) -> float:
+        return (seen_at - datetime(1970, 1, 1)).total_seconds()
+
 class TippingService:
-    def __init__(self, wallet_service: WalletService):
+    def __init__(self, wallet_service: WalletService, drip_engine: DripEngine = None, activity_tracker: ActivityTracker = None):
         self.wallet_service = wallet_service
+        self.drip_engine = drip_engine or DripEngine(wallet_service.nonce_manager, wallet_service.balance_cache,
+                                                     confirmation_tracker=wallet_service.confirmation_tracker)
+        self.activity_tracker = activity_tracker or ActivityTracker(container.redis)
 
-    def send_tip(self, sender_id: int, recipient: str, amount: Decimal) -> str:
+    @metrics.timed('service', call='TippingService.send_tip')
+    def send_tip(self, sender_id: int, recipient: str, amount: Decimal, chat_id: str = None) -> str:
         sender = db_session.query(User).filter_by(telegram_id=str(sender_id)).first()
         recipient = db_session.query(User).filter_by(username=recipient).first()
 
         if not sender or not recipient:
             return "Sender or recipient not found."
 
-        sender_balance = self.wallet_service.get_balance(sender_id)
+        sender_balance = self.wallet_service.get_wallet_balance(sender.wallet)
         if sender_balance < amount:
             return f"Insufficient balance. Your current balance is {sender_balance} MOJI."
 
         try:
-            contract = w3.eth.contract(address=MOJI_CONTRACT_ADDRESS, abi=MOJI_CONTRACT_ABI)
-            sender_private_key = fernet.decrypt(sender.wallet.encrypted_private_key.encode()).decode()
-            
-            nonce = w3.eth.get_transaction_count(sender.wallet.address)
-            txn = contract.functions.transfer(
-                recipient.wallet.address,
-                int(amount * Decimal(10**6))
-            ).buildTransaction({
-                'chainId': 1,  # Mainnet. Change if using a different network
-                'gas': 100000,
-                'gasPrice': w3.eth.gas_price,
-                'nonce': nonce,
-            })
-            
-            signed_txn = w3.eth.account.sign_transaction(txn, sender_private_key)
-            tx_hash = w3.eth.send_raw_transaction(signed_txn.rawTransaction)
-            
+            tx_hash, raw_transaction = self.wallet_service.transfer(sender.wallet, recipient.wallet.address, amount)
+
             # Record the transactions
-            sender_transaction = Transaction(user=sender, amount=-float(amount), transaction_type='tip_sent')
-            recipient_transaction = Transaction(user=recipient, amount=float(amount), transaction_type='tip_received')
-            db_session.add(sender_transaction)
-            db_session.add(recipient_transaction)
+            Ledger.record(db_session, [
+                (sender.id, -to_units(amount), 'tip_sent', tx_hash.hex()),
+                (recipient.id, to_units(amount), 'tip_received', tx_hash.hex()),
+            ], chat_id=chat_id)
             db_session.commit()
+            self.wallet_service.confirmation_tracker.track(tx_hash.hex(), raw_transaction)
             
             return f"Sent {amount} MOJI to @{recipient.username}. Transaction hash: {tx_hash.hex()}"
         except Exception as e:
             logger.error(f"Tipping error: {str(e)}")
             return "An error occurred while sending the tip. Please try again later."
 
-    def drip_tip(self, sender_id: int, amount: Decimal) -> str:
+    @metrics.timed('service', call='TippingService.drip_tip')
+    def drip_tip(self, sender_id: int, amount: Decimal, chat_id: str = None) -> str:
         sender = db_session.query(User).filter_by(telegram_id=str(sender_id)).first()
         if not sender:
             return "Sender not found."
 
-        active_users = db_session.query(User).filter(User.wallet != None, User.last_active > (datetime.utcnow() - timedelta(days=7))).all()
-        active_user_count = len(active_users) - 1  # Exclude sender
+        active_ids = [telegram_id for telegram_id in self.activity_tracker.active_user_ids() if telegram_id != sender.telegram_id]
+        recipients = []
+        for start in range(0, len(active_ids), ActivityTracker.FLUSH_CHUNK_SIZE):
+            chunk = active_ids[start:start + ActivityTracker.FLUSH_CHUNK_SIZE]
+            users = db_session.query(User).options(selectinload(User.wallet)).filter(User.telegram_id.in_(chunk)).all()
+            recipients.extend(user for user in users if user.wallet)
+        active_user_count = len(recipients)
 
         if active_user_count == 0:
             return "No active users to drip tip."
 
-        amount_per_user = (amount / active_user_count).quantize(Decimal('0.000001'))
+        amount_per_user = from_units(to_units(amount / active_user_count))
         total_amount = amount_per_user * active_user_count
 
-        sender_balance = self.wallet_service.get_balance(sender_id)
+        sender_balance = self.wallet_service.get_wallet_balance(sender.wallet)
         if sender_balance < total_amount:
             return f"Insufficient balance for drip tipping. You need at least {total_amount} MOJI."
 
+        drip = Drip(sender=sender, amount_per_user_units=to_units(amount_per_user), chat_id=chat_id)
+        db_session.add(drip)
+        db_session.flush()
+        db_session.bulk_insert_mappings(DripRecipient, [
+            {'drip_id': drip.id, 'user_id': user.id, 'address': user.wallet.address}
+            for user in recipients
+        ])
+        db_session.commit()
+
+        return self._run_drip(sender, drip)
+
+    @metrics.timed('service', call='TippingService.resume_drip')
+    def resume_drip(self, sender_id: int, drip_id: int) -> str:
+        sender = db_session.query(User).filter_by(telegram_id=str(sender_id)).first()
+        drip = db_session.query(Drip).filter_by(id=drip_id).first()
+        if not sender or not drip or drip.sender_id != sender.id:
+            return "Drip not found."
+        if drip.status == 'completed':
+            return "This drip has already been delivered to every recipient."
+
+        return self._run_drip(sender, drip)
+
+    def _run_drip(self, sender: User, drip: Drip) -> str:
+        drip_id = drip.id
+        if not self._claim(drip_id):
+            return f"Drip {drip_id} is still being sent. Use /drip resume {drip_id} once it has finished."
         try:
-            contract = w3.eth.contract(address=MOJI_CONTRACT_ADDRESS, abi=MOJI_CONTRACT_ABI)
-            sender_private_key = fernet.decrypt(sender.wallet.encrypted_private_key.encode()).decode()
-            
-            for user in active_users:
-                if user.id != sender.id:
-                    nonce = w3.eth.get_transaction_count(sender.wallet.address)
-                    txn = contract.functions.transfer(
-                        user.wallet.address,
-                        int(amount_per_user * Decimal(10**6))
-                    ).buildTransaction({
-                        'chainId': 1,  # Mainnet. Change if using a different network
-                        'gas': 100000,
-                        'gasPrice': w3.eth.gas_price,
-                        'nonce': nonce,
-                    })
-                    
-                    signed_txn = w3.eth.account.sign_transaction(txn, sender_private_key)
-                    tx_hash = w3.eth.send_raw_transaction(signed_txn.rawTransaction)
-                    
-                    # Record the transactions
-                    sender_transaction = Transaction(user=sender, amount=-float(amount_per_user), transaction_type='drip_sent')
-                    recipient_transaction = Transaction(user=user, amount=float(amount_per_user), transaction_type='drip_received')
-                    db_session.add(sender_transaction)
-                    db_session.add(recipient_transaction)
-            
-            db_session.commit()
-            return f"🌧️ Drip tip of {amount_per_user} MOJI sent to {active_user_count} users successfully!"
+            with self.wallet_service.signer_cache.lease(sender.wallet) as account:
+                self.drip_engine.run(drip, account)
         except Exception as e:
+            db_session.rollback()
             logger.error(f"Drip tipping error: {str(e)}")
-            return "An error occurred during drip tipping. Please try again later."
+            self._release(drip_id)
+            return f"An error occurred during drip tipping. Use /drip resume {drip_id} to try again later."
+
+        sent = sum(1 for r in drip.recipients if r.status == 'sent')
+        if drip.status != 'completed':
+            return (f"🌧️ Drip tip of {from_units(drip.amount_per_user_units)} MOJI reached {sent} of {len(drip.recipients)} users. "
+                    f"Use /drip resume {drip.id} to retry the rest.")
+        return f"🌧️ Drip tip of {from_units(drip.amount_per_user_units)} MOJI sent to {sent} users successfully!"
+
+    # Only one run of a drip at a time: two runs would both record the transfers the other
+    # broadcast. A claim older than DRIP_CLAIM_TIMEOUT belongs to a run that died.
+    @staticmethod
+    def _claim(drip_id: int) -> bool:
+        now = datetime.utcnow()
+        claimed = db_session.query(Drip).filter(Drip.id == drip_id, or_(
+            Drip.status.in_(('pending', 'partial')),
+            and_(Drip.status == 'running', Drip.claimed_at < now - timedelta(seconds=DRIP_CLAIM_TIMEOUT)),
+        )).update({'status': 'running', 'claimed_at': now}, synchronize_session=False)
+        db_session.commit()
+        return claimed == 1
+
+    # DripEngine.run sets the final status; a run that failed hands the drip back for a resume
+    @staticmethod
+    def _release(drip_id: int) -> None:
+        try:
+            db_session.query(Drip).filter_by(id=drip_id, status='running').update({'status': 'partial'}, synchronize_session=False)
+            db_session.commit()
+        except Exception as e:
+            db_session.rollback()
+            logger.error(f"Could not release drip {drip_id}: {str(e)}")
+
+# Per-group tipping emoji and its compiled pattern, so ordinary chat messages are
+# rejected from memory instead of costing a DB round trip and a regex compile each.
+class GroupSettingsCache:
+    def __init__(self, ttl: float = GROUP_CACHE_TTL):
+        self.cache = TTLCache(ttl, name='group_settings')
+
+    def get(self, chat_id) -> tuple:
+        return self.cache.get(str(chat_id), lambda: self._load(str(chat_id)))
+
+    def peek(self, chat_id):
+        return self.cache.peek(str(chat_id))
+
+    def store(self, chat_id, tipping_emoji: str) -> tuple:
+        settings = (tipping_emoji, self.compile(tipping_emoji))
+        self.cache.set(str(chat_id), settings)
+        return settings
+
+    def invalidate(self, chat_id) -> None:
+        self.cache.invalidate(str(chat_id))
+
+    @staticmethod
+    @functools.lru_cache(maxsize=256)
+    def compile(tipping_emoji: str):
+        return re.compile(rf"(?P<amount>\d+(\.\d{{1,6}})?)?\s*{re.escape(tipping_emoji)}\s*@(?P<recipient>\w+)")
+
+    @staticmethod
+    def _load(chat_id: str) -> tuple:
+        group = db_session.query(Group).filter_by(telegram_id=chat_id).first()
+        if not group:
+            group = Group(telegram_id=chat_id)
+            db_session.add(group)
+            db_session.commit()
+        return (group.tipping_emoji, GroupSettingsCache.compile(group.tipping_emoji))
+
+# The group of a chat for the tip and drip records, None for a private chat
+def group_chat_id(update: Update):
+    return str(update.effective_chat.id) if update.effective_chat.type in ('group', 'supergroup') else None
+
+# Renders /top and /stats from the GroupStats aggregates and keeps the text for
+# GROUP_STATS_CACHE_TTL, so a busy group asking repeatedly costs one query per interval.
+# Takes the session to read with, so the async mode can pass its own via run_sync.
+class GroupStatsService:
+    MAX_DAYS = 365
+
+    def __init__(self, ttl: float = GROUP_STATS_CACHE_TTL, top: int = GROUP_STATS_TOP):
+        self.top = top
+        # With Redis configured, every worker process serves the same rendered stats
+        if container.redis is not None:
+            self.cache = RedisCache(container.redis, 'group_stats', ttl)
+        else:
+            self.cache = TTLCache(ttl, name='group_stats')
+
+    @staticmethod
+    def parse_days(args: list) -> int:
+        if not args:
+            return GROUP_STATS_DAYS
+        if len(args) != 1 or not args[0].isdigit() or not 1 <= int(args[0]) <= GroupStatsService.MAX_DAYS:
+            raise ValueError(f"Days must be a number from 1 to {GroupStatsService.MAX_DAYS}.")
+        return int(args[0])
+
+    def leaderboard(self, session, chat_id, days: int) -> str:
+        return self._cached(f"top:{chat_id}:{days}", lambda: self._render_leaderboard(session, str(chat_id), days))
+
+    def summary(self, session, chat_id) -> str:
+        return self._cached(f"stats:{chat_id}", lambda: self._render_summary(session, str(chat_id)))
+
+    def _cached(self, key: str, render) -> str:
+        text = self.cache.peek(key)
+        if text is None:
+            text = render()
+            self.cache.set(key, text)
+        return text
+
+    def _render_leaderboard(self, session, chat_id: str, days: int) -> str:
+        since = GroupStats.bucket_start(datetime.utcnow(), 'day') - timedelta(days=days - 1)
+        period = "today" if days == 1 else f"last {days} days"
+        lines = []
+        for title, column in (("🏆 Top tippers", GroupTipperStats.sent_units),
+                              ("🎁 Top receivers", GroupTipperStats.received_units)):
+            total = func.sum(column)
+            rows = session.query(User.username, total).join(User, User.id == GroupTipperStats.user_id).filter(
+                GroupTipperStats.chat_id == chat_id,
+                GroupTipperStats.day >= since,
+            ).group_by(GroupTipperStats.user_id, User.username).having(total > 0).order_by(total.desc()).limit(self.top).all()
+            lines.append(f"{title}, {period}:")
+            lines.extend(f"{rank}. {'@' + username if username else 'anonymous'} - {from_units(units)} MOJI"
+                         for rank, (username, units) in enumerate(rows, 1))
+            if not rows:
+                lines.append("No tips yet.")
+            lines.append("")
+        return "\n".join(lines).strip()
+
+    def _render_summary(self, session, chat_id: str) -> str:
+        now = datetime.utcnow()
+        today = GroupStats.bucket_start(now, 'day')
+
+        def volume(*filters) -> str:
+            tip_units, tips, drip_units, drips = session.query(*(
+                func.coalesce(func.sum(getattr(GroupTipVolume, column)), 0) for column in GroupStats.VOLUME_COUNTERS
+            )).filter(GroupTipVolume.chat_id == chat_id, *filters).one()
+            return f"{from_units(tip_units)} MOJI in {tips} tips, {from_units(drip_units)} MOJI dripped in {drips} transfers"
+
+        last_day = volume(GroupTipVolume.period == 'hour',
+                          GroupTipVolume.bucket_start > GroupStats.bucket_start(now, 'hour') - timedelta(hours=24))
+        all_time = volume(GroupTipVolume.period == 'day')
+        days = session.query(GroupTipVolume).filter(
+            GroupTipVolume.chat_id == chat_id,
+            GroupTipVolume.period == 'day',
+            GroupTipVolume.bucket_start > today - timedelta(days=GROUP_STATS_DAYS),
+        ).order_by(GroupTipVolume.bucket_start.desc()).all()
+
+        lines = ["📊 Group tipping stats",
+                 f"Last 24h: {last_day}",
+                 f"All time: {all_time}",
+                 "",
+                 "Per day (UTC):"]
+        lines.extend(f"{bucket.bucket_start:%Y-%m-%d}: {from_units(bucket.tip_units)} MOJI tipped, "
+                     f"{from_units(bucket.drip_units)} MOJI dripped" for bucket in days)
+        if not days:
+            lines.append(f"No tips in the last {GROUP_STATS_DAYS} days.")
+        return "\n".join(lines)
+
+# Token buckets keyed by user or chat id. Idle buckets refill to full and are dropped
+# once the table grows past max_keys, so one-off senders do not accumulate.
+class RateLimiter:
+    def __init__(self, rate_per_minute: float, burst: int, max_keys: int = 10000):
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._buckets = {}  # key -> (tokens, updated at)
+
+    def allow(self, key) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated_at) * self.rate)
+            allowed = tokens >= 1
+            self._buckets[key] = (tokens - 1 if allowed else tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets = {k: v for k, v in self._buckets.items()
+                                 if v[0] + (now - v[1]) * self.rate < self.burst}
+            return allowed
+
+# RateLimiter with the buckets in Redis, so a limit holds across worker processes
+class RedisRateLimiter:
+    _ALLOW_SCRIPT = """
+    local rate, burst, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+    local state = redis.call('HMGET', KEYS[1], 'tokens', 'at')
+    local tokens = tonumber(state[1]) or burst
+    tokens = math.min(burst, tokens + math.max(0, now - (tonumber(state[2]) or now)) * rate)
+    local allowed = 0
+    if tokens >= 1 then
+        tokens = tokens - 1
+        allowed = 1
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'at', tostring(now))
+    redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+    return allowed
+    """
+
+    def __init__(self, redis_client, prefix: str, rate_per_minute: float, burst: int):
+        self.redis = redis_client
+        self.prefix = prefix
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        self._allow_script = redis_client.register_script(self._ALLOW_SCRIPT)
+
+    def allow(self, key) -> bool:
+        return bool(self._allow_script(keys=[f"{self.prefix}:{key}"], args=[self.rate, self.burst, time.time()]))
+
+# Default AI backend: OpenAI-compatible completions (Together.ai, or a local stub via
+# AI_API_BASE). Any object with complete(prompt) -> (text, tokens used) can replace it.
+class CompletionBackend:
+    def __init__(self, model: str = AI_REPLY_MODEL, max_tokens: int = 50, api_base: str = AI_API_BASE):
+        self.model = model
+        self.max_tokens = max_tokens
+        self.api_base = api_base
+
+    def complete(self, prompt: str) -> tuple:
+        options = {'api_base': self.api_base} if self.api_base else {}
+        with metrics.timer('http', upstream='completions'):
+            response = container.openai.Completion.create(model=self.model, prompt=prompt, max_tokens=self.max_tokens,
+                                                          request_timeout=AI_REPLY_TIMEOUT, **options)
+        usage = response.get('usage') or {}
+        return response.choices[0].text.strip(), usage.get('total_tokens', 0)
+
+# Answers unknown commands off the update workers. Requests are rate limited per user
+# and per chat, served from a cache keyed by the normalized command, and queued for a
+# small worker pool; when the queue is full the user gets a canned reply instead.
+class AIReplyService:
+    CANNED_REPLIES = (
+        "That's not a command I know, but I admire the confidence. Try /help!",
+        "Nice try! That command doesn't exist (yet). /help has the real ones.",
+        "My crystal ball can't find that command. Use /help to see what I can do.",
+    )
+    ERROR_REPLY = "Oops, something went wrong. Even AI can have bad days!"
+
+    def __init__(self, backend=None, workers: int = AI_REPLY_WORKERS, queue_size: int = AI_REPLY_QUEUE_SIZE,
+                 user_limiter: RateLimiter = None, chat_limiter: RateLimiter = None, cache_ttl: float = AI_REPLY_CACHE_TTL):
+        self.backend = backend or CompletionBackend()
+        self.workers = workers
+        # With Redis configured, limits and cached replies are shared by every worker process
+        if container.redis is not None:
+            self.user_limiter = user_limiter or RedisRateLimiter(container.redis, 'ai:user', AI_USER_RATE_PER_MINUTE, AI_USER_BURST)
+            self.chat_limiter = chat_limiter or RedisRateLimiter(container.redis, 'ai:chat', AI_CHAT_RATE_PER_MINUTE, AI_CHAT_BURST)
+            self.cache = RedisCache(container.redis, 'ai:reply', cache_ttl)
+        else:
+            self.user_limiter = user_limiter or RateLimiter(AI_USER_RATE_PER_MINUTE, AI_USER_BURST)
+            self.chat_limiter = chat_limiter or RateLimiter(AI_CHAT_RATE_PER_MINUTE, AI_CHAT_BURST)
+            self.cache = TTLCache(cache_ttl, name='ai_reply')
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.counters = dict.fromkeys(('requests', 'cache_hits', 'rate_limited', 'fallbacks', 'completions',
+                                       'errors', 'tokens', 'latency_total', 'latency_max'), 0)
+        self._lock = threading.Lock()
+        self._threads = []
+
+    # Returns at once; deliver(text) is called with the reply, possibly from a worker thread.
+    # Rate-limited requests get no reply at all, cached or not, so spamming costs neither
+    # API calls nor messages. A cache hit only saves the API call.
+    def submit(self, text: str, user_id, chat_id, deliver) -> None:
+        self._count('requests')
+        if not self.user_limiter.allow(user_id) or not self.chat_limiter.allow(chat_id):
+            self._count('rate_limited')
+            return
+        key = self.normalize(text)
+        cached = self.cache.peek(key)
+        if cached is not None:
+            self._count('cache_hits')
+            deliver(cached)
+            return
+        try:
+            self.queue.put_nowait((key, deliver))
+        except queue.Full:
+            self._count('fallbacks')
+            deliver(random.choice(self.CANNED_REPLIES))
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        command = text.split()[0] if text.split() else text
+        return command.split('@')[0].lower()[:32]
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.counters)
+        stats['latency_avg'] = stats['latency_total'] / stats['completions'] if stats['completions'] else 0.0
+        stats['cost_usd'] = stats['tokens'] / 1000 * AI_COST_PER_1K_TOKENS
+        stats['queued'] = self.queue.qsize()
+        return stats
+
+    def start(self) -> None:
+        if self._threads:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f'ai-reply-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _run(self) -> None:
+        while True:
+            key, deliver = self.queue.get()
+            try:
+                deliver(self._reply(key))
+            except Exception as e:
+                logger.error(f"Error delivering AI reply: {str(e)}")
+            finally:
+                self.queue.task_done()
+
+    def _reply(self, key: str) -> str:
+        # An identical command may have been answered while this one waited in the queue
+        cached = self.cache.peek(key)
+        if cached is not None:
+            self._count('cache_hits')
+            return cached
+        started = time.perf_counter()
+        try:
+            reply, tokens = self.backend.complete(
+                f"A user entered an invalid command: {key}. Respond with a sassy but friendly message."
+            )
+        except Exception as e:
+            self._count('errors')
+            logger.error(f"Error in process_invalid_command: {str(e)}")
+            return self.ERROR_REPLY
+        latency = time.perf_counter() - started
+        with self._lock:
+            self.counters['completions'] += 1
+            self.counters['tokens'] += tokens
+            self.counters['latency_total'] += latency
+            self.counters['latency_max'] = max(self.counters['latency_max'], latency)
+        self.cache.set(key, reply)
+        return reply
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.counters[name] += 1
 
 class EmojiTippingSystem:
-    def __init__(self, tipping_service: TippingService):
+    def __init__(self, tipping_service: TippingService, group_settings: GroupSettingsCache = None,
+                 reply_service: AIReplyService = None):
         self.tipping_service = tipping_service
+        self.group_settings = group_settings or GroupSettingsCache()
+        self.reply_service = reply_service or AIReplyService()
 
     def process_emoji_tip(self, update: Update, context: CallbackContext) -> None:
-        group_id = update.effective_chat.id
         sender_id = update.effective_user.id
         message_text = update.message.text
 
-        group = db_session.query(Group).filter_by(telegram_id=str(group_id)).first()
-        if not group:
-            group = Group(telegram_id=str(group_id))
-            db_session.add(group)
-            db_session.commit()
-
-        group_emoji = group.tipping_emoji
+        group_emoji, pattern = self.group_settings.get(update.effective_chat.id)
         if group_emoji not in message_text:
             return  # Not a tipping message
 
-        pattern = rf"(?P<amount>\d+(\.\d{{1,6}})?)?\s*{re.escape(group_emoji)}\s*@(?P<recipient>\w+)"
-        match = re.search(pattern, message_text)
+        match = pattern.search(message_text)
         if not match:
             update.message.reply_text("Invalid tipping format. Use: [amount] emoji @recipient")
             return
@@ -302,58 +2743,258 @@ class EmojiTippingSystem:
 
         try:
             amount = Decimal(amount_str) if amount_str else Decimal('1')
-            result = self.tipping_service.send_tip(sender_id, recipient, amount)
+            result = self.tipping_service.send_tip(sender_id, recipient, amount, chat_id=group_chat_id(update))
             update.message.reply_text(result)
         except InvalidOperation:
             update.message.reply_text("Invalid amount. Please enter a valid number.")
         except Exception as e:
+            logger.error(f"Error in process_emoji_tip: {str(e)}")
             update.message.reply_text("An error occurred while processing the tip.")
 
+    # Emoji only, with their modifiers, joiners and variation selectors. Letters, digits or
+    # punctuation would let ordinary messages through the emoji check and draw format errors.
+    @staticmethod
+    def is_tipping_emoji(text: str) -> bool:
+        import unicodedata
+
+        categories = [unicodedata.category(char) for char in text]
+        return 'So' in categories and all(category in ('So', 'Sk', 'Mn', 'Me', 'Cf') for category in categories)
+
+    def set_tipping_emoji(self, chat_id, tipping_emoji: str) -> None:
+        group = db_session.query(Group).filter_by(telegram_id=str(chat_id)).first()
+        if not group:
+            group = Group(telegram_id=str(chat_id))
+            db_session.add(group)
+        group.tipping_emoji = tipping_emoji
+        db_session.commit()
+        self.group_settings.invalidate(chat_id)
+
     def process_invalid_command(self, update: Update, context: CallbackContext) -> None:
+        self.reply_service.submit(update.message.text, update.effective_user.id, update.effective_chat.id,
+                                  update.message.reply_text)
+
+# Every outgoing Telegram message goes through one queue that keeps to the Bot API flood
+# limits: a global message rate, a minimum interval per chat (longer for groups) and at
+# most one message in flight per chat, so order within a chat is kept. Interactive
+# replies go ahead of notifications and broadcasts, RetryAfter pauses only the chat it
+# came from, and broadcasts that share a merge key are folded into one message while
+# they wait.
+class OutboundScheduler:
+    INTERACTIVE, NOTIFICATION, BROADCAST = 0, 1, 2
+    MAX_MESSAGE_LENGTH = 4096
+    MAX_IDLE_CHATS = 10000
+
+    def __init__(self, bot: Bot, global_rate: float = TELEGRAM_GLOBAL_RATE, chat_interval: float = TELEGRAM_CHAT_INTERVAL,
+                 group_interval: float = TELEGRAM_GROUP_INTERVAL, workers: int = TELEGRAM_SEND_WORKERS,
+                 max_attempts: int = TELEGRAM_SEND_ATTEMPTS):
+        self.bot = bot
+        self.global_rate = global_rate
+        self.chat_interval = chat_interval
+        self.group_interval = group_interval
+        self.max_attempts = max_attempts
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='telegram-send')
+        self.counters = dict.fromkeys(('queued', 'sent', 'merged', 'retry_after', 'retried', 'dropped'), 0)
+        self._cond = threading.Condition()
+        self._chats = {}  # chat_id -> {'queue': heap of messages, 'next_at': ..., 'busy': ..., 'ready_key': ...}
+        self._ready = []  # (priority, seq, chat_id) of chats that may send now; stale entries are skipped
+        self._timers = []  # (next_at, chat_id) of chats waiting out their interval or a RetryAfter
+        self._mergeable = {}  # (chat_id, merge_key) -> queued message that later ones can join
+        self._tokens = max(1.0, global_rate / 3)
+        self._tokens_at = time.monotonic()
+        self._seq = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def submit(self, chat_id, text: str, priority: int = INTERACTIVE, merge_key: str = None, **kwargs) -> None:
+        chat_id = int(chat_id)
+        with self._cond:
+            self.counters['queued'] += 1
+            if merge_key:
+                queued = self._mergeable.get((chat_id, merge_key))
+                if queued and len(queued['text']) + len(text) + 1 <= self.MAX_MESSAGE_LENGTH:
+                    queued['text'] += "\n" + text
+                    self.counters['merged'] += 1
+                    return
+            self._seq += 1
+            message = {'seq': self._seq, 'priority': priority, 'text': text, 'kwargs': kwargs,
+                       'merge_key': merge_key, 'attempts': 0}
+            if merge_key:
+                self._mergeable[(chat_id, merge_key)] = message
+            if chat_id not in self._chats and len(self._chats) >= self.MAX_IDLE_CHATS:
+                self._prune(time.monotonic())
+            chat = self._chats.setdefault(chat_id, {'queue': [], 'next_at': 0.0, 'busy': False,
+                                                    'ready_key': None, 'timer_at': None})
+            heapq.heappush(chat['queue'], (priority, message['seq'], message))
+            self._schedule(chat_id, chat, time.monotonic())
+            self._cond.notify()
+
+    def pending_count(self) -> int:
+        with self._cond:
+            return sum(len(chat['queue']) for chat in self._chats.values())
+
+    def stats(self) -> dict:
+        with self._cond:
+            return dict(self.counters, pending=sum(len(chat['queue']) for chat in self._chats.values()))
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='outbound-scheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        with self._cond:
+            self._cond.notify()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            with self._cond:
+                now = time.monotonic()
+                while self._timers and self._timers[0][0] <= now:
+                    _, chat_id = heapq.heappop(self._timers)
+                    chat = self._chats[chat_id]
+                    chat['timer_at'] = None
+                    self._schedule(chat_id, chat, now)
+
+                self._tokens = min(max(1.0, self.global_rate / 3), self._tokens + (now - self._tokens_at) * self.global_rate)
+                self._tokens_at = now
+                picked = self._pick() if self._tokens >= 1 else None
+                if picked is None:
+                    timeouts = [self._timers[0][0] - now] if self._timers else []
+                    if self._ready and self._tokens < 1:
+                        timeouts.append((1 - self._tokens) / self.global_rate)
+                    self._cond.wait(min(timeouts) if timeouts else None)
+                    continue
+                self._tokens -= 1
+            chat_id, message = picked
+            self.executor.submit(self._send, chat_id, message)
+
+    # Caller holds the lock
+    def _pick(self):
+        while self._ready:
+            priority, seq, chat_id = heapq.heappop(self._ready)
+            chat = self._chats[chat_id]
+            if chat['ready_key'] != (priority, seq):
+                continue
+            chat['ready_key'] = None
+            _, _, message = heapq.heappop(chat['queue'])
+            chat['busy'] = True
+            if message['merge_key'] and self._mergeable.get((chat_id, message['merge_key'])) is message:
+                del self._mergeable[(chat_id, message['merge_key'])]
+            return chat_id, message
+        return None
+
+    # Caller holds the lock. Puts the chat on the ready heap or a timer, or leaves it
+    # alone while a message to it is in flight.
+    def _schedule(self, chat_id: int, chat: dict, now: float) -> None:
+        if chat['busy'] or not chat['queue']:
+            return
+        if chat['next_at'] > now:
+            if chat['timer_at'] != chat['next_at']:
+                chat['timer_at'] = chat['next_at']
+                heapq.heappush(self._timers, (chat['next_at'], chat_id))
+            return
+        priority, seq, _ = chat['queue'][0]
+        if chat['ready_key'] != (priority, seq):
+            chat['ready_key'] = (priority, seq)
+            heapq.heappush(self._ready, (priority, seq, chat_id))
+
+    def _send(self, chat_id: int, message: dict) -> None:
+        delay = 0.0
+        started = time.perf_counter()
         try:
-            response = openai.Completion.create(
-                model="gpt-3.5-turbo",
-                prompt=f"A user entered an invalid command: {update.message.text}. Respond with a sassy but friendly message.",
-                max_tokens=50
-            )
-            sassy_reply = response.choices[0].text.strip()
-            update.message.reply_text(sassy_reply)
+            self.bot.send_message(chat_id=chat_id, text=message['text'], **message['kwargs'])
+            outcome = 'sent'
+        except RetryAfter as e:
+            outcome, delay = 'retry_after', float(e.retry_after)
+        except (BadRequest, Unauthorized, ChatMigrated) as e:
+            logger.error(f"Dropping message to {chat_id}: {str(e)}")
+            outcome = 'dropped'
         except Exception as e:
-            logger.error(f"Error in process_invalid_command: {str(e)}")
-            update.message.reply_text("Oops, something went wrong. Even AI can have bad days!")
+            message['attempts'] += 1
+            if message['attempts'] >= self.max_attempts:
+                logger.error(f"Dropping message to {chat_id} after {message['attempts']} attempts: {str(e)}")
+                outcome = 'dropped'
+            else:
+                outcome, delay = 'retried', 2 ** message['attempts']
+
+        metrics.observe('http_seconds', time.perf_counter() - started, upstream='telegram')
+        with self._cond:
+            self.counters[outcome] += 1
+            now = time.monotonic()
+            chat = self._chats[chat_id]
+            chat['busy'] = False
+            interval = self.group_interval if chat_id < 0 else self.chat_interval
+            chat['next_at'] = now + max(interval, delay)
+            if outcome in ('retry_after', 'retried'):
+                heapq.heappush(chat['queue'], (message['priority'], message['seq'], message))
+            self._schedule(chat_id, chat, now)
+            self._cond.notify()
+
+    # Caller holds the lock. Forgets chats with nothing queued whose interval has passed.
+    def _prune(self, now: float) -> None:
+        for chat_id in [chat_id for chat_id, chat in self._chats.items()
+                        if not chat['queue'] and not chat['busy'] and chat['next_at'] <= now]:
+            del self._chats[chat_id]
+
+# python-telegram-bot Bot whose send_message goes through the OutboundScheduler, so
+# Message.reply_text in the handlers is flood-limited without touching every call site.
+# Without a scheduler it sends directly and ignores the scheduling arguments.
+class ScheduledBot(Bot):
+    def __init__(self, *args, scheduler: OutboundScheduler = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.scheduler = scheduler
+
+    def send_message(self, chat_id, text, priority: int = OutboundScheduler.INTERACTIVE, merge_key: str = None, **kwargs):
+        if self.scheduler is None:
+            return super().send_message(chat_id=chat_id, text=text, **kwargs)
+        self.scheduler.submit(chat_id, text, priority, merge_key,
+                              **{key: value for key, value in kwargs.items() if value is not None})
+        return None
 
 # Handlers
 class BotHandlers:
-    def __init__(self, price_service, chart_service, wallet_service, tipping_service, emoji_tipping_system):
-        self.price_service = price_service
-        self.chart_service = chart_service
-        self.wallet_service = wallet_service
-        self.tipping_service = tipping_service
-        self.emoji_tipping_system = emoji_tipping_system
-
-    def start_handler(self, update: Update, context: CallbackContext) -> None:
-        update.message.reply_text("Welcome to Moji Buy Bot! Use /help to see available commands.")
-
-    def help_handler(self, update: Update, context: CallbackContext) -> None:
-        help_text = """
+    HELP_TEXT = """
 Available commands:
 /price - Get current Moji price and market cap
 /chart - Get a link to the Moji price chart
 /send <amount> @<username> - Send a tip to another user
 /balance - Check your Moji balance (only in private chat)
+/mystats - Your tipping totals (only in private chat)
+/top [days] - This group's top tippers and receivers (groups only)
+/stats - This group's tip and drip volume (groups only)
 /drip <amount> - Send a tip to all registered users
+/drip resume <id> - Retry the failed transfers of an earlier drip
 /enchant - Generate wallet keys (only in private chat)
 /withdraw <amount> <address> - Withdraw Moji to a unicorn1 wallet
+/buyalerts on|off - Post new Moji buys in this group (admins only)
+/tipemoji <emoji> - Set this group's tipping emoji (admins only)
 /disclaimer - View the bot's disclaimer
-        """
-        update.message.reply_text(help_text)
+    """
 
-    def disclaimer_handler(self, update: Update, context: CallbackContext) -> None:
-        disclaimer_text = """
+    DISCLAIMER_TEXT = """
 ⚠️ Disclaimer:
 This bot is for informational purposes only. Do not make investment decisions based solely on the information provided by this bot. Always do your own research before investing. The bot creators are not responsible for any financial losses incurred.
-        """
-        update.message.reply_text(disclaimer_text)
+    """
+
+    def __init__(self, price_service, chart_service, wallet_service, tipping_service, emoji_tipping_system,
+                 group_stats: GroupStatsService = None):
+        self.price_service = price_service
+        self.chart_service = chart_service
+        self.wallet_service = wallet_service
+        self.tipping_service = tipping_service
+        self.emoji_tipping_system = emoji_tipping_system
+        self.group_stats = group_stats or GroupStatsService()
+
+    def start_handler(self, update: Update, context: CallbackContext) -> None:
+        update.message.reply_text("Welcome to Moji Buy Bot! Use /help to see available commands.")
+
+    def help_handler(self, update: Update, context: CallbackContext) -> None:
+        update.message.reply_text(self.HELP_TEXT)
+
+    def disclaimer_handler(self, update: Update, context: CallbackContext) -> None:
+        update.message.reply_text(self.DISCLAIMER_TEXT)
 
     def enchant_handler(self, update: Update, context: CallbackContext) -> None:
         if update.effective_chat.type != 'private':
@@ -363,15 +3004,9 @@ This bot is for informational purposes only. Do not make investment decisions ba
         try:
             wallet_info = self.wallet_service.create_wallet(update.effective_user.id)
             update.message.reply_text(
-                f"🔮 Your new wallet has been enchanted!
-
-"
-                f"Address: `{wallet_info['address']}`
-
-"
-                f"Private Key: `{wallet_info['private_key']}`
-
-"
+                f"🔮 Your new wallet has been enchanted!\n\n"
+                f"Address: `{wallet_info['address']}`\n\n"
+                f"Private Key: `{wallet_info['private_key']}`\n\n"
                 "⚠️ IMPORTANT: Store this information securely. It will not be shown again!",
                 parse_mode=ParseMode.MARKDOWN
             )
@@ -390,23 +3025,26 @@ This bot is for informational purposes only. Do not make investment decisions ba
             result = self.wallet_service.withdraw(update.effective_user.id, amount, address)
             update.message.reply_text(result)
         except (ValueError, InvalidOperation) as e:
-            update.message.reply_text(f"Error: {str(e)}
-Usage: /withdraw <amount> <unicorn1 address>")
+            update.message.reply_text(f"Error: {str(e)}\nUsage: /withdraw <amount> <unicorn1 address>")
         except Exception as e:
             logger.error(f"Error in withdraw_handler: {str(e)}")
             update.message.reply_text("An unexpected error occurred. Please try again later.")
 
     def drip_handler(self, update: Update, context: CallbackContext) -> None:
         try:
+            if len(context.args) == 2 and context.args[0] == 'resume':
+                result = self.tipping_service.resume_drip(update.effective_user.id, int(context.args[1]))
+                update.message.reply_text(result)
+                return
+
             if len(context.args) != 1:
                 raise ValueError("Incorrect number of arguments.")
 
             amount = Decimal(context.args[0])
-            result = self.tipping_service.drip_tip(update.effective_user.id, amount)
+            result = self.tipping_service.drip_tip(update.effective_user.id, amount, chat_id=group_chat_id(update))
             update.message.reply_text(result)
         except (ValueError, InvalidOperation) as e:
-            update.message.reply_text(f"Error: {str(e)}
-Usage: /drip <tip amount>")
+            update.message.reply_text(f"Error: {str(e)}\nUsage: /drip <tip amount> or /drip resume <drip id>")
         except Exception as e:
             logger.error(f"Error in drip_handler: {str(e)}")
             update.message.reply_text("An unexpected error occurred. Please try again later.")
@@ -415,7 +3053,8 @@ Usage: /drip <tip amount>")
         try:
             price = self.price_service.get_current_price()
             market_cap = self.price_service.get_market_cap()
-            message = f"💰 Current Moji price: ${price:.6f}\n📊 Market Cap: ${market_cap:.2f}"
+            age = self.price_service.get_data_age()
+            message = f"💰 Current Moji price: ${price:.6f}\n📊 Market Cap: ${market_cap:.2f}\n🕒 Updated {age:.0f}s ago"
             update.message.reply_text(message)
         except Exception as e:
             logger.error(f"Error in price_handler: {str(e)}")
@@ -438,7 +3077,7 @@ Usage: /drip <tip amount>")
 
             recipient = recipient[1:]  # Remove the '@' symbol
 
-            result = self.tipping_service.send_tip(update.effective_user.id, recipient, amount)
+            result = self.tipping_service.send_tip(update.effective_user.id, recipient, amount, chat_id=group_chat_id(update))
             update.message.reply_text(result)
         except (ValueError, InvalidOperation) as e:
             update.message.reply_text(f"Error: {str(e)}\nUsage: /send <tip amount> @<username>")
@@ -458,9 +3097,117 @@ Usage: /drip <tip amount>")
             logger.error(f"Error in balance_handler: {str(e)}")
             update.message.reply_text("Unable to fetch balance. Please try again later.")
 
+    @staticmethod
+    def format_stats(summary) -> str:
+        if not summary:
+            return "📊 No tips, drips or withdrawals yet."
+        return (f"📊 Your Moji totals:\n"
+                f"Tipped: {from_units(summary.sent_units)}\n"
+                f"Received: {from_units(summary.received_units)}\n"
+                f"Dripped: {from_units(summary.dripped_units)}\n"
+                f"Withdrawn: {from_units(summary.withdrawn_units)}\n"
+                f"Transactions: {summary.transaction_count}")
+
+    def mystats_handler(self, update: Update, context: CallbackContext) -> None:
+        if update.effective_chat.type != 'private':
+            update.message.reply_text("Please check your stats in a private message.")
+            return
+
+        try:
+            summary = db_session.query(UserLedgerSummary).join(User).filter(
+                User.telegram_id == str(update.effective_user.id)
+            ).first()
+            update.message.reply_text(self.format_stats(summary))
+        except Exception as e:
+            logger.error(f"Error in mystats_handler: {str(e)}")
+            update.message.reply_text("Unable to fetch your stats. Please try again later.")
+
+    def top_handler(self, update: Update, context: CallbackContext) -> None:
+        if update.effective_chat.type == 'private':
+            update.message.reply_text("Leaderboards are only kept for groups.")
+            return
+
+        try:
+            days = self.group_stats.parse_days(context.args)
+            update.message.reply_text(self.group_stats.leaderboard(db_session, update.effective_chat.id, days))
+        except ValueError as e:
+            update.message.reply_text(f"Error: {str(e)}\nUsage: /top [days]")
+        except Exception as e:
+            logger.error(f"Error in top_handler: {str(e)}")
+            update.message.reply_text("Unable to fetch the leaderboard. Please try again later.")
+
+    def stats_handler(self, update: Update, context: CallbackContext) -> None:
+        if update.effective_chat.type == 'private':
+            update.message.reply_text("Group stats are only kept for groups. Use /mystats for your own totals.")
+            return
+
+        try:
+            update.message.reply_text(self.group_stats.summary(db_session, update.effective_chat.id))
+        except Exception as e:
+            logger.error(f"Error in stats_handler: {str(e)}")
+            update.message.reply_text("Unable to fetch the group stats. Please try again later.")
+
+    def buyalerts_handler(self, update: Update, context: CallbackContext) -> None:
+        if update.effective_chat.type == 'private':
+            update.message.reply_text("Buy alerts can only be enabled in groups.")
+            return
+
+        try:
+            if len(context.args) != 1 or context.args[0] not in ('on', 'off'):
+                raise ValueError("Incorrect arguments.")
+
+            member = context.bot.get_chat_member(update.effective_chat.id, update.effective_user.id)
+            if member.status not in ('administrator', 'creator'):
+                update.message.reply_text("Only group admins can change buy alerts.")
+                return
+
+            chat_id = str(update.effective_chat.id)
+            subscription = db_session.query(BuyAlertSubscription).filter_by(chat_id=chat_id).first()
+            if context.args[0] == 'on' and not subscription:
+                db_session.add(BuyAlertSubscription(chat_id=chat_id))
+            elif context.args[0] == 'off' and subscription:
+                db_session.delete(subscription)
+            db_session.commit()
+            update.message.reply_text(f"🔔 Buy alerts turned {context.args[0]} for this group.")
+        except ValueError as e:
+            update.message.reply_text(f"Error: {str(e)}\nUsage: /buyalerts on|off")
+        except Exception as e:
+            db_session.rollback()
+            logger.error(f"Error in buyalerts_handler: {str(e)}")
+            update.message.reply_text("An unexpected error occurred. Please try again later.")
+
+    def tipemoji_handler(self, update: Update, context: CallbackContext) -> None:
+        if update.effective_chat.type == 'private':
+            update.message.reply_text("The tipping emoji can only be set in groups.")
+            return
+
+        try:
+            if len(context.args) != 1 or len(context.args[0]) > 16:
+                raise ValueError("Incorrect arguments.")
+            if not EmojiTippingSystem.is_tipping_emoji(context.args[0]):
+                raise ValueError("The tipping emoji must be an emoji, without letters, digits or spaces.")
+
+            member = context.bot.get_chat_member(update.effective_chat.id, update.effective_user.id)
+            if member.status not in ('administrator', 'creator'):
+                update.message.reply_text("Only group admins can change the tipping emoji.")
+                return
+
+            self.emoji_tipping_system.set_tipping_emoji(update.effective_chat.id, context.args[0])
+            update.message.reply_text(f"Tipping emoji set to {context.args[0]}. Tip with: [amount] {context.args[0]} @recipient")
+        except ValueError as e:
+            update.message.reply_text(f"Error: {str(e)}\nUsage: /tipemoji <emoji>")
+        except Exception as e:
+            db_session.rollback()
+            logger.error(f"Error in tipemoji_handler: {str(e)}")
+            update.message.reply_text("An unexpected error occurred. Please try again later.")
+
     def unknown_command_handler(self, update: Update, context: CallbackContext) -> None:
         self.emoji_tipping_system.process_invalid_command(update, context)
 
+    def activity_handler(self, update: Update, context: CallbackContext) -> None:
+        if update.effective_user:
+            self.tipping_service.activity_tracker.record(update.effective_user.id, update.effective_user.username)
+
 # Main function to start the bot
 class BuyBotLayout:
     @staticmethod
@@ -474,13 +3221,642 @@ class BuyBotLayout:
 📊 Market Cap: ${transaction['market_cap']:.2f}
         """
 
-def main():
+# Follows Swap events on the MOJI pair and posts each buy to subscribed groups.
+# Progress is checkpointed per alert, so a restart resumes exactly where it stopped.
+class BuyWatcher:
+    CHECKPOINT_NAME = 'buy_watcher'
+
+    def __init__(self, bot, price_service: PriceService, wallet_service: WalletService, pair_address: str = MOJI_PAIR_ADDRESS,
+                 batch_blocks: int = BUY_WATCH_BATCH_BLOCKS, poll_interval: float = BUY_WATCH_POLL_INTERVAL):
+        self.bot = bot
+        self.price_service = price_service
+        self.wallet_service = wallet_service
+        self.pair = container.w3.eth.contract(address=container.w3.toChecksumAddress(pair_address), abi=PAIR_ABI)
+        self.batch_blocks = self.max_batch_blocks = batch_blocks
+        self.poll_interval = poll_interval
+        self.session = container.session_factory()  # the watcher thread must not share the handlers' session
+        self._moji_is_token0 = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='buy-watcher', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                caught_up = self.poll_once()
+            except Exception as e:
+                self.session.rollback()
+                logger.error(f"Buy watcher error: {str(e)}")
+                caught_up = True
+            if caught_up:
+                self._stop.wait(self.poll_interval)
+
+    # Processes one block range and returns True once the watcher has reached the chain head
+    def poll_once(self) -> bool:
+        head = container.w3.eth.block_number - BUY_WATCH_CONFIRMATIONS
+        checkpoint = self._checkpoint(head)
+        if checkpoint.block_number > head:
+            return True
+
+        to_block = min(checkpoint.block_number + self.batch_blocks - 1, head)
+        try:
+            logs = container.w3.eth.get_logs({
+                'address': self.pair.address,
+                'fromBlock': checkpoint.block_number,
+                'toBlock': to_block,
+                'topics': [SWAP_EVENT_TOPIC],
+            })
+        except ValueError as e:
+            # Providers cap the size of a log query; shrink the range and try again
+            if self.batch_blocks > 1:
+                self.batch_blocks = max(1, self.batch_blocks // 2)
+                logger.warning(f"Buy watcher shrinking batch to {self.batch_blocks} blocks: {str(e)}")
+                return False
+            raise
+        self.batch_blocks = min(self.batch_blocks * 2, self.max_batch_blocks)
+
+        logs = sorted(logs, key=lambda log: (log['blockNumber'], log['logIndex']))
+        logs = [log for log in logs if log['blockNumber'] > checkpoint.block_number or log['logIndex'] > checkpoint.log_index]
+        buys = self._decode_buys(logs)
+        if buys:
+            chat_ids = [subscription.chat_id for subscription in self.session.query(BuyAlertSubscription).all()]
+            holdings = self.wallet_service.get_balances(list({buy['buyer'] for buy in buys}))
+            price = self.price_service.get_current_price()
+            market_cap = self.price_service.get_market_cap()
+            for buy in buys:
+                buy.update(buyer_holdings=holdings[buy['buyer']], price=price, market_cap=market_cap)
+                self._publish(chat_ids, buy)
+                checkpoint.block_number = buy['block_number']
+                checkpoint.log_index = buy['log_index']
+                self.session.commit()
+
+        checkpoint.block_number = to_block + 1
+        checkpoint.log_index = -1
+        self.session.commit()
+        return to_block >= head
+
+    def _checkpoint(self, head: int) -> WatcherCheckpoint:
+        checkpoint = self.session.query(WatcherCheckpoint).filter_by(name=self.CHECKPOINT_NAME).first()
+        if not checkpoint:
+            # First run: start from the current head rather than replaying history
+            checkpoint = WatcherCheckpoint(name=self.CHECKPOINT_NAME, block_number=head + 1, log_index=-1)
+            self.session.add(checkpoint)
+            self.session.commit()
+        return checkpoint
+
+    def _decode_buys(self, logs: list) -> list:
+        if self._moji_is_token0 is None:
+            self._moji_is_token0 = self.pair.functions.token0().call() == container.w3.toChecksumAddress(MOJI_CONTRACT_ADDRESS)
+
+        buys = []
+        for log in logs:
+            args = self.pair.events.Swap().processLog(log)['args']
+            if self._moji_is_token0:
+                received, spent = args['amount0Out'], args['amount1In']
+            else:
+                received, spent = args['amount1Out'], args['amount0In']
+            if not received or not spent:
+                continue  # a sell, not a buy
+            buys.append({
+                'buyer': args['to'],
+                'block_number': log['blockNumber'],
+                'log_index': log['logIndex'],
+                'tx_hash': log['transactionHash'].hex(),
+                'spent': Decimal(spent) / Decimal(10**MOJI_QUOTE_DECIMALS),
+                'received': from_units(received),
+            })
+        return buys
+
+    def _publish(self, chat_ids: list, transaction: dict) -> None:
+        message = BuyBotLayout.format_buy_message(transaction)
+        for chat_id in chat_ids:
+            try:
+                self.bot.send_message(chat_id=int(chat_id), text=message,
+                                      priority=OutboundScheduler.BROADCAST, merge_key='buy_alert')
+            except Exception as e:
+                logger.error(f"Unable to post buy alert to {chat_id}: {str(e)}")
+
+# Async execution mode: updates are handled as coroutines on one event loop instead of
+# occupying a worker thread each. Read-only commands await their network I/O; commands
+# that sign, decrypt or write run the regular handlers in a small executor.
+class AsyncTelegramClient:
+    def __init__(self, http: aiohttp.ClientSession, token: str = TELEGRAM_BOT_TOKEN, api_url: str = TELEGRAM_API_URL):
+        self.http = http
+        self.base_url = f"{api_url}/bot{token}"
+
+    async def call(self, method: str, **params):
+        with metrics.timer('http', upstream='telegram'):
+            async with self.http.post(f"{self.base_url}/{method}", json=params) as response:
+                data = await response.json()
+        if not data.get('ok'):
+            raise Exception(f"Telegram {method} failed: {data.get('description')}")
+        return data['result']
+
+    async def send_message(self, chat_id: int, text: str, parse_mode: str = None):
+        params = {'chat_id': chat_id, 'text': text}
+        if parse_mode:
+            params['parse_mode'] = parse_mode
+        return await self.call('sendMessage', **params)
+
+    async def get_updates(self, offset: int = None, timeout: int = 30) -> list:
+        return await self.call('getUpdates', offset=offset, timeout=timeout)
+
+class AsyncBotHandlers:
+    ASYNC_DRIVERS = {
+        'postgres://': 'postgresql+asyncpg://',
+        'postgresql://': 'postgresql+asyncpg://',
+        'sqlite://': 'sqlite+aiosqlite://',
+    }
+
+    def __init__(self, handlers: BotHandlers, telegram: AsyncTelegramClient, http: aiohttp.ClientSession,
+                 scheduler: OutboundScheduler = None):
+        # The sync services still own the shared caches and the nonce manager
+        self.handlers = handlers
+        self.scheduler = scheduler
+        self.price_service = handlers.price_service
+        self.wallet_service = handlers.wallet_service
+        self.tipping_service = handlers.tipping_service
+        self.group_settings = handlers.emoji_tipping_system.group_settings
+        self.telegram = telegram
+        self.http = http
+        import aiohttp
+        from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+        from web3 import Web3
+        from web3.eth import AsyncEth
+
+        self.aw3 = Web3(async_routed_provider(container.rpc_client), modules={'eth': (AsyncEth,)}, middlewares=[])
+        self.contract = container.moji_contract
+        self.async_session = sessionmaker(
+            create_async_engine(
+                ASYNC_DATABASE_URL or self._async_database_url(DATABASE_URL),
+                **engine_options(ASYNC_DATABASE_URL or DATABASE_URL)
+            ),
+            class_=AsyncSession,
+            expire_on_commit=False,
+        )
+        instrument_engine(self.async_session.kw['bind'].sync_engine)
+        self.executor = ThreadPoolExecutor(max_workers=ASYNC_EXECUTOR_WORKERS, thread_name_prefix='async-offload')
+        # A drip broadcasts for seconds; on their own pool, drips never hold up tips and withdrawals
+        self.drip_executor = ThreadPoolExecutor(max_workers=ASYNC_DRIP_WORKERS, thread_name_prefix='async-drip')
+        self.price_timeout = aiohttp.ClientTimeout(total=10)
+
+    @classmethod
+    def _async_database_url(cls, url: str) -> str:
+        for prefix, async_prefix in cls.ASYNC_DRIVERS.items():
+            if url.startswith(prefix):
+                return async_prefix + url[len(prefix):]
+        return url
+
+    async def _offload(self, func, *args, executor: ThreadPoolExecutor = None):
+        return await asyncio.get_running_loop().run_in_executor(executor or self.executor, func, *args)
+
+    async def _reply(self, update: Update, text: str, parse_mode: str = None) -> None:
+        if self.scheduler:
+            options = {'parse_mode': parse_mode} if parse_mode else {}
+            self.scheduler.submit(update.effective_chat.id, text, OutboundScheduler.INTERACTIVE, **options)
+            return
+        await self.telegram.send_message(update.effective_chat.id, text, parse_mode=parse_mode)
+
+    async def _load_user(self, session: AsyncSession, **filters):
+        result = await session.execute(select(User).options(selectinload(User.wallet)).filter_by(**filters))
+        return result.scalars().first()
+
+    async def _contract_call(self, fn_name: str, *args) -> int:
+        data = self.contract.encodeABI(fn_name=fn_name, args=list(args))
+        result = await self.aw3.eth.call({'to': MOJI_CONTRACT_ADDRESS, 'data': data})
+        return int.from_bytes(result, 'big')
+
+    async def _cached(self, key: str, fetch):
+        cache = getattr(self.price_service, 'cache', None)
+        return await (cache.aget(key, fetch) if cache else fetch())
+
+    async def _fetch_price(self) -> Decimal:
+        with metrics.timer('http', upstream='price_api'):
+            async with self.http.get(PRICE_API_URL, timeout=self.price_timeout) as response:
+                if response.status != 200:
+                    raise Exception("Unable to fetch price from API")
+                data = await response.json()
+        return Decimal(data['price'])
+
+    async def _fetch_total_supply(self) -> Decimal:
+        return from_units(await self._contract_call('totalSupply'))
+
+    async def _wallet_balance(self, wallet: Wallet) -> Decimal:
+        if wallet is None:
+            return Decimal('0')
+        fetch = lambda: self._fetch_balance(wallet.address)
+        return await self.wallet_service.balance_cache.cache.aget(wallet.address, fetch)
+
+    async def _fetch_balance(self, address: str) -> Decimal:
+        return from_units(await self._contract_call('balanceOf', address))
+
+    # Commands that move funds or write settings run the sync handlers in the executor, so
+    # both modes share one implementation. Their replies go out through the update's bot.
+    async def _run_sync(self, handler, update: Update, args: list, executor: ThreadPoolExecutor = None) -> None:
+        await self._offload(releases_db_session(handler), update, SimpleNamespace(args=args, bot=update.message.bot),
+                            executor=executor)
+
+    async def start_handler(self, update: Update, args: list) -> None:
+        await self._reply(update, "Welcome to Moji Buy Bot! Use /help to see available commands.")
+
+    async def help_handler(self, update: Update, args: list) -> None:
+        await self._reply(update, BotHandlers.HELP_TEXT)
+
+    async def disclaimer_handler(self, update: Update, args: list) -> None:
+        await self._reply(update, BotHandlers.DISCLAIMER_TEXT)
+
+    async def chart_handler(self, update: Update, args: list) -> None:
+        await self._reply(update, f"📈 View the Moji price chart here: {self.handlers.chart_service.get_chart_url()}")
+
+    async def price_handler(self, update: Update, args: list) -> None:
+        try:
+            price, total_supply = await asyncio.gather(
+                self._cached('price', self._fetch_price),
+                self._cached('total_supply', self._fetch_total_supply),
+            )
+            age = self.price_service.get_data_age()
+            message = f"💰 Current Moji price: ${price:.6f}\n📊 Market Cap: ${total_supply * price:.2f}\n🕒 Updated {age:.0f}s ago"
+            await self._reply(update, message)
+        except Exception as e:
+            logger.error(f"Error in price_handler: {str(e)}")
+            await self._reply(update, "Unable to fetch price information. Please try again later.")
+
+    async def balance_handler(self, update: Update, args: list) -> None:
+        if update.effective_chat.type != 'private':
+            await self._reply(update, "Please check your balance in a private message.")
+            return
+
+        try:
+            async with self.async_session() as session:
+                user = await self._load_user(session, telegram_id=str(update.effective_user.id))
+            balance = await self._wallet_balance(user.wallet if user else None)
+            await self._reply(update, f"💼 Your current balance is: {balance:.6f} Moji")
+        except Exception as e:
+            logger.error(f"Error in balance_handler: {str(e)}")
+            await self._reply(update, "Unable to fetch balance. Please try again later.")
+
+    async def mystats_handler(self, update: Update, args: list) -> None:
+        if update.effective_chat.type != 'private':
+            await self._reply(update, "Please check your stats in a private message.")
+            return
+
+        try:
+            async with self.async_session() as session:
+                result = await session.execute(select(UserLedgerSummary).join(User).filter(
+                    User.telegram_id == str(update.effective_user.id)
+                ))
+                summary = result.scalars().first()
+            await self._reply(update, BotHandlers.format_stats(summary))
+        except Exception as e:
+            logger.error(f"Error in mystats_handler: {str(e)}")
+            await self._reply(update, "Unable to fetch your stats. Please try again later.")
+
+    async def top_handler(self, update: Update, args: list) -> None:
+        if update.effective_chat.type == 'private':
+            await self._reply(update, "Leaderboards are only kept for groups.")
+            return
+
+        try:
+            days = self.handlers.group_stats.parse_days(args)
+            async with self.async_session() as session:
+                text = await session.run_sync(self.handlers.group_stats.leaderboard, update.effective_chat.id, days)
+            await self._reply(update, text)
+        except ValueError as e:
+            await self._reply(update, f"Error: {str(e)}\nUsage: /top [days]")
+        except Exception as e:
+            logger.error(f"Error in top_handler: {str(e)}")
+            await self._reply(update, "Unable to fetch the leaderboard. Please try again later.")
+
+    async def stats_handler(self, update: Update, args: list) -> None:
+        if update.effective_chat.type == 'private':
+            await self._reply(update, "Group stats are only kept for groups. Use /mystats for your own totals.")
+            return
+
+        try:
+            async with self.async_session() as session:
+                text = await session.run_sync(self.handlers.group_stats.summary, update.effective_chat.id)
+            await self._reply(update, text)
+        except Exception as e:
+            logger.error(f"Error in stats_handler: {str(e)}")
+            await self._reply(update, "Unable to fetch the group stats. Please try again later.")
+
+    async def send_handler(self, update: Update, args: list) -> None:
+        await self._run_sync(self.handlers.send_handler, update, args)
+
+    async def withdraw_handler(self, update: Update, args: list) -> None:
+        await self._run_sync(self.handlers.withdraw_handler, update, args)
+
+    async def enchant_handler(self, update: Update, args: list) -> None:
+        await self._run_sync(self.handlers.enchant_handler, update, args)
+
+    async def drip_handler(self, update: Update, args: list) -> None:
+        await self._run_sync(self.handlers.drip_handler, update, args, executor=self.drip_executor)
+
+    async def buyalerts_handler(self, update: Update, args: list) -> None:
+        await self._run_sync(self.handlers.buyalerts_handler, update, args)
+
+    async def tipemoji_handler(self, update: Update, args: list) -> None:
+        await self._run_sync(self.handlers.tipemoji_handler, update, args)
+
+    async def process_emoji_tip(self, update: Update) -> None:
+        # Messages without the group's emoji are turned away from the cached settings,
+        # without a trip to the executor
+        settings = self.group_settings.peek(update.effective_chat.id)
+        if settings is not None and settings[0] not in update.message.text:
+            return
+        await self._run_sync(self.handlers.emoji_tipping_system.process_emoji_tip, update, [])
+
+    async def unknown_command_handler(self, update: Update, args: list) -> None:
+        # Replies are produced on the reply service's threads and handed back to the loop
+        loop = asyncio.get_running_loop()
+        deliver = lambda reply: asyncio.run_coroutine_threadsafe(self._reply(update, reply), loop)
+        self.handlers.emoji_tipping_system.reply_service.submit(
+            update.message.text, update.effective_user.id, update.effective_chat.id, deliver
+        )
+
+class AsyncDispatcher:
+    def __init__(self, handlers: AsyncBotHandlers, bot: Bot, max_concurrency: int = ASYNC_MAX_CONCURRENT_UPDATES):
+        self.handlers = handlers
+        self.bot = bot  # only used to parse updates; replies go through AsyncTelegramClient
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.commands = {
+            'start': handlers.start_handler,
+            'help': handlers.help_handler,
+            'disclaimer': handlers.disclaimer_handler,
+            'enchant': handlers.enchant_handler,
+            'withdraw': handlers.withdraw_handler,
+            'drip': handlers.drip_handler,
+            'price': handlers.price_handler,
+            'chart': handlers.chart_handler,
+            'send': handlers.send_handler,
+            'balance': handlers.balance_handler,
+            'mystats': handlers.mystats_handler,
+            'top': handlers.top_handler,
+            'stats': handlers.stats_handler,
+            'buyalerts': handlers.buyalerts_handler,
+            'tipemoji': handlers.tipemoji_handler,
+        }
+        self._tasks = set()
+
+    async def process_update(self, data: dict) -> None:
+        update = Update.de_json(data, self.bot)
+        if update and update.effective_user:
+            self.handlers.tipping_service.activity_tracker.record(update.effective_user.id, update.effective_user.username)
+        if not update or not update.message or not update.message.text:
+            return
+
+        text = update.message.text
+        try:
+            if text.startswith('/'):
+                command, *args = text.split()
+                name = command[1:].split('@')[0].lower()
+                if name not in self.commands:
+                    name = 'unknown_command'
+                handler = self.commands.get(name, self.handlers.unknown_command_handler)
+                with tracer.trace(name, update_id=update.update_id), metrics.timer('handler', handler=name):
+                    await handler(update, args)
+            else:
+                with tracer.trace('emoji_tip', update_id=update.update_id), metrics.timer('handler', handler='emoji_tip'):
+                    await self.handlers.process_emoji_tip(update)
+        except Exception as e:
+            logger.error(f"Unhandled error for update {update.update_id}: {str(e)}")
+        record_first_update()
+
+    async def submit(self, data: dict) -> None:
+        # Waits only when ASYNC_MAX_CONCURRENT_UPDATES updates are already in flight
+        await self.semaphore.acquire()
+        task = asyncio.create_task(self.process_update(data))
+        self._tasks.add(task)
+        task.add_done_callback(self._finished)
+
+    def _finished(self, task) -> None:
+        self._tasks.discard(task)
+        self.semaphore.release()
+
+    async def drain(self) -> None:
+        if self._tasks:
+            await asyncio.gather(*list(self._tasks))
+
+    async def run_polling(self) -> None:
+        offset = None
+        while True:
+            try:
+                updates = await self.handlers.telegram.get_updates(offset=offset, timeout=30)
+            except Exception as e:
+                logger.error(f"getUpdates failed: {str(e)}")
+                await asyncio.sleep(1)
+                continue
+            for data in updates:
+                offset = data['update_id'] + 1
+                await self.submit(data)
+
+async def run_async_bot(handlers: BotHandlers, bot: Bot, scheduler: OutboundScheduler = None) -> None:
+    import aiohttp
+
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=60)) as http:
+        telegram = AsyncTelegramClient(http)
+        dispatcher = AsyncDispatcher(AsyncBotHandlers(handlers, telegram, http, scheduler), bot)
+        logger.info("Starting Moji Buy Bot in async mode...")
+        await dispatcher.run_polling()
+
+# Webhook mode: one light ingress process accepts updates over HTTP and appends each to
+# the Redis list of its shard (chat id modulo SHARD_WORKERS). Every shard is drained by
+# one worker process, so a chat's updates are handled in the order they arrived while
+# different chats run in parallel across processes.
+def update_chat_id(data: dict) -> int:
+    for field in ('message', 'edited_message', 'channel_post', 'edited_channel_post',
+                  'my_chat_member', 'chat_member', 'chat_join_request'):
+        if data.get(field, {}).get('chat'):
+            return int(data[field]['chat']['id'])
+    callback = data.get('callback_query')
+    if callback:
+        return int(callback['message']['chat']['id'] if callback.get('message') else callback['from']['id'])
+    for field in ('inline_query', 'chosen_inline_result', 'shipping_query', 'pre_checkout_query'):
+        if field in data:
+            return int(data[field]['from']['id'])
+    return 0
+
+def shard_key(shard: int) -> str:
+    return f"updates:shard:{shard}"
+
+class WebhookIngress:
+    def __init__(self, redis_client, shards: int = SHARD_WORKERS, secret: str = WEBHOOK_SECRET):
+        self.redis = redis_client  # a redis.asyncio client
+        self.shards = shards
+        self.secret = secret
+
+    def app(self) -> web.Application:
+        from aiohttp import web
+
+        app = web.Application()
+        app.router.add_post(WEBHOOK_PATH, self.handle)
+        return app
+
+    async def handle(self, request: web.Request) -> web.Response:
+        from aiohttp import web
+
+        if self.secret and request.headers.get('X-Telegram-Bot-Api-Secret-Token') != self.secret:
+            return web.Response(status=403)
+        body = await request.read()
+        try:
+            shard = update_chat_id(json.loads(body)) % self.shards
+        except (ValueError, KeyError, TypeError, AttributeError):
+            return web.Response(status=400)
+        try:
+            await self.redis.rpush(shard_key(shard), body)
+        except Exception as e:
+            # Telegram redelivers updates that were not acknowledged
+            logger.error(f"Could not queue update for shard {shard}: {str(e)}")
+            metrics.inc('webhook_updates_total', shard=shard, outcome='error')
+            return web.Response(status=503)
+        metrics.inc('webhook_updates_total', shard=shard, outcome='queued')
+        return web.Response()
+
+# Drains one shard. Updates are spread over SHARD_LANES threads by chat, and each lane
+# runs its updates one at a time through the regular handlers. Each update is moved to
+# the shard's processing list when it is read and only removed once it has been handled,
+# so updates a worker had not finished when it died are handled again on restart.
+class ShardWorker:
+    BATCH_SIZE = 100
+
+    def __init__(self, shard: int, dispatcher: Dispatcher, redis_client, shards: int = SHARD_WORKERS,
+                 lanes: int = SHARD_LANES, backlog: int = SHARD_LANE_BACKLOG):
+        self.shard = shard
+        self.dispatcher = dispatcher
+        self.redis = redis_client
+        self.shards = shards
+        self.key = shard_key(shard)
+        self.processing_key = f"{self.key}:processing"
+        # A full lane blocks the reader, leaving the backlog in Redis rather than in memory
+        self.lanes = [queue.Queue(maxsize=backlog) for _ in range(lanes)]
+        self._stop = threading.Event()
+        metrics.collect('shard', lambda: {'backlog': sum(lane.qsize() for lane in self.lanes)})
+
+    def run(self) -> None:
+        self._requeue()
+        for i, lane in enumerate(self.lanes):
+            threading.Thread(target=self._drain, args=(lane,), name=f'shard-{self.shard}-lane-{i}', daemon=True).start()
+        logger.info(f"Shard worker {self.shard}/{self.shards} waiting for updates")
+        while not self._stop.is_set():
+            try:
+                body = self.redis.blmove(self.key, self.processing_key, 1, 'LEFT', 'RIGHT')
+                if body is None:
+                    continue
+                pipe = self.redis.pipeline(transaction=False)
+                for _ in range(self.BATCH_SIZE - 1):
+                    pipe.lmove(self.key, self.processing_key, 'LEFT', 'RIGHT')
+                bodies = [body] + [b for b in pipe.execute() if b is not None]
+            except redis.RedisError as e:
+                logger.error(f"Shard {self.shard} read error: {str(e)}")
+                time.sleep(1)
+                continue
+            for body in bodies:
+                data = json.loads(body)
+                self.lanes[(update_chat_id(data) // self.shards) % len(self.lanes)].put((body, data))
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    # Puts updates a previous run had read but not finished back at the head of the
+    # shard's list, oldest first
+    def _requeue(self) -> None:
+        count = 0
+        while self.redis.lmove(self.processing_key, self.key, 'RIGHT', 'LEFT') is not None:
+            count += 1
+        if count:
+            logger.warning(f"Shard {self.shard} requeued {count} unfinished updates")
+
+    def _drain(self, lane: queue.Queue) -> None:
+        while True:
+            body, data = lane.get()
+            try:
+                self.dispatcher.process_update(Update.de_json(data, self.dispatcher.bot))
+            except Exception as e:
+                logger.error(f"Unhandled error for update {data.get('update_id')}: {str(e)}")
+            try:
+                self.redis.lrem(self.processing_key, 1, body)
+            except redis.RedisError as e:
+                logger.error(f"Shard {self.shard} could not clear update {data.get('update_id')}: {str(e)}")
+
+# Starts the shard worker processes and restarts any that exit. A restarted worker also
+# picks up the transfers left pending, since the ones it was following died with it.
+class ShardSupervisor:
+    def __init__(self, shards: int = SHARD_WORKERS, restart_delay: float = SHARD_RESTART_DELAY):
+        self.shards = shards
+        self.restart_delay = restart_delay
+        self.workers = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        for shard in range(self.shards):
+            self.workers[shard] = self._spawn(shard)
+        atexit.register(self.stop)
+        self._thread = threading.Thread(target=self._run, name='shard-supervisor', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        for worker in self.workers.values():
+            worker.terminate()
+
+    def _run(self) -> None:
+        while not self._stop.wait(1):
+            for shard, worker in list(self.workers.items()):
+                if worker.poll() is None:
+                    continue
+                logger.error(f"Shard worker {shard} exited with code {worker.returncode}; restarting in {self.restart_delay}s")
+                metrics.inc('shard_restarts_total', shard=shard)
+                if self._stop.wait(self.restart_delay):
+                    return
+                self.workers[shard] = self._spawn(shard, restarted=True)
+
+    @staticmethod
+    def _spawn(shard: int, restarted: bool = False) -> subprocess.Popen:
+        args = [sys.executable, os.path.abspath(__file__), 'shard', str(shard)]
+        return subprocess.Popen(args + ['--load-pending'] if restarted else args)
+
+def run_webhook_ingress() -> None:
+    import redis.asyncio as aioredis
+    from aiohttp import web
+
+    if not REDIS_HOST:
+        raise RuntimeError("Webhook mode needs REDIS_HOST: updates are handed to the shard workers through Redis")
+    start_metrics_server()
+    KeyPool().start_worker()
+    ShardSupervisor().start()
+    if WEBHOOK_URL:
+        Bot(TELEGRAM_BOT_TOKEN, base_url=f"{TELEGRAM_API_URL}/bot").set_webhook(
+            WEBHOOK_URL, max_connections=WEBHOOK_MAX_CONNECTIONS, secret_token=WEBHOOK_SECRET
+        )
+    ingress = WebhookIngress(aioredis.Redis(host=REDIS_HOST, port=REDIS_PORT))
+    logger.info(f"Starting Moji Buy Bot webhook ingress with {SHARD_WORKERS} shard workers...")
+    web.run_app(ingress.app(), host=WEBHOOK_LISTEN, port=WEBHOOK_PORT, access_log=None, print=None)
+
+# Builds the services and their background threads, and the bot that sends through the
+# outbound scheduler. Each shard worker sends at its share of the global rate.
+def build_handlers(global_rate: float = TELEGRAM_GLOBAL_RATE) -> tuple:
     # Initialize services
-    price_service = PriceService()
+    price_service = CachedPriceService()
+    price_service.start()
     chart_service = ChartService()
     wallet_service = WalletService()
+    wallet_service.balance_cache.start()
+    wallet_service.signer_cache.start()
     tipping_service = TippingService(wallet_service)
+    tipping_service.activity_tracker.start()
     emoji_tipping_system = EmojiTippingSystem(tipping_service)
+    emoji_tipping_system.reply_service.start()
 
     # Initialize bot handlers
     handlers = BotHandlers(
@@ -491,35 +3867,176 @@ def main():
         emoji_tipping_system=emoji_tipping_system
     )
 
-    # Set up Telegram bot
-    updater = Updater(token=TELEGRAM_BOT_TOKEN, use_context=True)
-    dp = updater.dispatcher
-
-    # Add command handlers
-    dp.add_handler(CommandHandler("start", handlers.start_handler))
-    dp.add_handler(CommandHandler("help", handlers.help_handler))
-    dp.add_handler(CommandHandler("disclaimer", handlers.disclaimer_handler))
-    dp.add_handler(CommandHandler("enchant", handlers.enchant_handler))
-    dp.add_handler(CommandHandler("withdraw", handlers.withdraw_handler))
-    dp.add_handler(CommandHandler("drip", handlers.drip_handler))
-    dp.add_handler(CommandHandler("price", handlers.price_handler))
-    dp.add_handler(CommandHandler("chart", handlers.chart_handler))
-    dp.add_handler(CommandHandler("send", handlers.send_handler))
-    dp.add_handler(CommandHandler("balance", handlers.balance_handler))
+    # All outgoing messages are queued and flood-limited; the scheduler sends with a plain Bot
+    scheduler = OutboundScheduler(Bot(TELEGRAM_BOT_TOKEN, base_url=f"{TELEGRAM_API_URL}/bot"), global_rate=global_rate)
+    scheduler.start()
+    bot = ScheduledBot(TELEGRAM_BOT_TOKEN, base_url=f"{TELEGRAM_API_URL}/bot", scheduler=scheduler)
+
+    # Queue depths and cache hit rates from the components' own stats
+    metrics.collect('outbound', scheduler.stats)
+    metrics.collect('confirmations', lambda: {'pending': wallet_service.confirmation_tracker.pending_count()})
+    metrics.collect('ai_replies', emoji_tipping_system.reply_service.stats)
+    metrics.collect('signer_cache', wallet_service.signer_cache.stats)
+    metrics.collect('rpc_client', container.rpc_client.stats)
+    return handlers, scheduler, bot
+
+# With run_async each update runs on a dispatcher worker thread; shard workers run them
+# inline on the chat's lane instead, which keeps them in order
+def register_handlers(dp: Dispatcher, handlers: BotHandlers, run_async: bool = True) -> None:
+    # Add command handlers. Each update runs with its own DB session.
+    commands = {
+        "start": handlers.start_handler,
+        "help": handlers.help_handler,
+        "disclaimer": handlers.disclaimer_handler,
+        "enchant": handlers.enchant_handler,
+        "withdraw": handlers.withdraw_handler,
+        "drip": handlers.drip_handler,
+        "price": handlers.price_handler,
+        "chart": handlers.chart_handler,
+        "send": handlers.send_handler,
+        "balance": handlers.balance_handler,
+        "mystats": handlers.mystats_handler,
+        "top": handlers.top_handler,
+        "stats": handlers.stats_handler,
+        "buyalerts": handlers.buyalerts_handler,
+        "tipemoji": handlers.tipemoji_handler,
+    }
+    for command, callback in commands.items():
+        dp.add_handler(CommandHandler(command, instrumented(command, releases_db_session(callback)), run_async=run_async))
+
+    # Record who is active before any other handler runs
+    dp.add_handler(MessageHandler(Filters.all, handlers.activity_handler), group=-1)
 
     # Add message handler for emoji tipping
-    dp.add_handler(MessageHandler(Filters.text & ~Filters.command, emoji_tipping_system.process_emoji_tip))
+    dp.add_handler(MessageHandler(Filters.text & ~Filters.command, instrumented(
+        'emoji_tip', releases_db_session(handlers.emoji_tipping_system.process_emoji_tip)), run_async=run_async))
 
     # Add handler for unknown commands
-    dp.add_handler(MessageHandler(Filters.command, handlers.unknown_command_handler))
+    dp.add_handler(MessageHandler(Filters.command, instrumented(
+        'unknown_command', releases_db_session(handlers.unknown_command_handler)), run_async=run_async))
+
+# Follows sent transfers until they are mined and tells their senders the outcome, and
+# starts the buy alert pipeline. Transfers left pending by a previous run are only
+# picked up again when load_pending is set. Called once the bot is taking updates: the
+# watchers are built on a background thread, off the path to the first update.
+def start_watchers(handlers: BotHandlers, bot: Bot, load_pending: bool = True, buy_alerts: bool = True) -> None:
+    handlers.wallet_service.confirmation_tracker.start(bot, load=load_pending)
+    if not buy_alerts:
+        return
+    if not MOJI_PAIR_ADDRESS:
+        logger.warning("MOJI_PAIR_ADDRESS is not set; buy alerts are disabled.")
+        return
+
+    def build():
+        try:
+            BuyWatcher(bot, handlers.price_service, handlers.wallet_service).start()
+        except Exception as e:
+            logger.error(f"Could not start the buy watcher: {str(e)}")
+    threading.Thread(target=build, name='buy-watcher-start', daemon=True).start()
+
+def main():
+    if BOT_EXECUTION_MODE == 'webhook':
+        run_webhook_ingress()
+        return
+
+    handlers, scheduler, bot = build_handlers()
+    start_metrics_server()
+    handlers.wallet_service.key_pool.start_worker()
+
+    if BOT_EXECUTION_MODE == 'async':
+        record_ready()
+        container.warm_up()
+        start_watchers(handlers, bot)
+        asyncio.run(run_async_bot(handlers, bot, scheduler))
+        return
+
+    # Set up Telegram bot
+    updater = Updater(bot=bot, workers=BOT_WORKERS, use_context=True)
+    register_handlers(updater.dispatcher, handlers)
 
     # Start the bot
     logger.info("Starting Moji Buy Bot...")
     updater.start_polling()
+    record_ready()
+    container.warm_up()
+    start_watchers(handlers, bot)
     updater.idle()
 
+# Creates missing tables and applies pending migrations; run once per deploy, before
+# the new workers start:
+#   python Mojibot.py migrate
+def migrate_command(argv: list) -> None:
+    argparse.ArgumentParser(prog='Mojibot.py migrate', description="Create or upgrade the database schema").parse_args(argv)
+    started = time.monotonic()
+    container.setup_schema()
+    logger.info(f"Database schema is up to date ({time.monotonic() - started:.2f}s)")
+
+# Admin and worker entry point for the wallet key pool:
+#   python Mojibot.py keypool refill [--once]
+#   python Mojibot.py keypool import keys.jsonl
+#   python Mojibot.py keypool export keys.jsonl
+def keypool_command(argv: list) -> None:
+    parser = argparse.ArgumentParser(prog='Mojibot.py keypool', description="Manage the pre-generated wallet key pool")
+    actions = parser.add_subparsers(dest='action', required=True)
+    refill = actions.add_parser('refill', help="keep the pool topped up to KEY_POOL_TARGET keys")
+    refill.add_argument('--once', action='store_true', help="top up once and exit")
+    actions.add_parser('import', help="add keys from a JSON lines file").add_argument('file')
+    actions.add_parser('export', help="write the pooled (still encrypted) keys as JSON lines").add_argument('file')
+    args = parser.parse_args(argv)
+
+    pool = KeyPool()
+    session = container.session_factory()
+    if args.action == 'import':
+        with open(args.file) as lines:
+            logger.info(f"Imported {pool.import_keys(session, lines)} keys")
+    elif args.action == 'export':
+        with open(args.file, 'w') as out:
+            logger.info(f"Exported {pool.export_keys(session, out)} keys")
+    else:
+        while True:
+            try:
+                added = pool.refill(session)
+                if added:
+                    logger.info(f"Added {added} keys to the wallet key pool")
+            except Exception as e:
+                session.rollback()
+                logger.error(f"Key pool refill error: {str(e)}")
+            if args.once:
+                break
+            time.sleep(KEY_POOL_REFILL_INTERVAL)
+
+# Shard worker for webhook mode, normally started by the ingress:
+#   python Mojibot.py shard 0
+# Shard 0 also resumes transfers left pending and runs the buy alerts.
+def shard_command(argv: list) -> None:
+    parser = argparse.ArgumentParser(prog='Mojibot.py shard', description="Handle the updates of one webhook shard")
+    parser.add_argument('shard', type=int, help=f"0 to SHARD_WORKERS - 1 ({SHARD_WORKERS - 1})")
+    parser.add_argument('--load-pending', action='store_true',
+                        help="also follow the transfers left pending (shard 0 always does)")
+    args = parser.parse_args(argv)
+    if not 0 <= args.shard < SHARD_WORKERS:
+        parser.error(f"shard must be between 0 and {SHARD_WORKERS - 1}")
+
+    handlers, _, bot = build_handlers(global_rate=TELEGRAM_GLOBAL_RATE / SHARD_WORKERS)
+    start_metrics_server(METRICS_PORT + 1 + args.shard if METRICS_PORT else 0)
+    # Never started: ShardWorker calls process_update directly from the chat's lane
+    dispatcher = Dispatcher(bot, queue.Queue(), use_context=True)
+    register_handlers(dispatcher, handlers, run_async=False)
+    worker = ShardWorker(args.shard, dispatcher, container.redis)
+    record_ready()
+    container.warm_up()
+    start_watchers(handlers, bot, load_pending=args.shard == 0 or args.load_pending, buy_alerts=args.shard == 0)
+    worker.run()
+
 if __name__ == '__main__':
     try:
-        main()
+        if sys.argv[1:2] == ['migrate']:
+            migrate_command(sys.argv[2:])
+        elif sys.argv[1:2] == ['keypool']:
+            keypool_command(sys.argv[2:])
+        elif sys.argv[1:2] == ['shard']:
+            shard_command(sys.argv[2:])
+        else:
+            main()
     except Exception as e:
         logger.critical(f"Unhandled exception: {str(e)}", exc_info=True)
@@ -0,0 +1,112 @@
+# Floods the unknown-command path with a burst from a few spammers and many ordinary
+# users, against a stubbed completions endpoint. Reports how long the update handler
+# is blocked per command and how many completions (i.e. paid API calls) were made,
+# before (one blocking completion per command) and with the AI reply service.
+#
+#   python benchmarks/bench_ai_replies.py --commands 2000 --latency 0.5
+import argparse
+import logging
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+from stubs import StubServer, configure_environment, percentiles
+
+TYPOS = ['/prise', '/balence', '/tip', '/moon', '/wen', '/halp', '/chartt', '/sned', '/lambo', '/gm']
+
+
+def workload(count: int, seed: int = 11) -> list:
+    rng = random.Random(seed)
+    commands = []
+    for _ in range(count):
+        if rng.random() < 0.8:
+            user_id, chat_id = rng.randint(1, 3), -100  # spammers hammering one group
+        else:
+            user_id, chat_id = rng.randint(10, 500), -100 - rng.randint(1, 20)
+        commands.append((f"{rng.choice(TYPOS)} {rng.randint(0, 999)}", user_id, chat_id))
+    return commands
+
+
+def fake_update(text: str, user_id: int, chat_id: int, replies: list):
+    return SimpleNamespace(
+        effective_user=SimpleNamespace(id=user_id),
+        effective_chat=SimpleNamespace(id=chat_id),
+        message=SimpleNamespace(text=text, reply_text=replies.append),
+    )
+
+
+def blocking_reply(Mojibot, update) -> None:
+    # The handler as it was: one completion per command, on the update worker
+    response = Mojibot.container.openai.Completion.create(
+        model="gpt-3.5-turbo",
+        prompt=f"A user entered an invalid command: {update.message.text}. Respond with a sassy but friendly message.",
+        max_tokens=50,
+        api_base=Mojibot.AI_API_BASE,
+    )
+    update.message.reply_text(response.choices[0].text.strip())
+
+
+def run(name: str, handle, commands: list, workers: int) -> None:
+    replies = []
+    updates = [fake_update(text, user_id, chat_id, replies) for text, user_id, chat_id in commands]
+    blocked = []
+    pending = list(updates)
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            with lock:
+                if not pending:
+                    return
+                update = pending.pop()
+            started = time.perf_counter()
+            handle(update)
+            blocked.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    stats = percentiles(blocked)
+    print(f"{name:>9}: {len(commands) / elapsed:9.1f} commands/s  "
+          + "  ".join(f"blocked {key}={value * 1000:.1f}ms" for key, value in stats.items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Unknown-command reply throughput and API usage")
+    parser.add_argument('--commands', type=int, default=2000)
+    parser.add_argument('--latency', type=float, default=0.5, help="seconds each stubbed completion takes")
+    parser.add_argument('--workers', type=int, default=8, help="update worker threads (BOT_WORKERS)")
+    parser.add_argument('--blocking-sample', type=int, default=200, help="commands replayed through the blocking handler")
+    args = parser.parse_args()
+
+    stub = StubServer(latency=args.latency).start()
+    configure_environment(stub)
+    import Mojibot
+    logging.disable(logging.WARNING)
+
+    commands = workload(args.commands)
+    sample = commands[:args.blocking_sample]
+    run('blocking', lambda update: blocking_reply(Mojibot, update), sample, args.workers)
+    print(f"           {stub.completions} completions for {len(sample)} commands")
+
+    completions = stub.completions
+    service = Mojibot.AIReplyService()
+    service.start()
+    run('service', lambda update: service.submit(
+        update.message.text, update.effective_user.id, update.effective_chat.id, update.message.reply_text
+    ), commands, args.workers)
+    service.queue.join()
+    print(f"           {stub.completions - completions} completions for {len(commands)} commands")
+    stats = service.stats()
+    print("  service: " + "  ".join(
+        f"{key}={value:.3f}" if isinstance(value, float) else f"{key}={value}" for key, value in stats.items()
+    ))
+
+
+if __name__ == '__main__':
+    main()
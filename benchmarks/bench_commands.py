@@ -0,0 +1,203 @@
+# End-to-end latency of the command paths: synthetic updates go through the real
+# python-telegram-bot dispatcher and handlers (BotHandlers, TippingService,
+# EmojiTippingSystem) against SQLite, a stubbed Telegram API and an in-memory token
+# chain (evm.py) that executes the signed transfers. Each scenario reports throughput
+# and handler latency percentiles; the chain and the group stats aggregates are
+# checked afterwards so a fast but wrong run does not pass. With --baseline the run fails when a scenario got slower
+# than a saved result by more than --tolerance, to catch regressions before deploy.
+#
+#   python benchmarks/bench_commands.py --users 200 --updates 300 --latency 0.02
+#   python benchmarks/bench_commands.py --output before.json
+#   python benchmarks/bench_commands.py --baseline before.json --tolerance 0.25
+import argparse
+import json
+import logging
+import queue
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from evm import LocalChain
+from stubs import StubServer, configure_environment, command_update, percentiles
+
+CONTRACT = '0x5FbDB2315678afecb367f032d93F642f64180aa3'
+WORDS = "gm wagmi moon lfg ser chart dip pump when lambo lol nice anyone here today price bullish".split()
+GROUP = -1001
+
+
+def seed_users(Mojibot, chain: LocalChain, count: int, balance: int) -> None:
+    # Users 1..count, each with a funded wallet and seen recently, so all are drip recipients
+    session = Mojibot.db_session
+    for user_id in range(1, count + 1):
+        address, _, encrypted_private_key = Mojibot.generate_encrypted_key()
+        user = Mojibot.User(telegram_id=str(user_id), username=f"user{user_id}")
+        session.add(user)
+        session.add(Mojibot.Wallet(user=user, address=address, encrypted_private_key=encrypted_private_key))
+        chain.mint(address, Mojibot.to_units(Mojibot.Decimal(balance)))
+    session.commit()
+    session.remove()
+
+
+def scenarios(users: int, updates: int, drips: int, seed: int = 3) -> dict:
+    rng = random.Random(seed)
+    update_ids = iter(range(1, 10**9))
+
+    def private(user_id: int, text: str) -> dict:
+        return command_update(next(update_ids), user_id, user_id, text)
+
+    def tip_target(sender: int) -> int:
+        return rng.choice([user_id for user_id in range(1, min(users, 50) + 1) if user_id != sender])
+
+    emoji = []
+    for _ in range(updates):
+        sender = rng.randint(1, users)
+        roll = rng.random()
+        if roll < 0.1:
+            text = f"{rng.randint(1, 5)} 🦄 @user{tip_target(sender)}"
+        elif roll < 0.2:
+            text = " ".join(rng.choice(WORDS) for _ in range(4)) + f" @user{rng.randint(1, users)}"
+        else:
+            text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 12)))
+        emoji.append(command_update(next(update_ids), GROUP, sender, text, 'supergroup'))
+
+    return {
+        'price': [private(rng.randint(1, users), '/price') for _ in range(updates)],
+        'send': [private(sender, f"/send {rng.randint(1, 20)} @user{tip_target(sender)}")
+                 for sender in (rng.randint(1, users) for _ in range(updates))],
+        'drip': [private(sender, f"/drip {users}") for sender in rng.sample(range(1, users + 1), drips)],
+        'emoji': emoji,
+        'stats': [command_update(next(update_ids), GROUP, rng.randint(1, users), rng.choice(['/top', '/top 30', '/stats']), 'supergroup')
+                  for _ in range(updates)],
+    }
+
+
+def run(name: str, dispatcher, updates: list, workers: int) -> dict:
+    from telegram import Update
+
+    latencies = []
+
+    def handle(data):
+        started = time.perf_counter()
+        dispatcher.process_update(Update.de_json(data, dispatcher.bot))
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(handle, updates))
+    elapsed = time.perf_counter() - started
+    result = {'updates': len(updates), 'updates_per_second': len(updates) / elapsed}
+    result.update({key: value * 1000 for key, value in percentiles(latencies).items()})
+    print(f"{name:>7}: {result['updates_per_second']:8.1f} updates/s  "
+          + "  ".join(f"{key}={result[key]:.1f}ms" for key in ('p50', 'p90', 'p99', 'max')))
+    return result
+
+
+def expected_transfers(workload: dict, users: int) -> int:
+    # One per /send and emoji tip, one per other user for each /drip
+    expected = len(workload.get('send', [])) + len(workload.get('drip', [])) * (users - 1)
+    return expected + sum(1 for update in workload.get('emoji', []) if '🦄' in update['message']['text'])
+
+
+def check_chain(chain: LocalChain, transfers_before: int, expected: int = None) -> None:
+    mined = len(chain.receipts) - transfers_before
+    queued = sum(len(waiting) for waiting in chain.queued.values())
+    conserved = sum(chain.balances.values()) == chain.total_supply
+    print(f"  chain: {mined}{f'/{expected}' if expected is not None else ''} transfers mined, {chain.reverted} reverted, "
+          f"{queued} stuck behind a nonce gap, supply {'conserved' if conserved else 'NOT conserved'}")
+    if chain.reverted or queued or not conserved or (expected is not None and mined != expected):
+        sys.exit(1)
+
+
+def check_group_stats(Mojibot) -> None:
+    # The aggregates must add up to the group's ledger rows they were built from
+    session = Mojibot.db_session
+    sum_units = lambda *filters: session.query(Mojibot.func.coalesce(Mojibot.func.sum(
+        Mojibot.func.abs(Mojibot.Transaction.amount_units)), 0)).filter(Mojibot.Transaction.chat_id == str(GROUP), *filters).scalar()
+    ledger = sum_units(Mojibot.Transaction.transaction_type == 'tip_sent')
+    volume = {period: session.query(Mojibot.func.coalesce(Mojibot.func.sum(Mojibot.GroupTipVolume.tip_units), 0)).filter_by(
+        chat_id=str(GROUP), period=period).scalar() for period in ('hour', 'day')}
+    received = session.query(Mojibot.func.coalesce(Mojibot.func.sum(Mojibot.GroupTipperStats.received_units), 0)).filter_by(
+        chat_id=str(GROUP)).scalar()
+    session.remove()
+    consistent = volume['hour'] == volume['day'] == ledger == received
+    print(f"  group stats: {Mojibot.from_units(ledger)} MOJI tipped in the ledger, "
+          f"aggregates {'match' if consistent else f'DO NOT match ({volume}, received {received})'}")
+    if not consistent:
+        sys.exit(1)
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> int:
+    regressions = 0
+    for name, result in results.items():
+        before = baseline.get(name)
+        if not before:
+            continue
+        slower = result['p90'] / before['p90'] - 1
+        fewer = 1 - result['updates_per_second'] / before['updates_per_second']
+        if slower > tolerance or fewer > tolerance:
+            regressions += 1
+            print(f"REGRESSION {name}: p90 {before['p90']:.1f}ms -> {result['p90']:.1f}ms, "
+                  f"{before['updates_per_second']:.1f} -> {result['updates_per_second']:.1f} updates/s")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Command path latency and throughput against a local chain")
+    parser.add_argument('--users', type=int, default=200, help="seeded users with funded wallets, all active")
+    parser.add_argument('--updates', type=int, default=300, help="updates per scenario")
+    parser.add_argument('--drips', type=int, default=5, help="/drip commands, each paying every other user")
+    parser.add_argument('--latency', type=float, default=0.02, help="seconds each stubbed upstream call takes")
+    parser.add_argument('--workers', type=int, default=8, help="update worker threads (BOT_WORKERS)")
+    parser.add_argument('--scenarios', default='price,send,drip,emoji,stats', help="comma-separated scenarios to run")
+    parser.add_argument('--replay', help="JSON lines file of recorded updates to run as one 'replay' scenario")
+    parser.add_argument('--save', help="write the synthetic updates to this file for later replays")
+    parser.add_argument('--output', help="write the results as JSON, for use as a later --baseline")
+    parser.add_argument('--baseline', help="JSON results of an earlier run; exit non-zero on a regression")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="allowed p90 or throughput change against the baseline")
+    args = parser.parse_args()
+
+    chain = LocalChain(CONTRACT)
+    stub = StubServer(latency=args.latency, chain=chain).start()
+    configure_environment(stub)
+    import Mojibot
+    from telegram.ext import Dispatcher
+    logging.disable(logging.WARNING)
+    Mojibot.container.setup_schema()
+
+    seed_users(Mojibot, chain, args.users, balance=10**6)
+    # Replies are queued for the stub Telegram API; the flood limits only delay delivery,
+    # which happens after the handler has returned and is not measured here
+    handlers, _, bot = Mojibot.build_handlers(global_rate=10**4)
+    for user_id in range(1, args.users + 1):
+        handlers.tipping_service.activity_tracker.record(user_id, f"user{user_id}")
+    dispatcher = Dispatcher(bot, queue.Queue(), use_context=True)
+    Mojibot.register_handlers(dispatcher, handlers, run_async=False)
+
+    if args.replay:
+        with open(args.replay) as f:
+            workload = {'replay': [json.loads(line) for line in f if line.strip()]}
+    else:
+        workload = scenarios(args.users, args.updates, args.drips)
+        workload = {name: workload[name] for name in args.scenarios.split(',')}
+    if args.save:
+        with open(args.save, 'w') as f:
+            for updates in workload.values():
+                f.writelines(json.dumps(update) + '\n' for update in updates)
+
+    transfers_before = len(chain.receipts)
+    results = {name: run(name, dispatcher, updates, args.workers) for name, updates in workload.items()}
+    check_chain(chain, transfers_before, None if args.replay else expected_transfers(workload, args.users))
+    check_group_stats(Mojibot)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            if compare(results, json.load(f), args.tolerance):
+                sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+# Replays synthetic /price updates through the threaded (python-telegram-bot worker
+# pool) and async execution modes against stubbed upstreams with a fixed latency.
+#
+#   python benchmarks/bench_dispatch.py --updates 500 --latency 0.05 --workers 4
+import argparse
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+from stubs import StubServer, configure_environment, command_update, percentiles
+
+
+def run_threaded(Mojibot, handlers, updates: list, workers: int) -> tuple:
+    from telegram import Bot, Update
+
+    bot = Bot(Mojibot.TELEGRAM_BOT_TOKEN, base_url=f"{Mojibot.TELEGRAM_API_URL}/bot")
+    latencies = []
+
+    def handle(data):
+        update = Update.de_json(data, bot)
+        handlers.price_handler(update, SimpleNamespace(args=[], bot=bot))
+        # Measured from submission, so time spent queued for a free worker counts
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(handle, updates))
+    return time.perf_counter() - started, latencies
+
+
+async def run_async(Mojibot, handlers, updates: list) -> tuple:
+    import aiohttp
+    from telegram import Bot
+
+    latencies = []
+    async with aiohttp.ClientSession() as http:
+        telegram = Mojibot.AsyncTelegramClient(http)
+        dispatcher = Mojibot.AsyncDispatcher(
+            Mojibot.AsyncBotHandlers(handlers, telegram, http),
+            Bot(Mojibot.TELEGRAM_BOT_TOKEN, base_url=f"{Mojibot.TELEGRAM_API_URL}/bot"),
+        )
+
+        async def handle(data):
+            await dispatcher.process_update(data)
+            latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*[handle(data) for data in updates])
+        return time.perf_counter() - started, latencies
+
+
+def report(name: str, elapsed: float, latencies: list) -> None:
+    stats = percentiles(latencies)
+    print(f"{name:>8}: {len(latencies) / elapsed:8.1f} updates/s  "
+          + "  ".join(f"{key}={value * 1000:.0f}ms" for key, value in stats.items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare threaded and async dispatch throughput")
+    parser.add_argument('--updates', type=int, default=500)
+    parser.add_argument('--latency', type=float, default=0.05, help="seconds each stubbed upstream call takes")
+    parser.add_argument('--workers', type=int, default=4, help="threaded mode worker count (Updater default is 4)")
+    args = parser.parse_args()
+
+    stub = StubServer(latency=args.latency).start()
+    configure_environment(stub)
+    import Mojibot
+    logging.disable(logging.WARNING)
+    Mojibot.container.setup_schema()
+
+    # Uncached price service, so every update pays the full upstream round trips
+    wallet_service = Mojibot.WalletService()
+    tipping_service = Mojibot.TippingService(wallet_service)
+    handlers = Mojibot.BotHandlers(
+        price_service=Mojibot.PriceService(),
+        chart_service=Mojibot.ChartService(),
+        wallet_service=wallet_service,
+        tipping_service=tipping_service,
+        emoji_tipping_system=Mojibot.EmojiTippingSystem(tipping_service),
+    )
+    updates = [command_update(i, 1000 + i % 50, i, '/price') for i in range(args.updates)]
+
+    report('threaded', *run_threaded(Mojibot, handlers, updates, args.workers))
+    report('async', *asyncio.run(run_async(Mojibot, handlers, updates)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+# Micro-benchmark for the emoji tip parser on a synthetic group chat corpus: mostly
+# ordinary chatter, some @mentions, a few emoji without a recipient and rare tips.
+# Compares the per-message DB lookup + regex compile the parser used to do with the
+# cached per-group settings. Tips themselves are not sent.
+#
+#   python benchmarks/bench_emoji_tips.py --messages 50000 --groups 20
+import argparse
+import logging
+import random
+import re
+import time
+from types import SimpleNamespace
+
+from stubs import StubServer, configure_environment
+
+WORDS = "gm wagmi moon lfg ser chart dip pump when lambo lol nice anyone here today price bullish".split()
+
+
+def corpus(count: int, groups: int, seed: int = 7) -> list:
+    rng = random.Random(seed)
+    messages = []
+    for i in range(count):
+        text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 12)))
+        roll = rng.random()
+        if roll < 0.07:
+            text += f" @user{rng.randint(1, 500)}"
+        elif roll < 0.09:
+            text = f"🦄 {text}"
+        elif roll < 0.10:
+            text = f"{rng.randint(1, 50)} 🦄 @user{rng.randint(1, 500)}"
+        messages.append((-1000 - i % groups, text))
+    return messages
+
+
+def fake_update(chat_id: int, text: str):
+    return SimpleNamespace(
+        effective_chat=SimpleNamespace(id=chat_id, type='supergroup'),
+        effective_user=SimpleNamespace(id=1, username='bench'),
+        message=SimpleNamespace(text=text, reply_text=lambda reply: None),
+    )
+
+
+def uncached_process(Mojibot, tipping_service, update) -> None:
+    # The parser as it was: one Group query and one regex compile per message
+    db_session = Mojibot.db_session
+    group = db_session.query(Mojibot.Group).filter_by(telegram_id=str(update.effective_chat.id)).first()
+    if not group:
+        group = Mojibot.Group(telegram_id=str(update.effective_chat.id))
+        db_session.add(group)
+        db_session.commit()
+    if group.tipping_emoji not in update.message.text:
+        return
+    pattern = rf"(?P<amount>\d+(\.\d{{1,6}})?)?\s*{re.escape(group.tipping_emoji)}\s*@(?P<recipient>\w+)"
+    match = re.search(pattern, update.message.text)
+    if match:
+        tipping_service.send_tip(1, match.group('recipient'), 1)
+
+
+def measure(name: str, process, updates: list) -> None:
+    started = time.perf_counter()
+    for update in updates:
+        process(update)
+    elapsed = time.perf_counter() - started
+    print(f"{name:>9}: {len(updates) / elapsed:10.0f} messages/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Emoji tip parser throughput")
+    parser.add_argument('--messages', type=int, default=50000)
+    parser.add_argument('--groups', type=int, default=20)
+    args = parser.parse_args()
+
+    configure_environment(StubServer(latency=0).start())
+    import Mojibot
+    logging.disable(logging.WARNING)
+    Mojibot.container.setup_schema()
+
+    tips = []
+    tipping_service = SimpleNamespace(send_tip=lambda sender, recipient, amount, chat_id=None: tips.append(recipient) or "ok")
+    system = Mojibot.EmojiTippingSystem(tipping_service)
+    updates = [fake_update(chat_id, text) for chat_id, text in corpus(args.messages, args.groups)]
+
+    measure('uncached', lambda update: uncached_process(Mojibot, tipping_service, update), updates)
+    measure('cached', lambda update: system.process_emoji_tip(update, None), updates)
+    print(f"{len(tips) // 2} tips parsed per pass")
+
+
+if __name__ == '__main__':
+    main()
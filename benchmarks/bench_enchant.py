@@ -0,0 +1,67 @@
+# Simulates an airdrop burst: many new users run /enchant at once. Compares wallet
+# creation latency when every request generates and encrypts its own key with the
+# same burst served from a pre-filled key pool.
+#
+#   python benchmarks/bench_enchant.py --users 1000 --workers 8
+import argparse
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from stubs import StubServer, configure_environment, percentiles
+
+
+def burst(Mojibot, wallet_service, first_user: int, users: int, workers: int) -> tuple:
+    latencies = []
+
+    def enchant(user_id):
+        started = time.perf_counter()
+        try:
+            return wallet_service.create_wallet(user_id)
+        finally:
+            Mojibot.db_session.remove()
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        wallets = list(executor.map(enchant, range(first_user, first_user + users)))
+    return time.perf_counter() - started, latencies, wallets
+
+
+def report(name: str, elapsed: float, latencies: list) -> None:
+    stats = percentiles(latencies)
+    print(f"{name:>7}: {len(latencies) / elapsed:8.1f} wallets/s  "
+          + "  ".join(f"{key}={value * 1000:.1f}ms" for key, value in stats.items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Wallet creation latency under an /enchant burst")
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--workers', type=int, default=8, help="concurrent handler threads")
+    parser.add_argument('--database-url', help="defaults to a temporary SQLite file")
+    args = parser.parse_args()
+
+    configure_environment(StubServer(latency=0).start(), args.database_url)
+    import Mojibot
+    logging.disable(logging.WARNING)
+    Mojibot.container.setup_schema()
+
+    wallet_service = Mojibot.WalletService(key_pool=Mojibot.KeyPool(target=0))
+    report('inline', *burst(Mojibot, wallet_service, 1, args.users, args.workers)[:2])
+
+    pool = Mojibot.KeyPool(target=args.users)
+    session = Mojibot.container.session_factory()
+    started = time.perf_counter()
+    pool.refill(session)
+    print(f"   pool: {pool.size(session)} keys generated in {time.perf_counter() - started:.1f}s (off the request path)")
+    session.close()
+
+    wallet_service = Mojibot.WalletService(key_pool=pool)
+    elapsed, latencies, wallets = burst(Mojibot, wallet_service, args.users + 1, args.users, args.workers)
+    report('pooled', elapsed, latencies)
+    addresses = [wallet['address'] for wallet in wallets]
+    assert len(set(addresses)) == len(addresses), "a pooled key was handed out twice"
+
+
+if __name__ == '__main__':
+    main()
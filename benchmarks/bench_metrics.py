@@ -0,0 +1,52 @@
+# Cost of the instrumentation itself: a timed no-op call with and without a sampled
+# trace open, and how long a /metrics scrape takes to render with many series.
+#
+#   python benchmarks/bench_metrics.py --calls 200000
+import argparse
+import logging
+import time
+
+from stubs import StubServer, configure_environment
+
+
+def per_call(func, calls: int) -> float:
+    started = time.perf_counter()
+    for _ in range(calls):
+        func()
+    return (time.perf_counter() - started) / calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Metrics and tracing overhead")
+    parser.add_argument('--calls', type=int, default=200000)
+    parser.add_argument('--series', type=int, default=500, help="label combinations in the scrape")
+    args = parser.parse_args()
+
+    configure_environment(StubServer(latency=0).start())
+    import Mojibot
+    logging.disable(logging.WARNING)
+    metrics = Mojibot.Metrics()
+
+    def noop():
+        return None
+
+    timed = metrics.timed('bench', call='noop')(noop)
+    baseline = per_call(noop, args.calls)
+    print(f"   untimed call: {baseline * 1e9:8.0f} ns")
+    print(f"     timed call: {(per_call(timed, args.calls) - baseline) * 1e9:8.0f} ns overhead")
+    print(f"        counter: {per_call(lambda: metrics.inc('bench_total', kind='x'), args.calls) * 1e9:8.0f} ns")
+
+    tracer = Mojibot.Tracer(sample_rate=1.0, keep=10)
+    with tracer.trace('bench'):
+        traced = per_call(timed, min(args.calls, 10000)) - baseline
+    print(f"in sampled trace: {traced * 1e9:8.0f} ns overhead per span")
+
+    for i in range(args.series):
+        metrics.observe('bench_series_seconds', 0.01, handler=f"h{i}")
+    started = time.perf_counter()
+    body = metrics.render()
+    print(f"          scrape: {(time.perf_counter() - started) * 1000:8.1f} ms for {len(body.splitlines())} lines")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+# Sends a burst of buy alerts to many groups plus a stream of interactive replies to a
+# simulated Telegram endpoint that enforces the Bot API flood limits (429 RetryAfter).
+# Sending everything directly from a thread pool, as the bot used to, is compared with
+# the OutboundScheduler: messages lost to 429s, delivered messages per second and how
+# long interactive replies wait behind the broadcast.
+#
+#   python benchmarks/bench_outbound.py --groups 40 --buys 30 --replies 200
+import argparse
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from stubs import StubServer, TOKEN, configure_environment, percentiles
+
+
+def workload(groups: int, buys: int, replies: int) -> list:
+    # (delay from start, chat_id, text, kind); replies are spread over the broadcast
+    messages = []
+    for buy in range(buys):
+        for group in range(groups):
+            messages.append((buy * 0.05, -1000 - group, f"🎉 New Moji Purchase! #{buy}", 'alert'))
+    span = buys * 0.05 + 5
+    for reply in range(replies):
+        messages.append((reply * span / replies, 1 + reply % 50, f"reply {reply}", 'reply'))
+    return sorted(messages, key=lambda message: message[0])
+
+
+def replay(messages: list, send) -> float:
+    # Returns the start time
+    started = time.perf_counter()
+    for delay, chat_id, text, kind in messages:
+        wait = started + delay - time.perf_counter()
+        if wait > 0:
+            time.sleep(wait)
+        send(chat_id, text, kind)
+    return started
+
+
+def report(name: str, stub: StubServer, started_at: dict, elapsed: float) -> None:
+    delivered = stub.messages
+    latencies = [received - started_at[text] for _, text, received in delivered if text in started_at]
+    stats = percentiles(latencies)
+    print(f"{name:>9}: {len(delivered):5d} delivered  {stub.flood_rejections:5d} x 429  "
+          f"{len(delivered) / elapsed:6.1f} msgs/s  "
+          + "  ".join(f"reply {key}={value:.2f}s" for key, value in stats.items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Outbound message throughput under Telegram flood limits")
+    parser.add_argument('--groups', type=int, default=40)
+    parser.add_argument('--buys', type=int, default=30)
+    parser.add_argument('--replies', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.05)
+    args = parser.parse_args()
+
+    stub = StubServer(latency=args.latency, flood_limits=True).start()
+    configure_environment(stub)
+    import Mojibot
+    from telegram import Bot
+    logging.disable(logging.CRITICAL)
+    messages = workload(args.groups, args.buys, args.replies)
+    bot = Bot(TOKEN, base_url=f"{stub.url}/bot")
+
+    # Direct: every message is sent at once; a 429 means the message is lost
+    started_at = {}
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        def send(chat_id, text, kind):
+            started_at[text] = time.monotonic()
+            executor.submit(lambda: bot.send_message(chat_id=chat_id, text=text))
+        started = replay(messages, send)
+    report('direct', stub, started_at, time.perf_counter() - started)
+
+    # A fresh endpoint, so the scheduler starts with full flood allowances too
+    stub = StubServer(latency=args.latency, flood_limits=True).start()
+    started_at = {}
+    scheduler = Mojibot.OutboundScheduler(Bot(TOKEN, base_url=f"{stub.url}/bot"))
+    scheduler.start()
+    scheduled = Mojibot.ScheduledBot(TOKEN, base_url=f"{stub.url}/bot", scheduler=scheduler)
+
+    def send(chat_id, text, kind):
+        started_at[text] = time.monotonic()
+        if kind == 'alert':
+            scheduled.send_message(chat_id=chat_id, text=text, priority=scheduler.BROADCAST, merge_key='buy_alert')
+        else:
+            scheduled.send_message(chat_id=chat_id, text=text)
+
+    started = replay(messages, send)
+    stats = scheduler.stats()
+    while stats['queued'] > stats['sent'] + stats['merged'] + stats['dropped']:
+        time.sleep(0.05)
+        stats = scheduler.stats()
+    report('scheduled', stub, started_at, time.perf_counter() - started)
+    print("           " + "  ".join(f"{key}={value}" for key, value in stats.items()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+# Concurrent token balance reads, the way the handler threads issue them, against
+# several stubbed JSON-RPC endpoints with different latencies. Compares web3's
+# HTTPProvider pointed at the first endpoint (BLOCKCHAIN_RPC_URL) with the routed RPC client, then takes the
+# fastest endpoint down halfway through a run to show reads fail over without errors.
+#
+#   python benchmarks/bench_rpc.py --reads 2000 --threads 32 --latencies 0.06,0.03,0.12
+import argparse
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from stubs import StubServer, configure_environment, percentiles
+
+
+
+def addresses(Web3) -> list:
+    return [Web3.toChecksumAddress(f"0x{i:040x}") for i in range(1, 201)]
+
+
+def run(name: str, read, targets: list, reads: int, threads: int, during=None) -> None:
+    latencies = []
+    errors = []
+
+    def one(i):
+        started = time.perf_counter()
+        try:
+            read(targets[i % len(targets)])
+        except Exception as e:
+            errors.append(e)
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        futures = [executor.submit(one, i) for i in range(reads)]
+        if during:
+            during()
+        for future in futures:
+            future.result()
+    elapsed = time.perf_counter() - started
+    stats = percentiles(latencies)
+    print(f"{name:>10}: {reads / elapsed:8.1f} reads/s  errors={len(errors)}  "
+          + "  ".join(f"{key}={value * 1000:.0f}ms" for key, value in stats.items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Balance reads through a single provider vs the routed RPC client")
+    parser.add_argument('--reads', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--latencies', default='0.06,0.03,0.12', help="comma-separated latency of each stubbed endpoint")
+    args = parser.parse_args()
+
+    stubs = [StubServer(latency=float(latency)).start() for latency in args.latencies.split(',')]
+    configure_environment(stubs[0])
+    os.environ['BLOCKCHAIN_RPC_URLS'] = ','.join(f"{stub.url}/rpc" for stub in stubs)
+    os.environ['RPC_HEALTH_INTERVAL'] = '1'
+    os.environ['RPC_CIRCUIT_RESET'] = '2'
+    import Mojibot
+    from web3 import Web3
+    logging.disable(logging.WARNING)
+    targets = addresses(Web3)
+
+    def counted(stubs_run):
+        before = [(stub.rpc_requests, stub.rpc_calls) for stub in stubs]
+        stubs_run()
+        for stub, (requests_before, calls_before) in zip(stubs, before):
+            print(f"            {stub.url} (+{stub.latency * 1000:.0f}ms): "
+                  f"{stub.rpc_requests - requests_before} requests, {stub.rpc_calls - calls_before} calls")
+
+    # The provider as it was: one HTTP request per call to the one configured endpoint
+    single = Web3(Web3.HTTPProvider(f"{stubs[0].url}/rpc"))
+    contract = single.eth.contract(address=Mojibot.MOJI_CONTRACT_ADDRESS, abi=Mojibot.MOJI_CONTRACT_ABI)
+    counted(lambda: run('single', lambda address: contract.functions.balanceOf(address).call(), targets, args.reads, args.threads))
+
+    read = lambda address: Mojibot.container.moji_contract.functions.balanceOf(address).call()
+    Mojibot.container.rpc_client.call('eth_blockNumber')  # starts the senders and takes first latency samples
+    time.sleep(1.5)
+    counted(lambda: run('routed', read, targets, args.reads, args.threads))
+
+    fastest = min(stubs, key=lambda stub: stub.latency)
+
+    def outage():
+        time.sleep(0.2)
+        fastest.rpc_down = True
+
+    counted(lambda: run('failover', read, targets, args.reads, args.threads, during=outage))
+    print("  client: " + str(Mojibot.container.rpc_client.stats()))
+
+
+if __name__ == '__main__':
+    main()
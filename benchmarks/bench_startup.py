@@ -0,0 +1,76 @@
+# Start-to-first-update time of a bot worker, the downtime each process adds to a
+# rolling restart. Starts `python Mojibot.py` (threaded mode) against local stubs with
+# one update waiting in getUpdates, and reports when it began polling and when the
+# reply to that update reached the stubbed Telegram API, both measured from the spawn.
+# Schema setup is timed separately, as the one-off deploy step it is.
+#
+#   python benchmarks/bench_startup.py --runs 5 --commands /help,/price
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+from stubs import StubServer, configure_environment, command_update, percentiles
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MOJIBOT = os.path.join(ROOT, 'Mojibot.py')
+PAIR = '0xB4e16d0168e52d35CaCD2c6185b44281Ec28C9Dc'
+
+
+def timed_run(argv: list, env: dict) -> float:
+    started = time.monotonic()
+    subprocess.run(argv, env=env, cwd=ROOT, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.monotonic() - started
+
+
+def start_once(stub: StubServer, env: dict, command: str, update_id: int, timeout: float) -> tuple:
+    baseline = len(stub.messages)
+    stub.updates = [command_update(update_id, 1000 + update_id, 1000 + update_id, command)]
+    stub.first_poll = None
+    started = time.monotonic()
+    process = subprocess.Popen([sys.executable, MOJIBOT], env=env, cwd=ROOT,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while len(stub.messages) == baseline:
+            if time.monotonic() - started > timeout:
+                raise RuntimeError(f"no reply to {command} within {timeout}s")
+            time.sleep(0.005)
+        # Both clocks are CLOCK_MONOTONIC, so times taken in the stub compare with ours
+        return stub.first_poll - started, stub.messages[baseline][2] - started
+    finally:
+        process.kill()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bot worker start-to-first-update time")
+    parser.add_argument('--runs', type=int, default=5, help="starts per command")
+    parser.add_argument('--commands', default='/help,/price', help="comma-separated first update of each start")
+    parser.add_argument('--latency', type=float, default=0.02, help="seconds each stubbed upstream call takes")
+    parser.add_argument('--timeout', type=float, default=60)
+    args = parser.parse_args()
+
+    stub = StubServer(latency=args.latency).start()
+    configure_environment(stub)
+    env = dict(os.environ, BOT_EXECUTION_MODE='threaded',
+               KEY_POOL_TARGET='0',  # the refill worker is its own process and not on this path
+               MOJI_PAIR_ADDRESS=PAIR)  # builds the buy watcher, and with it web3, as production does
+
+    print(f"      import: {timed_run([sys.executable, '-c', 'import Mojibot'], env):6.2f}s (python start and import only)")
+    print(f"     migrate: {timed_run([sys.executable, MOJIBOT, 'migrate'], env):6.2f}s (fresh database, once per deploy)")
+
+    update_id = 1
+    for command in args.commands.split(','):
+        ready, first = [], []
+        for _ in range(args.runs):
+            polling, replied = start_once(stub, env, command, update_id, args.timeout)
+            ready.append(polling)
+            first.append(replied)
+            update_id += 1
+        for name, samples in (('polling', ready), ('first reply', first)):
+            print(f"{command:>6} {name:>11}: " + "  ".join(f"{key}={value:.2f}s" for key, value in percentiles(samples).items()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+# Load generator for webhook mode. Starts the ingress and its shard workers as real
+# processes against the stubbed upstreams and an in-process Redis stand-in (fakeredis),
+# posts an update stream at the ingress the way Telegram would, and reports updates/s
+# until the last reply arrived for each worker count. Each chat's updates are posted in
+# order, and replies are checked to come back in that order.
+#
+#   python benchmarks/bench_webhook.py --workers 1,2,4 --updates 3000 --chats 300
+#   python benchmarks/bench_webhook.py --replay updates.jsonl   # recorded updates, one JSON object per line
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+
+import aiohttp
+from fakeredis import TcpFakeServer
+
+from stubs import StubServer, configure_environment, command_update
+
+COMMANDS = ['/price', '/help', '/chart', '/balance', '/price', '/price']
+MOJIBOT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Mojibot.py')
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def synthetic_stream(count: int, chats: int, seed: int = 5) -> list:
+    rng = random.Random(seed)
+    updates = []
+    for update_id in range(1, count + 1):
+        chat_id = -1000 - rng.randrange(chats)
+        updates.append(command_update(update_id, chat_id, rng.randint(1, 5000), rng.choice(COMMANDS), 'supergroup'))
+    return updates
+
+
+async def post_stream(url: str, updates: list, concurrency: int) -> None:
+    # One sender per chat posts that chat's updates in order; chats run concurrently
+    by_chat = defaultdict(list)
+    for update in updates:
+        by_chat[update['message']['chat']['id']].append(update)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with aiohttp.ClientSession() as http:
+        async def send_chat(chat_updates):
+            for update in chat_updates:
+                async with semaphore:
+                    async with http.post(url, json=update) as response:
+                        response.raise_for_status()
+
+        await asyncio.gather(*[send_chat(chat_updates) for chat_updates in by_chat.values()])
+
+
+def wait_for_replies(stub: StubServer, baseline: int, expected: int, idle: float) -> float:
+    # Done once every expected reply arrived, or when replies stop coming for `idle` seconds
+    last_count, last_change = len(stub.messages), time.monotonic()
+    while len(stub.messages) - baseline < expected:
+        time.sleep(0.05)
+        if len(stub.messages) != last_count:
+            last_count, last_change = len(stub.messages), time.monotonic()
+        elif time.monotonic() - last_change > idle:
+            break
+    return stub.messages[-1][2] if len(stub.messages) > baseline else time.monotonic()
+
+
+def out_of_order(replies: list) -> int:
+    last = {}
+    count = 0
+    for chat_id, message_id in replies:
+        if message_id < last.get(chat_id, 0):
+            count += 1
+        last[chat_id] = message_id
+    return count
+
+
+def run(workers: int, updates: list, stub: StubServer, redis_port: int, concurrency: int, idle: float) -> None:
+    port = free_port()
+    env = dict(os.environ, BOT_EXECUTION_MODE='webhook', WEBHOOK_LISTEN='127.0.0.1', WEBHOOK_PORT=str(port),
+               SHARD_WORKERS=str(workers), REDIS_HOST='127.0.0.1', REDIS_PORT=str(redis_port))
+    env.pop('WEBHOOK_URL', None)
+    process = subprocess.Popen([sys.executable, MOJIBOT], env=env, start_new_session=True,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}/telegram"
+    try:
+        # Warm-up: one update per shard, so every worker is up before timing starts
+        warmup = [command_update(10**9 + shard, -shard - workers * 10**6, 1, '/help', 'supergroup') for shard in range(workers)]
+        for _ in range(600):
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                break
+            except OSError:
+                time.sleep(0.1)
+        baseline = len(stub.messages)
+        asyncio.run(post_stream(url, warmup, concurrency))
+        wait_for_replies(stub, baseline, len(warmup), idle=60)
+
+        baseline, replies_baseline = len(stub.messages), len(stub.replies)
+        started = time.monotonic()
+        asyncio.run(post_stream(url, updates, concurrency))
+        posted = time.monotonic() - started
+        finished = wait_for_replies(stub, baseline, len(updates), idle)
+        elapsed = finished - started
+        replies = len(stub.messages) - baseline
+        print(f"{workers:>2} workers: {len(updates) / elapsed:8.1f} updates/s  accepted in {posted:.1f}s  "
+              f"{replies}/{len(updates)} replies  {out_of_order(stub.replies[replies_baseline:])} out of order")
+    finally:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Webhook ingress throughput by shard worker count")
+    parser.add_argument('--workers', default='1,2,4', help="comma-separated SHARD_WORKERS values to compare")
+    parser.add_argument('--updates', type=int, default=3000)
+    parser.add_argument('--chats', type=int, default=300)
+    parser.add_argument('--latency', type=float, default=0.05, help="seconds each stubbed upstream call takes")
+    parser.add_argument('--concurrency', type=int, default=64, help="webhook requests in flight (Telegram uses up to 100)")
+    parser.add_argument('--lanes', type=int, default=4, help="SHARD_LANES per worker")
+    parser.add_argument('--replay', help="JSON lines file of recorded updates to post instead of the synthetic stream")
+    parser.add_argument('--save', help="write the synthetic stream to this file for later replays")
+    parser.add_argument('--idle', type=float, default=5, help="stop waiting after this many seconds without a reply")
+    args = parser.parse_args()
+
+    stub = StubServer(latency=args.latency).start()
+    configure_environment(stub)
+    redis_port = free_port()
+    redis_server = TcpFakeServer(('127.0.0.1', redis_port))
+    threading.Thread(target=redis_server.serve_forever, name='fake-redis', daemon=True).start()
+    os.environ.update({
+        'KEY_POOL_TARGET': '0',
+        'SHARD_LANES': str(args.lanes),
+        # Replies are only limited by the stub's latency, not by the outbound flood limits
+        'TELEGRAM_GLOBAL_RATE': '100000',
+        'TELEGRAM_CHAT_INTERVAL': '0',
+        'TELEGRAM_GROUP_INTERVAL': '0',
+    })
+    # Creates the schema once, before the worker processes open the database
+    import Mojibot
+    logging.disable(logging.WARNING)
+    Mojibot.container.setup_schema()
+
+    if args.replay:
+        with open(args.replay) as lines:
+            updates = [json.loads(line) for line in lines if line.strip()]
+    else:
+        updates = synthetic_stream(args.updates, args.chats)
+        if args.save:
+            with open(args.save, 'w') as out:
+                out.writelines(json.dumps(update) + '\n' for update in updates)
+
+    print(f"{len(updates)} updates, {os.cpu_count()} CPUs")
+    for workers in [int(count) for count in args.workers.split(',')]:
+        run(workers, updates, stub, redis_port, args.concurrency, args.idle)
+
+
+if __name__ == '__main__':
+    main()
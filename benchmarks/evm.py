@@ -0,0 +1,213 @@
+# In-memory stand-in for an EVM node holding one ERC-20 token, in the spirit of an
+# instant-mining dev chain (anvil, eth-tester). It accepts the bot's signed legacy
+# transactions, keeps per-sender nonces (future nonces wait until the gap is filled,
+# as in a node's queue), executes token transfers and serves the JSON-RPC reads the
+# bot makes: balances, supply, nonces, transactions, receipts and Transfer logs.
+import threading
+
+import rlp
+from eth_account import Account
+from eth_account._utils.legacy_transactions import Transaction
+from eth_utils import keccak, to_checksum_address
+
+TRANSFER_TOPIC = '0x' + keccak(text='Transfer(address,address,uint256)').hex()
+SELECTORS = {
+    'transfer': keccak(text='transfer(address,uint256)')[:4].hex(),
+    'balanceOf': keccak(text='balanceOf(address)')[:4].hex(),
+    'totalSupply': keccak(text='totalSupply()')[:4].hex(),
+}
+
+
+def word(value: int) -> str:
+    return format(value, '064x')
+
+
+class RPCError(Exception):
+    def __init__(self, message: str, code: int = -32000):
+        super().__init__(message)
+        self.code = code
+
+
+class LocalChain:
+    def __init__(self, token_address: str, chain_id: int = 1, gas_price: int = 10**9):
+        self.token = token_address.lower()
+        self.chain_id = chain_id
+        self.gas_price = gas_price
+        self.block_number = 1
+        self.balances = {}  # lowercase address -> token units
+        self.total_supply = 0
+        self.nonces = {}  # lowercase sender -> next nonce to mine
+        self.queued = {}  # lowercase sender -> {nonce: transaction} waiting for a gap to fill
+        self.transactions = {}  # hash -> transaction, mined or queued
+        self.receipts = {}  # hash -> receipt
+        self.logs = []  # Transfer logs in block order
+        self.reverted = 0
+        self._lock = threading.Lock()
+
+    def mint(self, address: str, units: int) -> None:
+        with self._lock:
+            address = address.lower()
+            self.balances[address] = self.balances.get(address, 0) + units
+            self.total_supply += units
+
+    def balance_of(self, address: str) -> int:
+        return self.balances.get(address.lower(), 0)
+
+    def handle(self, request: dict) -> dict:
+        try:
+            result = getattr(self, f"_{request['method']}")(*request.get('params', []))
+        except AttributeError:
+            return {'jsonrpc': '2.0', 'id': request['id'], 'error': {'code': -32601, 'message': f"{request['method']} not supported"}}
+        except RPCError as e:
+            return {'jsonrpc': '2.0', 'id': request['id'], 'error': {'code': e.code, 'message': str(e)}}
+        return {'jsonrpc': '2.0', 'id': request['id'], 'result': result}
+
+    # JSON-RPC methods
+
+    def _eth_chainId(self):
+        return hex(self.chain_id)
+
+    def _net_version(self):
+        return str(self.chain_id)
+
+    def _eth_gasPrice(self):
+        return hex(self.gas_price)
+
+    def _eth_blockNumber(self):
+        return hex(self.block_number)
+
+    def _eth_getTransactionCount(self, address, block='latest'):
+        return hex(self.nonces.get(address.lower(), 0))
+
+    def _eth_call(self, call, block='latest'):
+        data = call.get('data') or call.get('input') or '0x'
+        selector = data[2:10]
+        if call.get('to', '').lower() != self.token:
+            return '0x'
+        if selector == SELECTORS['balanceOf']:
+            return '0x' + word(self.balance_of('0x' + data[-40:]))
+        if selector == SELECTORS['totalSupply']:
+            return '0x' + word(self.total_supply)
+        raise RPCError('execution reverted')
+
+    def _eth_sendRawTransaction(self, raw: str):
+        payload = bytes.fromhex(raw[2:] if raw.startswith('0x') else raw)
+        tx_hash = '0x' + keccak(payload).hex()
+        fields = rlp.decode(payload, Transaction)
+        sender = Account.recover_transaction(payload).lower()
+        with self._lock:
+            if tx_hash in self.transactions:
+                raise RPCError('already known')
+            expected = self.nonces.get(sender, 0)
+            if fields.nonce < expected:
+                raise RPCError('nonce too low')
+            transaction = {
+                'hash': tx_hash,
+                'from': sender,
+                'to': '0x' + fields.to.hex(),
+                'nonce': fields.nonce,
+                'gas': fields.gas,
+                'gasPrice': fields.gasPrice,
+                'value': fields.value,
+                'input': '0x' + fields.data.hex(),
+                'blockNumber': None,
+            }
+            self.transactions[tx_hash] = transaction
+            self.queued.setdefault(sender, {})[fields.nonce] = transaction
+            self._mine_ready(sender)
+        return tx_hash
+
+    def _eth_getTransactionByHash(self, tx_hash):
+        transaction = self.transactions.get(tx_hash)
+        if transaction is None:
+            return None
+        block = transaction['blockNumber']
+        return {
+            'hash': transaction['hash'],
+            'from': to_checksum_address(transaction['from']),
+            'to': to_checksum_address(transaction['to']),
+            'nonce': hex(transaction['nonce']),
+            'gas': hex(transaction['gas']),
+            'gasPrice': hex(transaction['gasPrice']),
+            'value': hex(transaction['value']),
+            'input': transaction['input'],
+            'blockNumber': hex(block) if block is not None else None,
+            'blockHash': self._block_hash(block) if block is not None else None,
+            'transactionIndex': '0x0' if block is not None else None,
+        }
+
+    def _eth_getTransactionReceipt(self, tx_hash):
+        return self.receipts.get(tx_hash)
+
+    def _eth_getLogs(self, query):
+        start = self._block(query.get('fromBlock', 'latest'))
+        end = self._block(query.get('toBlock', 'latest'))
+        address = query.get('address')
+        addresses = {a.lower() for a in ([address] if isinstance(address, str) else address or [])}
+        topics = query.get('topics') or []
+        return [log for log in self.logs
+                if start <= int(log['blockNumber'], 16) <= end
+                and (not addresses or log['address'].lower() in addresses)
+                and (not topics or not topics[0] or log['topics'][0] == topics[0])]
+
+    # Mining
+
+    def _mine_ready(self, sender: str) -> None:
+        queue = self.queued[sender]
+        while self.nonces.get(sender, 0) in queue:
+            transaction = queue.pop(self.nonces.get(sender, 0))
+            self.nonces[sender] = transaction['nonce'] + 1
+            self.block_number += 1
+            transaction['blockNumber'] = self.block_number
+            self._execute(transaction)
+
+    def _execute(self, transaction: dict) -> None:
+        logs = []
+        status = 1
+        data = transaction['input'][2:]
+        if transaction['to'].lower() == self.token and data[:8] == SELECTORS['transfer']:
+            recipient = '0x' + data[8 + 24:8 + 64]
+            value = int(data[8 + 64:8 + 128], 16)
+            if self.balances.get(transaction['from'], 0) < value:
+                status = 0
+                self.reverted += 1
+            else:
+                self.balances[transaction['from']] -= value
+                self.balances[recipient] = self.balances.get(recipient, 0) + value
+                logs.append({
+                    'address': to_checksum_address(self.token),
+                    'topics': [TRANSFER_TOPIC, '0x' + word(int(transaction['from'], 16)), '0x' + word(int(recipient, 16))],
+                    'data': '0x' + word(value),
+                    'blockNumber': hex(transaction['blockNumber']),
+                    'blockHash': self._block_hash(transaction['blockNumber']),
+                    'transactionHash': transaction['hash'],
+                    'transactionIndex': '0x0',
+                    'logIndex': '0x0',
+                    'removed': False,
+                })
+        self.logs.extend(logs)
+        self.receipts[transaction['hash']] = {
+            'transactionHash': transaction['hash'],
+            'transactionIndex': '0x0',
+            'blockNumber': hex(transaction['blockNumber']),
+            'blockHash': self._block_hash(transaction['blockNumber']),
+            'from': to_checksum_address(transaction['from']),
+            'to': to_checksum_address(transaction['to']),
+            'gasUsed': hex(51000),
+            'cumulativeGasUsed': hex(51000),
+            'contractAddress': None,
+            'logs': logs,
+            'logsBloom': '0x' + '00' * 256,
+            'status': hex(status),
+        }
+
+    def _block(self, tag) -> int:
+        if tag in ('latest', 'pending', 'safe', 'finalized'):
+            return self.block_number
+        if tag == 'earliest':
+            return 0
+        return int(tag, 16) if isinstance(tag, str) else int(tag)
+
+    @staticmethod
+    def _block_hash(number: int) -> str:
+        return '0x' + keccak(number.to_bytes(32, 'big')).hex()
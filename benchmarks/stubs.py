@@ -0,0 +1,247 @@
+# Local stand-ins for the bot's upstreams (price API, JSON-RPC node, Telegram Bot API)
+# so benchmarks can import Mojibot and drive it without touching the network.
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from aiohttp import web
+
+ERC20_ABI = [
+    {"constant": True, "inputs": [], "name": "totalSupply", "outputs": [{"name": "", "type": "uint256"}], "type": "function"},
+    {"constant": True, "inputs": [{"name": "owner", "type": "address"}], "name": "balanceOf", "outputs": [{"name": "", "type": "uint256"}], "type": "function"},
+    {"constant": False, "inputs": [{"name": "to", "type": "address"}, {"name": "value", "type": "uint256"}], "name": "transfer", "outputs": [{"name": "", "type": "bool"}], "type": "function"},
+    {"anonymous": False, "inputs": [
+        {"indexed": True, "name": "from", "type": "address"},
+        {"indexed": True, "name": "to", "type": "address"},
+        {"indexed": False, "name": "value", "type": "uint256"},
+    ], "name": "Transfer", "type": "event"},
+]
+
+TOKEN = '123456:benchmark'
+
+
+# Token bucket on the stub's clock, for the simulated Telegram flood limits
+class Bucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.tokens = burst
+        self.burst = burst
+        self.updated_at = time.monotonic()
+
+    def take(self) -> float:
+        # Returns 0 when a token was taken, otherwise the seconds until one is available
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+class StubServer:
+    # Roughly the Bot API limits: 30 messages/s overall, about one per second in a
+    # private chat and 20 per minute in a group, with a little burst allowance
+    GLOBAL_LIMIT = (30, 30)
+    PRIVATE_CHAT_LIMIT = (1, 3)
+    GROUP_LIMIT = (20 / 60, 20)
+
+    # With a chain (benchmarks/evm.py LocalChain), JSON-RPC is served by it instead of
+    # the fixed answers below
+    def __init__(self, latency: float = 0.05, port: int = 0, flood_limits: bool = False, chain=None):
+        self.latency = latency
+        self.chain = chain
+        self.port = port
+        self.flood_limits = flood_limits
+        self.requests = 0
+        self.completions = 0
+        self.messages = []  # (chat_id, text, received at) of delivered sendMessage calls
+        self.replies = []  # (chat_id, reply_to_message_id) of delivered sendMessage calls that quote a message
+        self.flood_rejections = 0
+        self.rpc_requests = 0  # HTTP requests to /rpc
+        self.rpc_calls = 0  # JSON-RPC calls in them, batches counting each entry
+        self.rpc_down = False  # answer /rpc with 503, as an endpoint in an outage would
+        self.updates = []  # served to getUpdates polling, by offset
+        self.first_poll = None  # when getUpdates was first called
+        self._global_bucket = Bucket(*self.GLOBAL_LIMIT)
+        self._chat_buckets = {}
+        self._loop = asyncio.new_event_loop()
+        self._started = threading.Event()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def start(self) -> 'StubServer':
+        threading.Thread(target=self._serve, name='stub-server', daemon=True).start()
+        self._started.wait()
+        return self
+
+    def _serve(self) -> None:
+        asyncio.set_event_loop(self._loop)
+        app = web.Application()
+        app.router.add_get('/price', self._price)
+        app.router.add_post('/rpc', self._rpc)
+        app.router.add_post('/bot{token}/{method}', self._telegram)
+        app.router.add_post('/v1/completions', self._completion)
+        runner = web.AppRunner(app, access_log=None)
+        self._loop.run_until_complete(runner.setup())
+        site = web.TCPSite(runner, '127.0.0.1', self.port, backlog=4096)
+        self._loop.run_until_complete(site.start())
+        self.port = site._server.sockets[0].getsockname()[1]
+        self._started.set()
+        self._loop.run_forever()
+
+    async def _delay(self) -> None:
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    async def _price(self, request):
+        await self._delay()
+        return web.json_response({'price': '0.012345'})
+
+    async def _rpc(self, request):
+        await self._delay()
+        if self.rpc_down:
+            return web.Response(status=503, text='node unavailable')
+        body = await request.json()
+        self.rpc_requests += 1
+        if isinstance(body, list):
+            self.rpc_calls += len(body)
+            return web.json_response([self.rpc_result(item) for item in body])
+        self.rpc_calls += 1
+        return web.json_response(self.rpc_result(body))
+
+    def rpc_result(self, request: dict) -> dict:
+        if self.chain is not None:
+            return self.chain.handle(request)
+        method = request['method']
+        if method == 'eth_call':
+            result = '0x' + format(10**15, '064x')
+        elif method in ('eth_chainId', 'net_version'):
+            result = '0x1'
+        elif method in ('eth_gasPrice', 'eth_blockNumber'):
+            result = hex(10**9)
+        elif method == 'eth_getTransactionCount':
+            result = '0x0'
+        elif method == 'eth_sendRawTransaction':
+            result = '0x' + '11' * 32
+        elif method == 'eth_getTransactionReceipt':
+            result = {'transactionHash': request['params'][0], 'blockNumber': '0x1', 'status': '0x1'}
+        else:
+            return {'jsonrpc': '2.0', 'id': request['id'], 'error': {'code': -32601, 'message': f"{method} not stubbed"}}
+        return {'jsonrpc': '2.0', 'id': request['id'], 'result': result}
+
+    async def _completion(self, request):
+        await self._delay()
+        self.completions += 1
+        body = await request.json()
+        return web.json_response({
+            'object': 'text_completion',
+            'model': body.get('model'),
+            'choices': [{'index': 0, 'text': " That command is a mystery to me. Try /help!", 'finish_reason': 'stop'}],
+            'usage': {'prompt_tokens': 20, 'completion_tokens': 12, 'total_tokens': 32},
+        })
+
+    async def _telegram(self, request):
+        await self._delay()
+        try:
+            params = await request.json()
+        except json.JSONDecodeError:
+            params = dict(await request.post())
+        chat_id = int(params.get('chat_id', 0))
+        if request.match_info['method'] == 'sendMessage':
+            retry_after = self._flood_check(chat_id) if self.flood_limits else 0
+            if retry_after:
+                self.flood_rejections += 1
+                return web.json_response({
+                    'ok': False,
+                    'error_code': 429,
+                    'description': f"Too Many Requests: retry after {retry_after}",
+                    'parameters': {'retry_after': retry_after},
+                }, status=429)
+            self.messages.append((chat_id, params.get('text', ''), time.monotonic()))
+            if params.get('reply_to_message_id'):
+                self.replies.append((chat_id, int(params['reply_to_message_id'])))
+        if request.match_info['method'] == 'getMe':
+            return web.json_response({'ok': True, 'result': {'id': 123456, 'is_bot': True, 'first_name': 'Moji', 'username': 'moji_bot'}})
+        if request.match_info['method'] == 'deleteWebhook':
+            return web.json_response({'ok': True, 'result': True})
+        if request.match_info['method'] == 'getUpdates':
+            return web.json_response({'ok': True, 'result': await self._poll(params)})
+        message = {
+            'message_id': self.requests,
+            'date': 0,
+            'chat': {'id': chat_id, 'type': 'private'},
+            'text': params.get('text', ''),
+        }
+        return web.json_response({'ok': True, 'result': message})
+
+    async def _poll(self, params: dict) -> list:
+        self.first_poll = self.first_poll or time.monotonic()
+        offset = int(params.get('offset') or 0)
+        pending = [update for update in self.updates if update['update_id'] >= offset]
+        if not pending:
+            await asyncio.sleep(min(float(params.get('timeout') or 0), 0.1))  # a short long poll
+        return pending
+
+    def _flood_check(self, chat_id: int) -> int:
+        if chat_id not in self._chat_buckets:
+            self._chat_buckets[chat_id] = Bucket(*(self.GROUP_LIMIT if chat_id < 0 else self.PRIVATE_CHAT_LIMIT))
+        chat_bucket = self._chat_buckets[chat_id]
+        wait = chat_bucket.take()
+        if not wait:
+            wait = self._global_bucket.take()
+            if wait:
+                chat_bucket.tokens += 1  # rejected messages do not count against the chat
+        return int(wait) + 1 if wait else 0
+
+
+def configure_environment(stub: StubServer, database_url: str = None) -> None:
+    # Must run before Mojibot is imported: it reads its configuration at import time
+    from cryptography.fernet import Fernet
+
+    if not database_url:
+        database_url = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='mojibot-bench-'), 'bench.db')}"
+    os.environ.update({
+        'DATABASE_URL': database_url,
+        'REDIS_HOST': '',
+        'REDIS_PORT': '6379',
+        'BLOCKCHAIN_RPC_URL': f"{stub.url}/rpc",
+        'PRICE_API_URL': f"{stub.url}/price",
+        'TELEGRAM_API_URL': stub.url,
+        'TELEGRAM_BOT_TOKEN': TOKEN,
+        'ENCRYPTION_KEY': Fernet.generate_key().decode(),
+        'MOJI_CONTRACT_ADDRESS': '0x5FbDB2315678afecb367f032d93F642f64180aa3',
+        'MOJI_CONTRACT_ABI': json.dumps(ERC20_ABI),
+        'TOGETHER_AI_API_KEY': 'benchmark',
+        'AI_API_BASE': f"{stub.url}/v1",
+    })
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def command_update(update_id: int, chat_id: int, user_id: int, text: str, chat_type: str = 'private') -> dict:
+    command_length = len(text.split()[0]) if text.startswith('/') else 0
+    message = {
+        'message_id': update_id,
+        'date': 0,
+        'chat': {'id': chat_id, 'type': chat_type},
+        'from': {'id': user_id, 'is_bot': False, 'first_name': f"user{user_id}", 'username': f"user{user_id}"},
+        'text': text,
+    }
+    if command_length:
+        message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': command_length}]
+    return {'update_id': update_id, 'message': message}
+
+
+def percentiles(samples: list) -> dict:
+    ordered = sorted(samples)
+    if not ordered:
+        return {}
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+    return {'p50': pick(0.50), 'p90': pick(0.90), 'p99': pick(0.99), 'max': ordered[-1]}